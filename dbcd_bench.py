@@ -0,0 +1,219 @@
+"""Замеры производительности чтения, сохранения, поиска и заполнения модели таблицы
+
+Файлы создаются генератором dbcd_synth во временном каталоге, результаты пишутся в JSON.
+Сохранённый JSON служит базовой линией: с ним сравниваются замеры после изменений.
+
+Запуск:
+    python dbcd_bench.py --output baseline.json
+    python dbcd_bench.py --sizes 10000,100000 --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import dbcd_numpy
+import dbcd_synth
+from dbcd_search import SearchIndex
+from dbcd_stats import peak_memory
+from dbcd_wrapper import DBCDWrapper
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+FORMATS = ('.db2', '.dbc')
+
+# Замедление сверх этой доли при сравнении с базовой линией считается регрессией
+REGRESSION_THRESHOLD = 0.10
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _best(repeat, function):
+    """Лучшее время из repeat запусков и результат последнего запуска"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        seconds, result = function()
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def _model_class():
+    """Модель таблицы записей из main.py или None, если PySide6 не установлен"""
+    try:
+        from PySide6.QtCore import QCoreApplication
+        from main import RecordTableModel
+    except ImportError:
+        return None
+    if QCoreApplication.instance() is None:
+        _model_class.app = QCoreApplication([])
+    return RecordTableModel
+
+
+def _populate_model(model_class, dbcd, rows=100):
+    """Заполняет модель и запрашивает значения первых строк, как при показе таблицы"""
+    model = model_class()
+    model.set_records(dbcd, dbcd.records)
+    for row in range(min(rows, model.rowCount())):
+        for col in range(model.columnCount()):
+            model.data(model.index(row, col))
+    return model
+
+
+def _edit_field(dbcd, compressed):
+    """Номер поля для правки: несжатое (частичная запись) или сжатое (полная перезапись)"""
+    if dbcd.file_type == '.dbc':
+        return None if compressed else 3
+    wanted = ('pallet',) if compressed else ('raw',)
+    for field_idx, (kind, offset, size, payload) in enumerate(dbcd._record_layout[2]):
+        if kind in wanted and field_idx != 0:
+            return field_idx
+    return None
+
+
+def bench_file(path, engine='auto', repeat=1, workdir=None):
+    """Замеры для одного файла: словарь имя замера -> секунды (и сопутствующие счётчики)"""
+    result = {}
+    dbcd = None
+
+    def read():
+        nonlocal dbcd
+        dbcd = DBCDWrapper(path, engine=engine)
+        seconds, status = _timed(dbcd.read_file)
+        if status['status'] != 'success':
+            raise RuntimeError(status['message'])
+        return seconds, status
+
+    result['read_file'], _ = _best(repeat, read)
+    result['phases'] = {name: stats['seconds'] for name, stats in dbcd.stats.as_dict().items()}
+    records = dbcd.records
+
+    result['search_index'], _ = _best(repeat, lambda: _timed(SearchIndex(records).build))
+
+    def search():
+        # Каждый раз новый индекс: повторный запрос к тому же индексу сужает поиск по кешу
+        fresh = SearchIndex(records).build()
+        return _timed(fresh.search, '1234')
+
+    result['search_text'], _ = _best(repeat, search)
+    result['search_query'], rows = _best(repeat, lambda: _timed(dbcd.query_rows, 'field0 between 100 and 5000'))
+    result['query_rows'] = len(rows)
+
+    model_class = _model_class()
+    if model_class is not None:
+        result['model_populate'], _ = _best(repeat, lambda: _timed(_populate_model, model_class, dbcd))
+
+    target = os.path.join(workdir or os.path.dirname(path), 'saved' + os.path.splitext(path)[1])
+    for name, compressed in (('save_patch', False), ('save_full', True)):
+        field_idx = _edit_field(dbcd, compressed)
+        if field_idx is None:
+            continue
+
+        def save():
+            reloaded = DBCDWrapper(path, engine=engine)
+            reloaded.read_file()
+            reloaded.update_record(0, field_idx, reloaded.records.get(1, field_idx))
+            seconds, status = _timed(reloaded.save_file, target, backup=None)
+            if status['status'] != 'success':
+                raise RuntimeError(status['message'])
+            return seconds, status
+
+        result[name], _ = _best(repeat, save)
+    if os.path.exists(target):
+        os.remove(target)
+
+    result['peak_memory'] = peak_memory()
+    return result
+
+
+def run(sizes=DEFAULT_SIZES, formats=FORMATS, engine='auto', repeat=1, seed=0, progress=print):
+    workdir = tempfile.mkdtemp(prefix='dbcd_bench_')
+    results = {}
+    try:
+        for file_format in formats:
+            for size in sizes:
+                name = f"{file_format[1:]}/{size}"
+                path = os.path.join(workdir, f"bench_{size}{file_format}")
+                generate_seconds, _ = _timed(dbcd_synth.write_file, path, size, seed=seed)
+                results[name] = bench_file(path, engine=engine, repeat=repeat, workdir=workdir)
+                results[name]['generate'] = generate_seconds
+                results[name]['file_size'] = os.path.getsize(path)
+                os.remove(path)
+                if progress is not None:
+                    progress(f"{name}: чтение {results[name]['read_file'] * 1000:.1f} мс")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': dbcd_numpy.np.__version__ if dbcd_numpy.HAS_NUMPY else None,
+            'engine': engine,
+            'repeat': repeat,
+            'seed': seed,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Строки отчёта о сравнении замеров; регрессии помечены знаком '!'"""
+    lines = []
+    for name, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(name)
+        if old_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            # Время генерации файла к коду чтения не относится
+            if metric == 'generate' or not isinstance(value, float) or not isinstance(old, float) or old <= 0:
+                continue
+            ratio = value / old
+            mark = '!' if ratio > 1 + threshold else ' '
+            lines.append(f"{mark} {name:>12} {metric:<14} {old * 1000:10.1f} мс -> {value * 1000:10.1f} мс  x{ratio:.2f}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности DBCD Viewer")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="количества записей через запятую")
+    parser.add_argument('--formats', default='db2,dbc', help="форматы файлов через запятую")
+    parser.add_argument('--engine', default='auto', choices=('auto', 'python', 'numpy'))
+    parser.add_argument('--repeat', type=int, default=1, help="число повторов (берётся лучшее время)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="файл JSON для результатов")
+    parser.add_argument('--compare', help="файл JSON с базовой линией для сравнения")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    formats = ['.' + file_format.strip().lstrip('.') for file_format in args.formats.split(',') if file_format]
+    current = run(sizes, formats, engine=args.engine, repeat=max(1, args.repeat), seed=args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"Результаты записаны: {args.output}")
+    else:
+        print(json.dumps(current, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines = compare(baseline, current)
+        print('\n'.join(lines))
+        if any(line.startswith('!') for line in lines):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Кеш декодированных записей на диске
+
+Таблица записей сохраняется столбцами в один файл, который при повторном открытии
+того же исходного файла отображается в память вместо декодирования. Запись кеша
+привязана к пути, размеру, времени изменения и отпечатку содержимого файла,
+а также к layout_hash: при изменении любого из них запись считается устаревшей.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy столбцы читаются из кеша в array
+    np = None
+
+# Версия формата; меняется вместе с форматом файла кеша или с декодированием записей
+CACHE_VERSION = 1
+MAGIC = b'DBCDCAC1'
+ALIGNMENT = 64
+EXTENSION = '.dbcache'
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# Отпечаток содержимого строится по началу и концу файла
+FINGERPRINT_BYTES = 64 * 1024
+
+_HEADER = struct.Struct('<8sI')
+_TYPECODES = {('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q',
+              ('i', 1): 'b', ('i', 2): 'h', ('i', 4): 'i', ('i', 8): 'q'}
+
+
+def default_directory():
+    """Каталог кеша: DBCD_CACHE_DIR или каталог кешей пользователя"""
+    directory = os.environ.get('DBCD_CACHE_DIR')
+    if directory:
+        return directory
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'dbcd-viewer')
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _column_layout(column):
+    """Вид значения столбца: ('u' или 'i', размер элемента) или None для столбца-списка"""
+    if np is not None and isinstance(column, np.ndarray):
+        if column.dtype.kind in 'ui' and column.ndim == 1:
+            return column.dtype.kind, column.dtype.itemsize
+        return None
+    if isinstance(column, array) and column.typecode in 'BHIQbhiq':
+        return ('u' if column.typecode.isupper() else 'i'), column.itemsize
+    return None
+
+
+def _column_bytes(column, kind, itemsize):
+    """Байты столбца в порядке little-endian"""
+    if np is not None and isinstance(column, np.ndarray):
+        return np.ascontiguousarray(column, dtype=np.dtype(f'<{kind}{itemsize}')).tobytes()
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _json_value(value):
+    return list(value) if isinstance(value, tuple) else value
+
+
+def _python_value(value):
+    # Значения полей-массивов хранятся в таблице кортежами
+    return tuple(value) if isinstance(value, list) else value
+
+
+class ParseCache:
+    """Каталог с декодированными таблицами и вытеснением давно не открывавшихся записей"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+
+    def key(self, path, view, layout_hash=0):
+        """Ключ записи кеша для файла, отображённого в view"""
+        stat = os.stat(path)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(view[:FINGERPRINT_BYTES])
+        digest.update(view[max(FINGERPRINT_BYTES, len(view) - FINGERPRINT_BYTES):])
+        return {
+            'version': CACHE_VERSION,
+            'path': os.path.normcase(os.path.abspath(path)),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'fingerprint': digest.hexdigest(),
+            'layout_hash': layout_hash,
+        }
+
+    def _entry_path(self, key):
+        # Имя начинается с хеша пути: устаревшие записи того же файла находятся по префиксу
+        return os.path.join(self.directory,
+                            f"{_hash(key['path'])}-{_hash(json.dumps(key, sort_keys=True))}{EXTENSION}")
+
+    def load(self, key, use_numpy=True):
+        """Столбцы и число записей из кеша или None, если записи нет
+
+        Столбцы NumPy отображаются на файл кеша (копирование при записи), без NumPy
+        значения читаются в array.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, meta_size = _HEADER.unpack_from(buf, 0)
+            if magic != MAGIC:
+                return None
+            meta = json.loads(bytes(buf[_HEADER.size:_HEADER.size + meta_size]).decode('utf-8'))
+            if meta['key'] != key:
+                return None
+            columns = []
+            for column in meta['columns']:
+                if 'values' in column:
+                    columns.append([_python_value(value) for value in column['values']])
+                    continue
+                kind, itemsize, offset, count = column['kind'], column['itemsize'], column['offset'], column['count']
+                if use_numpy and np is not None:
+                    columns.append(np.frombuffer(buf, dtype=np.dtype(f'<{kind}{itemsize}'), count=count, offset=offset))
+                    continue
+                values = array(_TYPECODES[kind, itemsize])
+                if values.itemsize != itemsize:
+                    return None
+                values.frombytes(buf[offset:offset + count * itemsize])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                columns.append(values)
+        except (KeyError, ValueError, struct.error):
+            return None
+        try:
+            # Отмечаем использование записи для вытеснения по давности
+            os.utime(path)
+        except OSError:
+            pass
+        return columns, meta['row_count']
+
+    def store(self, key, columns, row_count):
+        """Сохраняет столбцы таблицы; прежние записи того же файла удаляются"""
+        os.makedirs(self.directory, exist_ok=True)
+        layouts = [_column_layout(column) for column in columns]
+        described = []
+        offset = 0
+        for column, layout in zip(columns, layouts):
+            if layout is None:
+                values = column.tolist() if np is not None and isinstance(column, np.ndarray) else column
+                described.append({'values': [_json_value(value) for value in values]})
+                continue
+            kind, itemsize = layout
+            described.append({'kind': kind, 'itemsize': itemsize, 'offset': offset, 'count': len(column)})
+            offset += -(-len(column) * itemsize // ALIGNMENT) * ALIGNMENT
+
+        # Смещения столбцов отсчитываются от начала файла, а длина метаданных зависит от смещений:
+        # увеличиваем начало данных, пока метаданные в него не поместятся
+        data_start = ALIGNMENT
+        while True:
+            meta = {'key': key, 'row_count': row_count,
+                    'columns': [dict(column, offset=column['offset'] + data_start) if 'offset' in column else column
+                                for column in described]}
+            meta_bytes = json.dumps(meta).encode('utf-8')
+            needed = -(-(_HEADER.size + len(meta_bytes)) // ALIGNMENT) * ALIGNMENT
+            if needed <= data_start:
+                break
+            data_start = needed
+        meta_bytes += b' ' * (data_start - _HEADER.size - len(meta_bytes))
+
+        path = self._entry_path(key)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(meta_bytes)))
+            f.write(meta_bytes)
+            for column, layout in zip(columns, layouts):
+                if layout is None:
+                    continue
+                data = _column_bytes(column, *layout)
+                f.write(data)
+                f.write(bytes(-len(data) % ALIGNMENT))
+        os.replace(temp_path, path)
+        self.invalidate(key['path'], keep=path)
+        self.evict()
+        return path
+
+    def entries(self):
+        """Записи кеша: список (путь, размер, время последнего использования)"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for path, size, used in self.entries())
+
+    def invalidate(self, path=None, keep=None):
+        """Удаляет записи файла path (или все записи) кроме keep"""
+        prefix = _hash(os.path.normcase(os.path.abspath(path))) + '-' if path is not None else ''
+        for entry, size, used in self.entries():
+            if os.path.basename(entry).startswith(prefix) and entry != keep:
+                self._remove(entry)
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока кеш больше max_bytes"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for path, size, used in entries)
+        for path, size, used in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            # Запись может быть отображена в память другим окном (Windows)
+            return False
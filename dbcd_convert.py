@@ -0,0 +1,339 @@
+"""Пакетное преобразование файлов DBC/DB2 в CSV, JSONL или столбцовый формат NumPy (.npz)
+
+Работает без графического интерфейса и без Qt. Файлы обрабатываются параллельно
+в нескольких процессах, для каждого файла сообщается время и ошибка, если она была.
+
+Запуск:
+    python dbcd_convert.py DBFilesClient -o export --format csv
+    python dbcd_convert.py "DBFilesClient/*.db2" -o export --format npz --jobs 4
+"""
+
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import dbcd_numpy
+from dbcd_cache import ParseCache
+from dbcd_wrapper import DBCDWrapper
+
+FORMATS = {
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'npz': '.npz',
+}
+EXTENSIONS = ('.dbc', '.db2')
+
+
+def field_names(field_count):
+    """Имена столбцов в том виде, в котором они пишутся в фильтрах: field0, field1, ..."""
+    return [f"field{i}" for i in range(field_count)]
+
+
+def write_csv(batches, path, field_count):
+    """batches - блоки записей (RecordTable) по порядку, например DBCDWrapper.iter_records()"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(field_names(field_count))
+        # Значения полей-массивов пишутся так же, как их вводят в таблице: (1, 2, 3)
+        for batch in batches:
+            writer.writerows(batch.iter_rows())
+
+
+def write_jsonl(batches, path, field_count):
+    # Строка записи собирается по шаблону: целые подставляются как есть,
+    # значения полей-массивов (столбцы-списки) заранее переводятся в JSON
+    template = '{' + ', '.join(f'"{name}": %s' for name in field_names(field_count)) + '}\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        for batch in batches:
+            columns = []
+            for column in batch.columns:
+                if isinstance(column, list):
+                    column = [json.dumps(value) for value in column]
+                elif not isinstance(column, array):
+                    column = column.tolist()
+                columns.append(column)
+            if columns:
+                f.writelines(template % row for row in zip(*columns))
+            else:
+                f.writelines('{}\n' for _ in range(len(batch)))
+
+
+class _ColumnSpool:
+    """Значения одного поля, дописываемые блоками во временный файл
+
+    Каждый блок пишется в своём типе. Если типы блоков различаются (блоки постраничной
+    таблицы упаковываются по отдельности), итоговый тип выбирается по всем значениям так же,
+    как при упаковке столбца целиком (dbcd_table.make_column), и блоки приводятся к нему
+    при сборке архива.
+    """
+
+    def __init__(self, np, directory):
+        self.np = np
+        self.file = tempfile.TemporaryFile(dir=directory or None)
+        self.segments = []
+        self.tail = None
+        self.rows = 0
+        self.minimum = None
+        self.maximum = None
+
+    def append(self, column):
+        np = self.np
+        try:
+            values = column if isinstance(column, np.ndarray) else np.array(column)
+        except ValueError:  # Элементы поля-массива разной длины
+            values = np.array([str(value) for value in column])
+        if values.dtype.kind == 'O':
+            # Значения, не помещающиеся в 64 бита: сохраняем текстом, чтобы не требовать pickle
+            values = values.astype(str)
+        if self.tail is None:
+            self.tail = values.shape[1:]
+        elif values.shape[1:] != self.tail:
+            raise ValueError(f"Разная длина значений поля-массива: {self.tail} и {values.shape[1:]}")
+        if values.dtype.kind in 'ui' and values.size:
+            minimum, maximum = int(values.min()), int(values.max())
+            self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+            self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+        values = np.ascontiguousarray(values)
+        values.tofile(self.file)
+        self.segments.append((values.dtype, values.size))
+        self.rows += len(values)
+
+    def _read_segments(self):
+        self.file.seek(0)
+        for dtype, size in self.segments:
+            yield self.np.fromfile(self.file, dtype=dtype, count=size)
+
+    def _integer_dtype(self):
+        """Целый тип для всех значений или None, если их нужно сохранить текстом"""
+        np = self.np
+        if self.minimum is None:
+            return np.dtype(np.uint8)
+        if self.tail:
+            # Поля-массивы упаковываются как np.array из кортежей целых
+            candidates = (np.int64, np.uint64)
+        elif self.minimum >= 0:
+            candidates = (np.uint8, np.uint16, np.uint32, np.uint64)
+        else:
+            candidates = (np.int8, np.int16, np.int32, np.int64)
+        for dtype in candidates:
+            info = np.iinfo(dtype)
+            if info.min <= self.minimum and self.maximum <= info.max:
+                return np.dtype(dtype)
+        return None
+
+    def dtype(self):
+        np = self.np
+        if not self.segments:
+            return np.dtype(np.uint8)
+        dtypes = {dtype for dtype, size in self.segments}
+        if len(dtypes) == 1:
+            # Блоки одного столбца таблицы, прочитанной целиком
+            return dtypes.pop()
+        if all(dtype.kind in 'ui' for dtype, size in self.segments):
+            dtype = self._integer_dtype()
+            if dtype is not None:
+                return dtype
+        elif not any(dtype.kind in 'uiU' for dtype, size in self.segments):
+            return np.result_type(*[dtype for dtype, size in self.segments])
+        width = max([1] + [int(np.char.str_len(values.astype(str)).max())
+                           for values in self._read_segments() if values.size])
+        return np.dtype(f'U{width}')
+
+    def write_npy(self, f):
+        """Записывает столбец в формате .npy в открытый файл f"""
+        np = self.np
+        dtype = self.dtype()
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                 'fortran_order': False,
+                                                 'shape': (self.rows,) + (self.tail or ())})
+        for values in self._read_segments():
+            f.write(values.astype(dtype).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def write_npz(batches, path, field_count):
+    """Каждое поле - отдельный массив; поля-массивы сохраняются матрицей записей x элементов
+
+    Блоки записываются по полям во временные файлы и затем собираются в архив .npz
+    без сжатия, так что в памяти держится только текущий блок.
+    """
+    if not dbcd_numpy.HAS_NUMPY:
+        raise RuntimeError("Формат 'npz' недоступен: библиотека NumPy не установлена")
+    np = dbcd_numpy.np
+    spools = [_ColumnSpool(np, os.path.dirname(path)) for _ in range(field_count)]
+    try:
+        for batch in batches:
+            for spool, column in zip(spools, batch.columns):
+                spool.append(column)
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, spool in zip(field_names(field_count), spools):
+                with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                    spool.write_npy(f)
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'npz': write_npz,
+}
+
+
+def convert_file(path, output_path, output_format, engine='auto', cache_dir=None, memory_budget=None,
+                 processes=None):
+    """Читает один файл и записывает его в заданном формате; возвращает словарь с результатом
+
+    Записи декодируются и записываются блоками (DBCDWrapper.iter_records): следующий блок
+    декодируется в фоновом потоке, пока пишется текущий.
+    cache_dir - каталог кеша декодированных записей (None - без кеша),
+    memory_budget - бюджет памяти постраничного чтения в байтах (None - без ограничения),
+    processes - число процессов декодирования таблицы (см. DBCDWrapper).
+    """
+    result = {
+        "status": "error",
+        "file": path,
+        "output": output_path,
+        "records": 0,
+        "read_seconds": 0.0,
+        "write_seconds": 0.0,
+    }
+    try:
+        dbcd = DBCDWrapper(path, engine=engine, cache=ParseCache(cache_dir) if cache_dir else None,
+                           memory_budget=memory_budget, processes=processes)
+        start = time.perf_counter()
+        if cache_dir:
+            # С кешем таблица открывается целиком: отображение кеша в память дешевле декодирования
+            loaded = dbcd.read_file()
+            if loaded['status'] != 'success':
+                result["message"] = loaded['message']
+                return result
+        # Иначе файл открывается постранично, и записи декодируются блоками по мере записи
+        batches = dbcd.iter_records()
+        result["read_seconds"] = time.perf_counter() - start
+        result["records"] = len(dbcd.records)
+
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = output_path + '.tmp'
+        start = time.perf_counter()
+        try:
+            WRITERS[output_format](batches, temp_path, dbcd.records.field_count)
+            os.replace(temp_path, output_path)
+        finally:
+            batches.close()
+            dbcd.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        result["write_seconds"] = time.perf_counter() - start
+        result["status"] = "success"
+        result["message"] = f"Записано записей: {result['records']}"
+    except Exception as e:
+        result["message"] = str(e)
+    return result
+
+
+def find_files(inputs, recursive=False):
+    """Пары (файл, путь относительно каталога ввода) для каталогов, шаблонов и отдельных файлов"""
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            for path in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(path) and path.lower().endswith(EXTENSIONS):
+                    found.append((path, os.path.relpath(path, item)))
+        else:
+            paths = sorted(glob.glob(item, recursive=recursive)) or [item]
+            for path in paths:
+                if path.lower().endswith(EXTENSIONS):
+                    found.append((path, os.path.basename(path)))
+    return found
+
+
+def convert_all(files, output_dir, output_format, jobs=None, engine='auto', cache_dir=None, memory_budget=None,
+                report=print):
+    """Преобразует файлы в пуле процессов; jobs=1 - последовательно в текущем процессе"""
+    tasks = [(path, os.path.join(output_dir, os.path.splitext(relative)[0] + FORMATS[output_format]))
+             for path, relative in files]
+    results = []
+
+    def done(result):
+        results.append(result)
+        if report is not None:
+            report(format_result(result))
+
+    if jobs == 1 or len(tasks) <= 1:
+        for path, output_path in tasks:
+            done(convert_file(path, output_path, output_format, engine, cache_dir, memory_budget))
+        return results
+
+    # Файлы и так декодируются параллельно: сами таблицы - в одном процессе каждая
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_file, path, output_path, output_format, engine, cache_dir,
+                                   memory_budget, 1): path
+                   for path, output_path in tasks}
+        for future in as_completed(futures):
+            try:
+                done(future.result())
+            except Exception as e:  # Процесс-обработчик аварийно завершился
+                done({"status": "error", "file": futures[future], "output": None, "records": 0,
+                      "read_seconds": 0.0, "write_seconds": 0.0, "message": str(e)})
+    return results
+
+
+def format_result(result):
+    if result['status'] != 'success':
+        return f"ОШИБКА {result['file']}: {result['message']}"
+    return (f"OK     {result['file']} -> {result['output']}: записей {result['records']}, "
+            f"чтение {result['read_seconds'] * 1000:.1f} мс, запись {result['write_seconds'] * 1000:.1f} мс")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное преобразование файлов DBC/DB2")
+    parser.add_argument('inputs', nargs='+', help="каталоги, шаблоны (*.db2) или файлы")
+    parser.add_argument('-o', '--output', default='.', help="каталог для результатов")
+    parser.add_argument('-f', '--format', default='csv', choices=sorted(FORMATS), help="формат результата")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="искать файлы во вложенных каталогах")
+    parser.add_argument('--engine', default='auto', choices=('auto', 'python', 'numpy'))
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='КАТАЛОГ',
+                        help="использовать кеш декодированных записей (по умолчанию - каталог кеша программы)")
+    parser.add_argument('--memory-budget', type=int, default=None, metavar='МБ',
+                        help="читать записи блоками, держа в памяти не больше МБ декодированных данных")
+    args = parser.parse_args(argv)
+    cache_dir = None
+    if args.cache is not None:
+        cache_dir = args.cache or ParseCache().directory
+
+    logging.basicConfig(level=os.environ.get('DBCD_LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
+    files = find_files(args.inputs, args.recursive)
+    if not files:
+        print("Файлы .dbc/.db2 не найдены")
+        return 1
+
+    start = time.perf_counter()
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    results = convert_all(files, args.output, args.format, jobs=args.jobs, engine=args.engine, cache_dir=cache_dir,
+                          memory_budget=memory_budget)
+    failed = sum(1 for result in results if result['status'] != 'success')
+    print(f"Готово: {len(results) - failed} из {len(results)} файлов за {time.perf_counter() - start:.2f} с"
+          + (f", ошибок: {failed}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Декодеры записей, скомпилированные под структуру таблицы
+
+План декодирования (список (вид, смещение, размер, данные) по полям) один раз
+переводится в готовый декодер: один struct.Struct на всю запись и список
+поправок по столбцам для движка на чистом Python, структурированный dtype
+для движка NumPy. Декодеры запоминаются по layout_hash и виду полей, так что
+файлы с одинаковой структурой (одна таблица в разных локализациях) план
+повторно не разбирают. Данные палитр и общих данных в декодер не входят
+и передаются при каждом вызове: у разных файлов они свои.
+"""
+
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+import dbcd_numpy
+
+# Сколько декодеров разных структур хранится в процессе
+MAX_DECODERS = 256
+
+_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+# Виды полей, значения которых лежат в байтах записи по своему смещению
+_BYTE_KINDS = ('raw', 'common', 'pallet', 'masked')
+
+_decoders = OrderedDict()
+_lock = threading.Lock()
+
+
+def _shape(entry):
+    """Вид поля без данных файла: палитры и общие данные не влияют на декодер"""
+    kind, offset, size, payload = entry
+    if kind == 'bits':
+        payload = (payload['bit_offset'], payload['width'], payload['signed'],
+                   payload['pallet'] is not None, payload['cardinality'])
+    elif kind in ('common', 'pallet'):
+        payload = None
+    return kind, offset, size, payload
+
+
+def layout_key(layout_hash, stride, plan):
+    return layout_hash, stride, tuple(_shape(entry) for entry in plan)
+
+
+def compile_decoder(layout_hash, stride, plan):
+    """Декодер для структуры записей; повторный вызов с той же структурой возвращает готовый"""
+    key = layout_key(layout_hash, stride, plan)
+    with _lock:
+        decoder = _decoders.get(key)
+        if decoder is not None:
+            _decoders.move_to_end(key)
+            return decoder
+    decoder = CompiledDecoder(stride, key[2])
+    with _lock:
+        decoder = _decoders.setdefault(key, decoder)
+        while len(_decoders) > MAX_DECODERS:
+            _decoders.popitem(last=False)
+    return decoder
+
+
+def clear():
+    with _lock:
+        _decoders.clear()
+
+
+class CompiledDecoder:
+    """Декодер записей одной структуры
+
+    Поля, лежащие в байтах записи без перекрытий, распаковываются одним struct.Struct
+    за проход; битовые, непосредственные и перекрывающиеся поля декодирует вызывающий.
+    """
+
+    def __init__(self, stride, shapes):
+        self.stride = stride
+        self.shapes = shapes
+        self.record_dtype = None
+        if dbcd_numpy.supports(shapes):
+            self.record_dtype = dbcd_numpy.record_dtype(shapes, stride)
+
+        fields = sorted((field_idx for field_idx, (kind, offset, size, payload) in enumerate(shapes)
+                         if kind in _BYTE_KINDS and size > 0),
+                        key=lambda field_idx: shapes[field_idx][1])
+        fmt = '<'
+        end = 0
+        self.fields = []
+        for field_idx in fields:
+            kind, offset, size, payload = shapes[field_idx]
+            if offset < end or offset + size > stride:
+                continue
+            fmt += f'{offset - end}x' if offset > end else ''
+            fmt += _CODES.get(size, f'{size}s')
+            self.fields.append(field_idx)
+            end = offset + size
+        fmt += f'{stride - end}x' if stride > end else ''
+        self.record = struct.Struct(fmt) if self.fields else None
+        # Поля одной обычной ширины вплотную друг к другу на всю запись: столбцы - срезы одного массива
+        sizes = {shapes[field_idx][2] for field_idx in self.fields}
+        self.uniform = (_CODES.get(sizes.pop()) if len(sizes) == 1 and end == stride and
+                        len(self.fields) * shapes[self.fields[0]][2] == stride else None)
+
+    def decode(self, view, pos, record_count, plan, fields, progress=None):
+        """Столбцы полей fields, распаковываемых struct: словарь поле -> столбец
+
+        plan - план того же вида с данными палитр и общих данных этого файла.
+        Остальные поля из fields в словарь не попадают.
+        """
+        wanted = set(fields)
+        selected = [field_idx for field_idx in self.fields if field_idx in wanted]
+        if not selected or record_count <= 0:
+            return {}
+        if progress is not None:
+            progress('records', 0, len(fields))
+        needed = record_count * self.stride
+        data = view[pos:pos + needed] if pos < len(view) else b''
+        if len(data) < needed:
+            # Хвост обрезанного файла: недостающие байты считаются нулями
+            data = bytes(data) + bytes(needed - len(data))
+
+        if self.uniform is not None:
+            values = array(self.uniform)
+            values.frombytes(data)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            step = len(self.fields)
+            raw = {field_idx: values[i::step] for i, field_idx in enumerate(self.fields) if field_idx in wanted}
+        else:
+            unpacked = zip(*self.record.iter_unpack(data))
+            raw = {field_idx: values for field_idx, values in zip(self.fields, unpacked) if field_idx in wanted}
+
+        columns = {}
+        for field_idx in selected:
+            kind, offset, size, payload = plan[field_idx]
+            values = raw[field_idx]
+            if size not in _CODES:
+                values = [int.from_bytes(value, 'little') for value in values]
+            # Значения шире 64 бит остаются списком
+            code = _CODES.get(size, 'I' if size < 4 else 'Q' if size < 8 else None)
+            if kind == 'common':
+                get = dict(payload.items()).get
+                values = array('I', [get(value, 0) for value in values])
+            elif kind == 'pallet':
+                pallet = list(payload) + [0]
+                limit = len(payload)
+                values = array('I', [pallet[value if value < limit else limit] for value in values])
+            elif kind == 'masked' and payload:
+                values = [value & payload for value in values]
+            if code is not None and not isinstance(values, array):
+                values = array(code, values)
+            elif code is None:
+                values = list(values)
+            columns[field_idx] = values
+        return columns
@@ -0,0 +1,219 @@
+"""Сравнение двух версий одной таблицы по ID записей
+
+Записи сопоставляются по ID через индекс ID (dbcd_search.IdIndex), значения
+сравниваются по столбцам блоками по chunk_size записей. Различия выдаются
+по мере сравнения, копии таблиц не создаются.
+
+Запуск:
+    python dbcd_diff.py old/Spell.db2 new/Spell.db2
+    python dbcd_diff.py old/Spell.db2 new/Spell.db2 --jsonl spell_diff.jsonl
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy записи сравниваются по одной
+    np = None
+
+from dbcd_search import IdIndex
+
+DEFAULT_CHUNK_SIZE = 65536
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# Различие одной записи: вид, ID, номера записи в старой и новой таблице (None, если записи нет)
+# и для изменённых записей - список (поле, старое значение, новое значение)
+RowDiff = namedtuple('RowDiff', 'kind record_id old_row new_row changes')
+
+
+def check_compatible(old, new):
+    """Проверяет, что прочитанные файлы - версии одной таблицы; иначе ValueError"""
+    if old.header is None or new.header is None:
+        raise ValueError("Оба файла должны быть прочитаны")
+    if old.file_type != new.file_type:
+        raise ValueError(f"Файлы разных форматов: {old.file_type} и {new.file_type}")
+    old_hash = old.header.get('layout_hash')
+    new_hash = new.header.get('layout_hash')
+    if old_hash != new_hash:
+        raise ValueError(f"Разная структура таблиц: layout_hash 0x{old_hash:08X} и 0x{new_hash:08X}")
+    if old.records.field_count != new.records.field_count:
+        raise ValueError(f"Разное количество полей: {old.records.field_count} и {new.records.field_count}")
+
+
+def _id_index(dbcd):
+    return dbcd.id_index if dbcd.id_index is not None else dbcd.build_id_index()
+
+
+def _take(column, rows):
+    if isinstance(column, np.ndarray):
+        return column[rows]
+    return [column[row] for row in rows.tolist()]
+
+
+def _differs(old_column, old_rows, new_column, new_rows):
+    """Маска сопоставленных записей, у которых значение поля отличается"""
+    old_values = _take(old_column, old_rows)
+    new_values = _take(new_column, new_rows)
+    if isinstance(old_values, np.ndarray) and isinstance(new_values, np.ndarray):
+        return old_values != new_values
+    if isinstance(old_values, np.ndarray):
+        old_values = old_values.tolist()
+    if isinstance(new_values, np.ndarray):
+        new_values = new_values.tolist()
+    return np.fromiter((a != b for a, b in zip(old_values, new_values)), dtype=bool, count=len(old_rows))
+
+
+def _changes(old, new, old_row, new_row, fields):
+    return [(field_idx, old.records.get(old_row, field_idx), new.records.get(new_row, field_idx))
+            for field_idx in fields]
+
+
+def _diff_chunk(old, new, old_index, new_ids, start, stop):
+    """Добавленные и изменённые записи новой таблицы с номерами start..stop-1"""
+    field_count = new.records.field_count
+    old_rows = old_index.rows(new_ids[start:stop])
+    if np is None:
+        for offset, old_row in enumerate(old_rows):
+            new_row = start + offset
+            if old_row == IdIndex.MISSING:
+                yield RowDiff(ADDED, new_ids[new_row], None, new_row, None)
+                continue
+            changes = [(field_idx, a, b) for field_idx, (a, b) in
+                       enumerate(zip(old.records[old_row], new.records[new_row])) if a != b]
+            if changes:
+                yield RowDiff(MODIFIED, new_ids[new_row], old_row, new_row, changes)
+        return
+
+    found = old_rows != IdIndex.MISSING
+    matched_new = np.flatnonzero(found) + start
+    matched_old = old_rows[found]
+    # Маски отличий по полям: поля x сопоставленные записи
+    masks = np.zeros((field_count, len(matched_new)), dtype=bool)
+    for field_idx in range(field_count):
+        masks[field_idx] = _differs(old.records.columns[field_idx], matched_old,
+                                    new.records.columns[field_idx], matched_new)
+    changed = np.zeros(stop - start, dtype=bool)
+    changed[found] = masks.any(axis=0)
+    # Позиция записи блока среди сопоставленных
+    matched_position = np.cumsum(found) - 1
+
+    for offset in np.flatnonzero(changed | ~found).tolist():
+        new_row = start + offset
+        record_id = int(new_ids[new_row])
+        if not found[offset]:
+            yield RowDiff(ADDED, record_id, None, new_row, None)
+            continue
+        position = matched_position[offset]
+        old_row = int(matched_old[position])
+        yield RowDiff(MODIFIED, record_id, old_row, new_row,
+                      _changes(old, new, old_row, new_row, np.flatnonzero(masks[:, position]).tolist()))
+
+
+def iter_diff(old, new, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Различия таблиц двух прочитанных файлов (DBCDWrapper) по мере сравнения
+
+    Сначала выдаются добавленные и изменённые записи в порядке новой таблицы,
+    затем удалённые в порядке старой.
+    """
+    check_compatible(old, new)
+    old_index = _id_index(old)
+    new_index = _id_index(new)
+    old_ids = old.loaded_ids()
+    new_ids = new.loaded_ids()
+
+    for start in range(0, len(new_ids), chunk_size):
+        yield from _diff_chunk(old, new, old_index, new_ids, start, min(start + chunk_size, len(new_ids)))
+
+    for start in range(0, len(old_ids), chunk_size):
+        rows = new_index.rows(old_ids[start:start + chunk_size])
+        if np is None:
+            missing = [offset for offset, row in enumerate(rows) if row == IdIndex.MISSING]
+        else:
+            missing = np.flatnonzero(rows == IdIndex.MISSING).tolist()
+        for offset in missing:
+            old_row = start + offset
+            yield RowDiff(REMOVED, int(old_ids[old_row]), old_row, None, None)
+
+
+def iter_batches(diffs, batch_size=1000):
+    """Различия списками по batch_size: для передачи в интерфейс порциями"""
+    batch = []
+    for diff in diffs:
+        batch.append(diff)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def summarize(diffs):
+    """Количество различий каждого вида; diffs просматривается один раз"""
+    counts = {ADDED: 0, REMOVED: 0, MODIFIED: 0}
+    for diff in diffs:
+        counts[diff.kind] += 1
+    return counts
+
+
+def format_diff(diff):
+    if diff.kind == ADDED:
+        return f"+ {diff.record_id} (запись {diff.new_row + 1})"
+    if diff.kind == REMOVED:
+        return f"- {diff.record_id} (запись {diff.old_row + 1})"
+    changes = '; '.join(f"поле {field_idx}: {old} -> {new}" for field_idx, old, new in diff.changes)
+    return f"~ {diff.record_id}: {changes}"
+
+
+def diff_json(diff):
+    """Различие в виде строки JSON; значения полей-массивов - списки"""
+    item = {'kind': diff.kind, 'id': diff.record_id, 'old_row': diff.old_row, 'new_row': diff.new_row}
+    if diff.changes is not None:
+        item['changes'] = [{'field': field_idx, 'old': old, 'new': new} for field_idx, old, new in diff.changes]
+    return json.dumps(item, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение двух версий таблицы DBC/DB2 по ID записей")
+    parser.add_argument('old', help="старая версия файла")
+    parser.add_argument('new', help="новая версия файла")
+    parser.add_argument('--jsonl', help="записать различия в файл JSONL вместо вывода на экран")
+    parser.add_argument('--engine', default='auto', choices=('auto', 'python', 'numpy'))
+    args = parser.parse_args(argv)
+
+    from dbcd_wrapper import DBCDWrapper
+    start = time.perf_counter()
+    tables = []
+    for path in (args.old, args.new):
+        dbcd = DBCDWrapper(path, engine=args.engine)
+        result = dbcd.read_file()
+        if result['status'] != 'success':
+            print(f"Ошибка чтения {path}: {result['message']}")
+            return 1
+        tables.append(dbcd)
+
+    counts = {ADDED: 0, REMOVED: 0, MODIFIED: 0}
+    output = open(args.jsonl, 'w', encoding='utf-8') if args.jsonl else sys.stdout
+    try:
+        for diff in iter_diff(*tables):
+            counts[diff.kind] += 1
+            output.write((diff_json(diff) if args.jsonl else format_diff(diff)) + '\n')
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return 1
+    finally:
+        if args.jsonl:
+            output.close()
+    print(f"Добавлено: {counts[ADDED]}, удалено: {counts[REMOVED]}, изменено: {counts[MODIFIED]} "
+          f"за {time.perf_counter() - start:.2f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Журнал правок для отмены и повтора
+
+Хранятся только изменения: (запись, поле, старое значение, новое значение),
+сгруппированные по действиям пользователя, так что второй копии таблицы не нужно.
+Правки строк DBC записываются с полем None и номером строки вместо номера записи.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+
+# Сколько изменённых ячеек хранится для отмены; более старые действия забываются
+DEFAULT_LIMIT = 1000000
+
+
+class EditJournal:
+    """Стеки отмены и повтора из групп изменений"""
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self._undo = deque()
+        self._redo = []
+        self._size = 0
+        self._group = None
+        self._depth = 0
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._size = 0
+
+    @contextmanager
+    def group(self):
+        """Правки внутри блока отменяются и повторяются одним действием; блоки могут вкладываться"""
+        if self._depth == 0:
+            self._group = []
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                group, self._group = self._group, None
+                self._push(group)
+
+    def record(self, row, field_idx, old, new):
+        """Записывает изменение; новое действие сбрасывает стек повтора"""
+        if self._group is not None:
+            self._group.append((row, field_idx, old, new))
+        else:
+            self._push([(row, field_idx, old, new)])
+
+    def _push(self, group):
+        if not group:
+            return
+        self._redo.clear()
+        self._undo.append(group)
+        self._size += len(group)
+        while self._size > self.limit and len(self._undo) > 1:
+            self._size -= len(self._undo.popleft())
+
+    def undo(self):
+        """Изменения последнего действия в обратном порядке или None; значения применяет вызывающий"""
+        if not self._undo:
+            return None
+        group = self._undo.pop()
+        self._size -= len(group)
+        self._redo.append(group)
+        return group[::-1]
+
+    def redo(self):
+        """Изменения последнего отменённого действия в исходном порядке или None"""
+        if not self._redo:
+            return None
+        group = self._redo.pop()
+        self._undo.append(group)
+        self._size += len(group)
+        return group
@@ -0,0 +1,172 @@
+"""Векторизованное декодирование записей DB2 на NumPy (необязательный движок)"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не установлен - используется движок на чистом Python
+    np = None
+
+HAS_NUMPY = np is not None
+
+# Ширины полей, которые NumPy читает напрямую
+_DTYPES = {1: '<u1', 2: '<u2', 4: '<u4', 8: '<u8'}
+
+
+def supports(plan):
+    """Проверяет, может ли движок декодировать записи с таким планом"""
+    if not HAS_NUMPY:
+        return False
+    return all(kind in ('immediate', 'bits') or size in _DTYPES for kind, offset, size, payload in plan)
+
+
+def _record_buffer(view, pos, record_count, stride):
+    """Буфер всех записей; если файл обрезан, недостающие байты считаются нулями"""
+    needed = record_count * stride
+    available = max(0, min(len(view) - pos, needed))
+    if available == needed:
+        return view, pos
+    padded = bytearray(needed)
+    padded[:available] = view[pos:pos + available]
+    return padded, 0
+
+
+def record_dtype(plan, stride):
+    """Структурированный dtype записи: поля, лежащие в байтах записи, по своим смещениям"""
+    names, formats, offsets = [], [], []
+    for field_idx, (kind, offset, size, payload) in enumerate(plan):
+        if kind in ('immediate', 'bits'):
+            continue
+        names.append(f'f{field_idx}')
+        formats.append(_DTYPES[size])
+        offsets.append(offset)
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': max(stride, 1)})
+
+
+def _record_array(view, pos, record_count, stride, plan, dtype=None):
+    """Отображает все записи на структурированный dtype одним frombuffer"""
+    if dtype is None:
+        dtype = record_dtype(plan, stride)
+    buffer, offset = _record_buffer(view, pos, record_count, stride)
+    return np.frombuffer(buffer, dtype=dtype, count=record_count, offset=offset)
+
+
+def _extract_bits(raw, bits):
+    """Извлекает битово упакованное поле из байтов записей (матрица записей x байтов)"""
+    width = bits['width']
+    record_count, stride = raw.shape
+    if width == 0:
+        return np.zeros(record_count, dtype=np.uint64)
+    byte_start, shift = divmod(bits['bit_offset'], 8)
+    values = np.zeros(record_count, dtype=np.uint64)
+    # Собираем нужные байты в одно число; байты за концом записи считаются нулями
+    for k in range((shift + width + 7) // 8):
+        if byte_start + k >= stride:
+            break
+        values |= raw[:, byte_start + k].astype(np.uint64) << np.uint64(8 * k)
+    values >>= np.uint64(shift)
+    values &= np.uint64((1 << width) - 1)
+
+    if bits['signed']:
+        signed = values.astype(np.int64)
+        signed[values >= (1 << (width - 1))] -= 1 << width
+        return signed
+    pallet = bits['pallet']
+    if pallet is None:
+        return values
+    cardinality = bits['cardinality']
+    if cardinality is None:
+        return _lookup_pallet(values, pallet)
+    # Индексированный массив: значения ячеек - кортежи из cardinality элементов палитры
+    array_count = len(pallet) // cardinality
+    arrays = [tuple(pallet[i * cardinality:(i + 1) * cardinality]) for i in range(array_count)]
+    arrays.append((0,) * cardinality)
+    table = np.empty(len(arrays), dtype=object)
+    for i, item in enumerate(arrays):
+        table[i] = item
+    return np.take(table, np.minimum(values, array_count).astype(np.int64))
+
+
+def _lookup_pallet(indexes, pallet):
+    """Заменяет индексы значениями палитры, индексы за пределами палитры дают 0"""
+    table = np.zeros(len(pallet) + 1, dtype=np.uint64)
+    table[:len(pallet)] = np.frombuffer(pallet, dtype=np.uint32) if len(pallet) else []
+    indexes = indexes.astype(np.uint64)
+    np.minimum(indexes, len(pallet), out=indexes)
+    return np.take(table, indexes)
+
+
+def _lookup_common(keys, common):
+    """Заменяет ключи значениями общих данных через бинарный поиск, отсутствующие ключи дают 0"""
+    if not common:
+        return np.zeros(len(keys), dtype=np.uint64)
+    # Ключи общих данных уже отсортированы (CommonData)
+    sorted_keys = np.frombuffer(common.keys, dtype=np.uint32).astype(np.uint64)
+    values = np.frombuffer(common.values, dtype=np.uint32).astype(np.uint64)
+    keys = keys.astype(np.uint64)
+    positions = np.searchsorted(sorted_keys, keys)
+    np.minimum(positions, len(sorted_keys) - 1, out=positions)
+    found = np.take(sorted_keys, positions) == keys
+    return np.where(found, np.take(values, positions), np.uint64(0))
+
+
+def decode_columns(view, pos, record_count, stride, plan, progress=None, rows=None, fields=None, dtype=None):
+    """Декодирует записи пакетно и возвращает словарь поле -> столбец (массив uint64)
+
+    fields ограничивает набор декодируемых полей, rows - набор записей,
+    dtype - готовый record_dtype(plan, stride) (dbcd_decoder).
+    """
+    records = _record_array(view, pos, record_count, stride, plan, dtype)
+    raw = None
+    if any(plan[field_idx][0] == 'bits' for field_idx in (fields if fields is not None else range(len(plan)))):
+        buffer, offset = _record_buffer(view, pos, record_count, stride)
+        raw = np.frombuffer(buffer, dtype=np.uint8, count=record_count * stride, offset=offset)
+        raw = raw.reshape(record_count, stride)
+    if rows is not None:
+        rows = np.asarray(rows, dtype=np.int64)
+        records = records[rows]
+        if raw is not None:
+            raw = raw[rows]
+    if fields is None:
+        fields = range(len(plan))
+    columns = {}
+    for done, field_idx in enumerate(fields):
+        kind, offset, size, payload = plan[field_idx]
+        if progress is not None:
+            progress('records', done, len(fields))
+        if kind == 'immediate':
+            columns[field_idx] = np.full(len(records), payload, dtype=np.uint64)
+            continue
+        if kind == 'bits':
+            columns[field_idx] = _extract_bits(raw, payload)
+            continue
+        column = records[f'f{field_idx}']
+        if kind == 'common':
+            column = _lookup_common(column, payload)
+        elif kind == 'pallet':
+            column = _lookup_pallet(column, payload)
+        elif kind == 'masked' and payload:
+            column = column.astype(np.uint64) & np.uint64(payload)
+        columns[field_idx] = column.astype(np.uint64, copy=False)
+    return columns
+
+
+
+def changed_rows(current, original):
+    """Номера записей, где столбцы различаются; None, если столбцы нельзя сравнить векторно"""
+    if not HAS_NUMPY or not isinstance(current, np.ndarray) or not isinstance(original, np.ndarray):
+        return None
+    if current.dtype.kind not in 'ui' or current.dtype.kind != original.dtype.kind:
+        return None
+    return np.flatnonzero(current != original).tolist()
+
+
+def store_column(buffer, stride, offset, size, rows, column):
+    """Записывает значения несжатого поля в блок записей; False, если это нужно делать построчно"""
+    if not HAS_NUMPY or not isinstance(column, np.ndarray) or column.dtype.kind not in 'ui' or size not in _DTYPES:
+        return False
+    values = column[np.asarray(rows, dtype=np.int64)]
+    if int(values.min()) < -(1 << (8 * size - 1)) or int(values.max()) >= 1 << (8 * size):
+        return False
+    target = np.ndarray((len(buffer) // stride,), dtype=_DTYPES[size], buffer=buffer, offset=offset, strides=(stride,))
+    # Отрицательные значения записываются в дополнительном коде
+    target[np.asarray(rows, dtype=np.int64)] = values.astype(np.int64).astype(_DTYPES[size])
+    return True
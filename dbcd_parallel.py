@@ -0,0 +1,178 @@
+"""Декодирование одной большой таблицы в нескольких процессах
+
+Записи секций делятся на части, которые процессы пула декодируют движком NumPy.
+Каждый процесс сам отображает файл в память (страницы файла общие для всех
+процессов через кеш ОС) и пишет столбцы своей части прямо на их место
+в общей памяти (multiprocessing.shared_memory): записи между процессами
+не передаются, а части не склеиваются. Каждый столбец копируется один раз:
+при упаковке из общей памяти (64 бита на значение) в наименьший подходящий
+тип (make_column), после чего общая память освобождается.
+"""
+
+import mmap
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import dbcd_decoder
+import dbcd_numpy
+from dbcd_table import make_column
+
+np = dbcd_numpy.np
+
+# Таблицы меньше этого числа записей декодируются в одном процессе: запуск пула дороже
+MIN_PARALLEL_ROWS = 1000000
+# Меньшие части не окупают передачу задания процессу
+MIN_SHARD_ROWS = 65536
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def default_processes(record_count):
+    """Число процессов для таблицы из record_count записей (1 - без пула)"""
+    if record_count < MIN_PARALLEL_ROWS:
+        return 1
+    return os.cpu_count() or 1
+
+
+def shareable(entry):
+    """Можно ли декодировать поле в общую память: значения - целые до 64 бит"""
+    kind, offset, size, payload = entry
+    return not (kind == 'bits' and payload['cardinality'] is not None)
+
+
+def _dtype(entry):
+    kind, offset, size, payload = entry
+    return np.dtype(np.int64 if kind == 'bits' and payload['signed'] else np.uint64)
+
+
+def _pool(processes):
+    """Пул процессов, общий для всех загрузок
+
+    Пересоздаётся при другом числе процессов и после аварийного завершения процесса пула.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        # _broken: процесс пула завершился аварийно, новые задания пул не примет
+        if _executor is None or _executor_workers != processes or getattr(_executor, '_broken', False):
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            # spawn: процесс загрузки может быть многопоточным (интерфейс Qt), fork в нём небезопасен
+            _executor = ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'))
+            _executor_workers = processes
+        return _executor
+
+
+def shutdown(wait=True):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+def _shards(segments, stride, processes):
+    """Части записей: (смещение в файле, число записей, номер первой записи в таблице)
+
+    Частей вдвое больше, чем процессов, чтобы процессы не простаивали в конце.
+    """
+    total = sum(count for pos, count in segments)
+    shard_rows = max(MIN_SHARD_ROWS, -(-total // (processes * 2)))
+    shards = []
+    row = 0
+    for pos, count in segments:
+        for start in range(0, count, shard_rows):
+            shards.append((pos + start * stride, min(shard_rows, count - start), row + start))
+        row += count
+    return shards
+
+
+def _attach(name):
+    """Подключает общую память, созданную загружающим процессом; освобождает её он же"""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:  # Python до 3.13: процессы пула делят учёт ресурсов с создавшим память процессом
+        return SharedMemory(name=name)
+
+
+def _decode_shard(path, pos, count, row, stride, plan, layout_hash, outputs):
+    """Декодирует count записей с позиции pos и пишет столбцы в общую память с записи row
+
+    outputs - список (поле, имя общей памяти, dtype). Выполняется в процессе пула.
+    """
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    try:
+        decoder = dbcd_decoder.compile_decoder(layout_hash, stride, plan)
+        columns = dbcd_numpy.decode_columns(view, pos, count, stride, plan,
+                                            fields=[field_idx for field_idx, name, dtype in outputs],
+                                            dtype=decoder.record_dtype)
+        for field_idx, name, dtype in outputs:
+            shm = _attach(name)
+            try:
+                target = np.ndarray((count,), dtype=dtype, buffer=shm.buf, offset=row * np.dtype(dtype).itemsize)
+                target[:] = columns.pop(field_idx)
+                del target
+            finally:
+                shm.close()
+        del columns
+    finally:
+        view.release()
+        buf.close()
+    return count
+
+
+def decode_segments(path, segments, stride, plan, layout_hash, fields, processes, progress=None):
+    """Декодирует поля fields записей секций (списки (смещение, число записей)) в пуле процессов
+
+    Возвращает словарь поле -> упакованный столбец (make_column). progress(phase, done, total)
+    вызывается по мере готовности частей; исключение из него прерывает декодирование.
+    Если процесс пула завершился аварийно, выбрасывается BrokenProcessPool.
+    """
+    record_count = sum(count for pos, count in segments)
+    memory = {}
+    try:
+        for field_idx in fields:
+            dtype = _dtype(plan[field_idx])
+            memory[field_idx] = SharedMemory(create=True, size=max(1, record_count * dtype.itemsize)), dtype
+        outputs = [(field_idx, shm.name, dtype.str) for field_idx, (shm, dtype) in memory.items()]
+        shards = _shards(segments, stride, processes)
+        executor = _pool(processes)
+        pending = {executor.submit(_decode_shard, path, pos, count, row, stride, plan, layout_hash, outputs)
+                   for pos, count, row in shards}
+        done = 0
+        try:
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done += 1
+                if progress is not None:
+                    progress('records', done, len(shards))
+        except BaseException as e:
+            for future in pending:
+                future.cancel()
+            # Процессы ещё могут писать в общую память: дожидаемся их перед освобождением
+            wait(pending)
+            if isinstance(e, BrokenProcessPool):
+                # Сломанный пул больше не используется, следующая загрузка создаст новый
+                shutdown(wait=False)
+            raise
+
+        columns = {}
+        for field_idx, (shm, dtype) in memory.items():
+            values = np.ndarray((record_count,), dtype=dtype, buffer=shm.buf)
+            # Единственная копия столбца: упаковка в наименьший тип, после неё общая память не нужна
+            columns[field_idx] = make_column(values)
+            del values
+        return columns
+    finally:
+        for shm, dtype in memory.values():
+            shm.close()
+            shm.unlink()
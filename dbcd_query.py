@@ -0,0 +1,286 @@
+"""Язык фильтров по полям записей
+
+Пример: field3 == 42 and field7 in (1, 2, 3) and id between 1000 and 2000
+
+Поля задаются как fieldN (или полеN), где N - номер поля, id - поле-идентификатор
+из заголовка DB2 (id_index). Поддерживаются операторы ==, !=, <, <=, >, >=,
+in (...), not in (...), between ... and ..., логические and, or, not и скобки.
+Числа можно записывать в десятичном или шестнадцатеричном (0x...) виде.
+"""
+
+import operator
+import re
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy условия проверяются построчно
+    np = None
+
+
+class QueryError(ValueError):
+    """Ошибка разбора или вычисления фильтра"""
+
+
+_TOKEN = re.compile(r'\s*(?:(?P<number>-?0[xX][0-9a-fA-F]+|-?\d+)|(?P<op>==|!=|<=|>=|<|>|=|\(|\)|,)'
+                    r'|(?P<name>[^\W\d]\w*))')
+
+_COMPARISONS = {
+    '==': operator.eq,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+_FIELD_NAME = re.compile(r'^(?:field|поле|f)(\d+)$', re.IGNORECASE)
+
+# Признаки того, что строка поиска - фильтр, а не подстрока
+_QUERY_HINT = re.compile(r'==|!=|<|>|=|\b(?:in|between)\b', re.IGNORECASE)
+
+
+def looks_like_query(text):
+    """Проверяет, похожа ли строка поиска на фильтр по полям"""
+    return bool(_QUERY_HINT.search(text))
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"Непонятный фрагмент фильтра: {text[pos:].strip()[:20]}")
+        pos = match.end()
+        if match.group('number') is not None:
+            tokens.append(('number', int(match.group('number'), 0)))
+        elif match.group('op') is not None:
+            tokens.append(('op', match.group('op')))
+        else:
+            tokens.append(('name', match.group('name').lower()))
+    return tokens
+
+
+class _Parser:
+    """Разбор фильтра рекурсивным спуском в дерево из кортежей"""
+
+    def __init__(self, text, id_field):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.id_field = id_field
+
+    def peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            return None
+        return token
+
+    def take(self, kind=None, value=None):
+        token = self.peek(kind, value)
+        if token is None:
+            expected = value or kind or "выражение"
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else "конец строки"
+            raise QueryError(f"Ожидалось {expected}, найдено: {found}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError("Пустой фильтр")
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"Лишний фрагмент фильтра: {self.tokens[self.pos][1]}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek('name', 'or'):
+            self.take()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek('name', 'and'):
+            self.take()
+            node = ('and', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek('name', 'not'):
+            self.take()
+            return ('not', self.parse_not())
+        if self.peek('op', '('):
+            self.take()
+            node = self.parse_or()
+            self.take('op', ')')
+            return node
+        return self.parse_comparison()
+
+    def parse_field(self):
+        name = self.take('name')[1]
+        if name == 'id':
+            if self.id_field is None:
+                raise QueryError("Поле id недоступно для этого файла")
+            return self.id_field
+        match = _FIELD_NAME.match(name)
+        if not match:
+            raise QueryError(f"Неизвестное поле: {name}")
+        return int(match.group(1))
+
+    def parse_comparison(self):
+        field = self.parse_field()
+        negate = False
+        if self.peek('name', 'not'):
+            self.take()
+            negate = True
+        if self.peek('name', 'in'):
+            self.take()
+            self.take('op', '(')
+            values = [self.take('number')[1]]
+            while self.peek('op', ','):
+                self.take()
+                values.append(self.take('number')[1])
+            self.take('op', ')')
+            return ('in', field, tuple(values), negate)
+        if self.peek('name', 'between'):
+            self.take()
+            low = self.take('number')[1]
+            self.take('name', 'and')
+            high = self.take('number')[1]
+            return ('between', field, low, high, negate)
+        if negate:
+            raise QueryError("После not ожидалось in или between")
+        op = self.take('op')[1]
+        if op not in _COMPARISONS:
+            raise QueryError(f"Неизвестный оператор: {op}")
+        return ('cmp', op, field, self.take('number')[1])
+
+
+class Query:
+    """Разобранный фильтр, вычисляемый над столбцами таблицы целиком"""
+
+    def __init__(self, text, id_field=None):
+        self.text = text
+        self.tree = _Parser(text, id_field).parse()
+        self.fields = sorted(self._collect_fields(self.tree, set()))
+
+    def _collect_fields(self, node, fields):
+        if node[0] in ('or', 'and'):
+            self._collect_fields(node[1], fields)
+            self._collect_fields(node[2], fields)
+        elif node[0] == 'not':
+            self._collect_fields(node[1], fields)
+        elif node[0] == 'cmp':
+            fields.add(node[2])
+        else:
+            fields.add(node[1])
+        return fields
+
+    def check_fields(self, field_count):
+        for field in self.fields:
+            if field >= field_count:
+                raise QueryError(f"Поле {field} отсутствует: в файле {field_count} полей")
+
+    def mask(self, columns, row_count):
+        """Вычисляет маску записей; columns - отображение номер поля -> столбец"""
+        try:
+            if np is not None:
+                arrays = {field: _as_numpy(columns[field]) for field in self.fields}
+                return self._eval_numpy(self.tree, arrays, row_count)
+            return self._eval_python(self.tree, columns, row_count)
+        except TypeError:
+            raise QueryError("Значения поля нельзя сравнивать с числом (поле содержит массивы)")
+
+    def matching_rows(self, columns, row_count):
+        """Номера записей, удовлетворяющих фильтру"""
+        mask = self.mask(columns, row_count)
+        if np is not None:
+            return np.flatnonzero(mask).tolist()
+        return [row for row, matched in enumerate(mask) if matched]
+
+    def _eval_numpy(self, node, arrays, row_count):
+        kind = node[0]
+        if kind == 'or':
+            return self._eval_numpy(node[1], arrays, row_count) | self._eval_numpy(node[2], arrays, row_count)
+        if kind == 'and':
+            return self._eval_numpy(node[1], arrays, row_count) & self._eval_numpy(node[2], arrays, row_count)
+        if kind == 'not':
+            return ~self._eval_numpy(node[1], arrays, row_count)
+        if kind == 'cmp':
+            return _compare_numpy(arrays[node[2]], _COMPARISONS[node[1]], node[3])
+        if kind == 'in':
+            result = _isin_numpy(arrays[node[1]], node[2])
+        else:
+            column = arrays[node[1]]
+            result = _compare_numpy(column, operator.ge, node[2]) & _compare_numpy(column, operator.le, node[3])
+        return ~result if node[-1] else result
+
+    def _eval_python(self, node, columns, row_count):
+        kind = node[0]
+        if kind == 'or':
+            left = self._eval_python(node[1], columns, row_count)
+            right = self._eval_python(node[2], columns, row_count)
+            return [a or b for a, b in zip(left, right)]
+        if kind == 'and':
+            left = self._eval_python(node[1], columns, row_count)
+            right = self._eval_python(node[2], columns, row_count)
+            return [a and b for a, b in zip(left, right)]
+        if kind == 'not':
+            return [not a for a in self._eval_python(node[1], columns, row_count)]
+        if kind == 'cmp':
+            compare = _COMPARISONS[node[1]]
+            value = node[3]
+            return [compare(x, value) for x in columns[node[2]]]
+        if kind == 'in':
+            values = set(node[2])
+            result = [x in values for x in columns[node[1]]]
+        else:
+            low, high = node[2], node[3]
+            result = [low <= x <= high for x in columns[node[1]]]
+        return [not a for a in result] if node[-1] else result
+
+
+def _compare_numpy(column, compare, value):
+    """Маска compare(значение столбца, value) без приведения к float64
+
+    Число вне диапазона типа столбца даёт одинаковый результат для всех записей. Столбцы
+    не целого типа (object - массивы, смешанные значения) сравниваются по значениям Python.
+    """
+    if column.dtype.kind not in 'iu':
+        return np.fromiter((compare(x, value) for x in column.tolist()), dtype=bool, count=len(column))
+    info = np.iinfo(column.dtype)
+    if value < info.min:
+        return np.full(len(column), compare(int(info.min), value), dtype=bool)
+    if value > info.max:
+        return np.full(len(column), compare(int(info.max), value), dtype=bool)
+    return np.asarray(compare(column, column.dtype.type(value)), dtype=bool)
+
+
+def _isin_numpy(column, values):
+    """Маска значений столбца, входящих в values, без приведения к float64"""
+    if column.dtype.kind not in 'iu':
+        values = set(values)
+        return np.fromiter((x in values for x in column.tolist()), dtype=bool, count=len(column))
+    info = np.iinfo(column.dtype)
+    # Числа вне диапазона типа столбца в нём не встречаются
+    values = np.array([value for value in values if info.min <= value <= info.max], dtype=column.dtype)
+    return np.isin(column, values)
+
+
+def _as_numpy(column):
+    """Представляет столбец как массив NumPy, по возможности без копирования"""
+    if isinstance(column, np.ndarray):
+        return column
+    if isinstance(column, array):
+        return np.frombuffer(column, dtype=np.dtype(column.typecode)) if len(column) else np.zeros(0, np.uint8)
+    # Поэлементно, чтобы кортежи (значения массивов) не превратились в строки матрицы
+    result = np.empty(len(column), dtype=object)
+    for i, value in enumerate(column):
+        result[i] = value
+    return result
@@ -0,0 +1,294 @@
+"""Индекс значений столбцов для быстрого поиска по записям и индекс записей по ID"""
+
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy индекс строится на словарях
+    np = None
+
+from dbcd_table import PagedRecordTable
+
+
+class ColumnIndex:
+    """Индекс одного столбца: отсортированные различные значения и номера записей для каждого
+
+    Для столбцов NumPy хранится обратное отображение запись -> позиция значения,
+    по нему поиск строит маску записей без перебора в Python.
+    """
+
+    def __init__(self, column):
+        if np is not None and isinstance(column, np.ndarray):
+            self.values, self.inverse = np.unique(column, return_inverse=True)
+            self.inverse = self.inverse.reshape(-1)
+            self._order = np.argsort(self.inverse, kind='stable')
+            self._bounds = np.searchsorted(self.inverse[self._order], np.arange(len(self.values) + 1))
+            # Текстовое представление значений для поиска подстроки
+            self.texts = self.values.astype(str)
+            self._groups = None
+        else:
+            groups = {}
+            for row, value in enumerate(column):
+                groups.setdefault(value, []).append(row)
+            self.values = sorted(groups)
+            self.inverse = None
+            self.texts = [str(value).lower() for value in self.values]
+            self._groups = [groups[value] for value in self.values]
+
+    @property
+    def vectorized(self):
+        return self.inverse is not None
+
+    def __len__(self):
+        return len(self.values)
+
+    def rows(self, position):
+        """Номера записей для различного значения с данной позицией"""
+        if self._groups is not None:
+            return self._groups[position]
+        return self._order[self._bounds[position]:self._bounds[position + 1]]
+
+    def lookup(self, value):
+        """Номера записей с точно таким значением"""
+        if self.vectorized:
+            position = int(np.searchsorted(self.values, value)) if value >= 0 else len(self.values)
+        else:
+            position = bisect_left(self.values, value)
+        if position < len(self.values) and self.values[position] == value:
+            return self.rows(position)
+        return []
+
+    def value_range(self, low, high):
+        """Позиции различных значений в диапазоне [low, high]"""
+        if self.vectorized:
+            low = max(low, 0)
+            if high < low:
+                return range(0)
+            return range(int(np.searchsorted(self.values, low, side='left')),
+                          int(np.searchsorted(self.values, high, side='right')))
+        return range(bisect_left(self.values, low), bisect_right(self.values, high))
+
+    def match_substring(self, text, candidates=None):
+        """Позиции различных значений, текст которых содержит подстроку"""
+        if self.vectorized:
+            if candidates is None:
+                return np.flatnonzero(np.char.find(self.texts, text) >= 0)
+            return candidates[np.char.find(self.texts[candidates], text) >= 0]
+        if candidates is None:
+            candidates = range(len(self.texts))
+        texts = self.texts
+        return [i for i in candidates if text in texts[i]]
+
+
+class IdIndex:
+    """Номер записи по её ID
+
+    Если ID занимают компактный диапазон, индекс - плотный массив номеров записей
+    со смещением на минимальный ID, иначе - словарь. Записи из таблицы копий
+    не дублируются: пары (новый ID, ID источника) раскрываются в словарь только
+    при первом промахе основного индекса.
+    """
+
+    # Плотный массив строится, если диапазон ID не больше стольких номеров на запись
+    DENSE_FACTOR = 2
+    MISSING = -1
+
+    def __init__(self, ids, copy_table=None):
+        self.row_count = len(ids)
+        self.min_id = 0
+        self.dense = None
+        self.mapping = None
+        self._copy_table = copy_table if copy_table is not None else array('I')
+        self._copies = None
+        if not self.row_count:
+            self.mapping = {}
+            return
+        vectorized = np is not None and not isinstance(ids, list)
+        if vectorized:
+            ids = np.asarray(ids)
+            if ids.dtype.kind not in 'ui':
+                ids = ids.astype(np.int64)
+            low, high = int(ids.min()), int(ids.max())
+        else:
+            low, high = min(ids), max(ids)
+        span = high - low + 1
+        if low >= 0 and span <= self.DENSE_FACTOR * self.row_count + 64:
+            self.min_id = low
+            # При повторах ID действует первая запись: заполняем с конца
+            if vectorized:
+                row_type = np.int32 if self.row_count < 2 ** 31 else np.int64
+                self.dense = np.full(span, self.MISSING, dtype=row_type)
+                self.dense[ids[::-1] - ids.dtype.type(low)] = np.arange(self.row_count - 1, -1, -1, dtype=row_type)
+            else:
+                self.dense = array('q', [self.MISSING]) * span
+                for row in range(self.row_count - 1, -1, -1):
+                    self.dense[ids[row] - low] = row
+        else:
+            values = ids.tolist() if vectorized else ids
+            self.mapping = dict(zip(reversed(values), range(self.row_count - 1, -1, -1)))
+
+    @property
+    def kind(self):
+        return 'dense' if self.dense is not None else 'hash'
+
+    @property
+    def copy_count(self):
+        return len(self._copy_table) // 2
+
+    def row(self, record_id):
+        """Номер записи с данным ID (без таблицы копий) или None"""
+        if self.dense is not None:
+            position = record_id - self.min_id
+            if 0 <= position < len(self.dense):
+                row = int(self.dense[position])
+                return row if row != self.MISSING else None
+            return None
+        return self.mapping.get(record_id)
+
+    def rows(self, ids):
+        """Номера записей для последовательности ID (MISSING для отсутствующих)
+
+        С NumPy возвращается массив, поиск в плотном индексе выполняется без цикла Python.
+        """
+        if np is None or isinstance(ids, list):
+            rows = [self.row(record_id) for record_id in ids]
+            return [self.MISSING if row is None else row for row in rows]
+        ids = np.asarray(ids, dtype=np.int64)
+        if isinstance(self.dense, np.ndarray):
+            positions = ids - self.min_id
+            inside = (positions >= 0) & (positions < len(self.dense))
+            rows = np.full(len(ids), self.MISSING, dtype=np.int64)
+            rows[inside] = self.dense[positions[inside]]
+            return rows
+        row = self.row
+        return np.fromiter((self.MISSING if (found := row(record_id)) is None else found
+                            for record_id in ids.tolist()), dtype=np.int64, count=len(ids))
+
+    def copies(self):
+        """Словарь новый ID -> ID источника из таблицы копий, строится при первом обращении"""
+        if self._copies is None:
+            self._copies = dict(zip(self._copy_table[0::2], self._copy_table[1::2]))
+        return self._copies
+
+    def resolve(self, record_id):
+        """(номер записи, ID источника) для ID или None
+
+        Для собственных записей ID источника - None, для копий - ID записи, с которой снята копия.
+        """
+        row = self.row(record_id)
+        if row is not None:
+            return row, None
+        if not self._copy_table:
+            return None
+        source_id = self.copies().get(record_id)
+        if source_id is None:
+            return None
+        row = self.row(source_id)
+        return (row, source_id) if row is not None else None
+
+    def memory_usage(self):
+        if self.dense is not None:
+            return self.dense.nbytes if np is not None and isinstance(self.dense, np.ndarray) \
+                else self.dense.itemsize * len(self.dense)
+        return sys.getsizeof(self.mapping)
+
+
+class SearchIndex:
+    """Индекс поиска по таблице записей, строится один раз на загрузку файла
+
+    Для постраничной таблицы (PagedRecordTable) индекс всей таблицы не строится:
+    поиск просматривает её блоками, строя индекс каждого блока на время поиска.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.paged = isinstance(table, PagedRecordTable)
+        self.columns = [None] * table.field_count
+        self._last_query = None
+        self._last_matches = None
+
+    def build(self, progress=None):
+        if self.paged:
+            return self
+        for field_index in range(self.table.field_count):
+            if progress is not None:
+                progress('index', field_index, self.table.field_count)
+            self.column(field_index)
+        return self
+
+    def column(self, field_index):
+        """Индекс столбца, строится при первом обращении"""
+        if self.columns[field_index] is None:
+            self.columns[field_index] = ColumnIndex(self.table.columns[field_index])
+        return self.columns[field_index]
+
+    def invalidate(self, field_index=None):
+        """Сбрасывает индекс столбца после изменения значений"""
+        if field_index is None:
+            self.columns = [None] * self.table.field_count
+        else:
+            self.columns[field_index] = None
+        self._last_query = None
+        self._last_matches = None
+
+    def rows_matching(self, field_index, positions):
+        """Отсортированные номера записей, у которых значение поля - одно из данных позиций"""
+        column = self.column(field_index)
+        if column.vectorized:
+            hit = np.zeros(len(column), dtype=bool)
+            hit[np.asarray(positions, dtype=np.int64)] = True
+            return np.flatnonzero(hit[column.inverse]).tolist()
+        rows = []
+        for position in positions:
+            rows.extend(column.rows(position))
+        return sorted(rows)
+
+    def _scan(self, text):
+        """Полный просмотр записей: нужен, когда запрос может захватывать несколько полей"""
+        return [index for index, record in enumerate(self.table.iter_rows())
+                if text in ' '.join(str(x) for x in record).lower()]
+
+    def _search_paged(self, text):
+        rows = []
+        for start, chunk in self.table.iter_chunks():
+            rows.extend(start + row for row in SearchIndex(chunk).search(text))
+        return rows
+
+    def search(self, text):
+        """Номера записей, в тексте которых встречается подстрока"""
+        text = text.lower()
+        if self.paged:
+            return self._search_paged(text)
+        if ' ' in text:
+            self._last_query = None
+            return self._scan(text)
+
+        # Если запрос продолжает предыдущий, ищем только среди уже найденных значений
+        narrowing = self._last_query is not None and self._last_query in text
+        matches = []
+        mask = np.zeros(len(self.table), dtype=bool) if np is not None else None
+        rows = set()
+        for field_index in range(self.table.field_count):
+            column = self.column(field_index)
+            candidates = self._last_matches[field_index] if narrowing else None
+            positions = column.match_substring(text, candidates)
+            matches.append(positions)
+            if not len(positions):
+                continue
+            if column.vectorized:
+                hit = np.zeros(len(column), dtype=bool)
+                hit[positions] = True
+                mask |= hit[column.inverse]
+            else:
+                for position in positions:
+                    rows.update(column.rows(position))
+
+        self._last_query = text
+        self._last_matches = matches
+        if mask is None:
+            return sorted(rows)
+        if not rows:
+            return np.flatnonzero(mask).tolist()
+        return sorted(rows.union(np.flatnonzero(mask).tolist()))
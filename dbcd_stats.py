@@ -0,0 +1,108 @@
+"""Замеры времени и счётчики этапов чтения и сохранения файла"""
+
+import sys
+import time
+from contextlib import contextmanager
+
+
+def peak_memory():
+    """Пиковый объём памяти процесса в байтах (0, если его не удалось узнать)"""
+    try:
+        import resource
+    except ImportError:  # Windows: модуля resource нет
+        return _windows_peak_memory()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _windows_peak_memory():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except Exception:
+        pass
+    return 0
+
+
+class PhaseStats:
+    """Показатели одного этапа: время, прочитанные (или записанные) байты, записи, пик памяти"""
+
+    __slots__ = ('name', 'seconds', 'bytes', 'rows', 'peak_memory')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.peak_memory = 0
+
+    def as_dict(self):
+        return {
+            'seconds': self.seconds,
+            'bytes': self.bytes,
+            'rows': self.rows,
+            'peak_memory': self.peak_memory
+        }
+
+
+class LoadStats:
+    """Статистика этапов работы с файлом в порядке их выполнения"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def reset(self):
+        self.phases = {}
+
+    def get(self, name):
+        """Показатели этапа; создаются при первом обращении"""
+        if name not in self.phases:
+            self.phases[name] = PhaseStats(name)
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name):
+        """Замеряет время этапа; счётчики заполняются через возвращаемый объект"""
+        stats = self.get(name)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.peak_memory = peak_memory()
+
+    @property
+    def total_seconds(self):
+        return sum(stats.seconds for stats in self.phases.values())
+
+    def __iter__(self):
+        return iter(self.phases.values())
+
+    def __len__(self):
+        return len(self.phases)
+
+    def as_dict(self):
+        return {name: stats.as_dict() for name, stats in self.phases.items()}
+
+    def summary(self):
+        """Текстовый отчёт по этапам"""
+        lines = []
+        for stats in self.phases.values():
+            lines.append(f"{stats.name}: {stats.seconds * 1000:.1f} мс, {stats.bytes} байт, "
+                         f"записей: {stats.rows}, пик памяти: {stats.peak_memory / (1024 * 1024):.1f} МБ")
+        lines.append(f"Всего: {self.total_seconds * 1000:.1f} мс")
+        return '\n'.join(lines)
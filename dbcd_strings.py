@@ -0,0 +1,126 @@
+"""Строковый блок DBC с ленивым чтением строк по смещению"""
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class StringTable:
+    """Строковый блок поверх исходных байтов (bytes или mmap)
+
+    Записи DBC ссылаются на строки по смещению в байтах от начала блока.
+    Строка декодируется только при обращении, недавние строки кешируются,
+    а индекс смещений начала строк строится при первой необходимости.
+    """
+
+    def __init__(self, data=b'', cache_size=4096, encoding='utf-8'):
+        self.data = data
+        self.encoding = encoding
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._offsets = None
+        # Изменённые строки: номер строки -> новое значение
+        self._edited = {}
+
+    def _build_offsets(self):
+        """Смещения начала всех строк блока (как у частей split по нулевому байту)"""
+        offsets = array('I', [0])
+        data = self.data
+        pos = data.find(b'\0')
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = data.find(b'\0', pos + 1)
+        return offsets
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            self._offsets = self._build_offsets()
+        return self._offsets
+
+    def __len__(self):
+        return len(self.offsets) if self.data else 0
+
+    def __bool__(self):
+        return len(self.data) > 0
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def at(self, offset):
+        """Строка, начинающаяся с данного смещения в байтах"""
+        index = self.index_of(offset) if self._edited else None
+        if index is not None and index in self._edited:
+            return self._edited[index]
+        if offset in self._cache:
+            self._cache.move_to_end(offset)
+            return self._cache[offset]
+        if not 0 <= offset <= len(self.data):
+            raise IndexError(f"Смещение {offset} за пределами строкового блока")
+        end = self.data.find(b'\0', offset)
+        if end == -1:
+            end = len(self.data)
+        value = bytes(self.data[offset:end]).decode(self.encoding, errors='replace')
+        self._cache[offset] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def offset_of(self, index):
+        """Смещение начала строки с данным номером"""
+        return self.offsets[index]
+
+    def index_of(self, offset):
+        """Номер строки, начинающейся с данного смещения, или None"""
+        offsets = self.offsets
+        position = bisect_left(offsets, offset)
+        if position < len(offsets) and offsets[position] == offset:
+            return position
+        return None
+
+    def is_string_offset(self, offset):
+        """Проверяет, указывает ли значение на начало строки блока"""
+        return isinstance(offset, int) and self.index_of(offset) is not None
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Неверный индекс строки")
+        if index in self._edited:
+            return self._edited[index]
+        return self.at(self.offsets[index])
+
+    def __setitem__(self, index, value):
+        if not 0 <= index < len(self):
+            raise IndexError("Неверный индекс строки")
+        self._edited[index] = value
+
+    @property
+    def modified(self):
+        return bool(self._edited)
+
+    def edited_items(self):
+        """Изменённые строки: пары (номер, новое значение)"""
+        return sorted(self._edited.items())
+
+    def byte_length(self, index):
+        """Длина исходной строки в байтах без завершающего нуля"""
+        offsets = self.offsets
+        end = offsets[index + 1] - 1 if index + 1 < len(offsets) else len(self.data)
+        return end - offsets[index]
+
+    def commit(self):
+        """Принимает изменения как исходное содержимое блока (после сохранения файла)"""
+        if self._edited:
+            self.data = self.to_bytes()
+            self._edited.clear()
+            self._cache.clear()
+            self._offsets = None
+
+    def to_bytes(self):
+        """Байты блока для записи в файл; без изменений возвращаются исходные байты"""
+        if not self._edited:
+            return bytes(self.data)
+        return '\0'.join(self).encode(self.encoding)
@@ -0,0 +1,238 @@
+"""Генератор синтетических файлов DBC и DB2 (WDC5) для замеров производительности
+
+Файлы записываются в том виде, в котором их читает DBCDWrapper: поле 0 - ID записи,
+остальные поля заполняются псевдослучайными значениями с заданным начальным числом,
+так что один и тот же набор параметров всегда даёт один и тот же файл.
+
+Запуск из командной строки:
+    python dbcd_synth.py out.db2 --records 100000
+    python dbcd_synth.py out.dbc --records 100000 --strings 5000
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+from array import array
+
+# Виды полей DB2 и соответствующие им типы сжатия
+FIELD_KINDS = {
+    'none': 0,
+    'immediate': 1,
+    'common': 2,
+    'pallet': 3,
+    'bits': 32,
+    'bits_signed': 33,
+    'bits_indexed': 34,
+}
+
+# Набор полей по умолчанию: (вид, размер в байтах); поле 0 - ID записи
+DEFAULT_FIELDS = (
+    ('none', 4),
+    ('none', 4),
+    ('none', 2),
+    ('none', 1),
+    ('immediate', 4),
+    ('common', 4),
+    ('pallet', 2),
+    ('bits', 4),
+    ('bits_signed', 2),
+    ('bits_indexed', 1),
+    ('none', 8),
+)
+
+# Поля DBC, которые ссылаются на строки строкового блока
+DEFAULT_STRING_FIELDS = (1, 2)
+
+
+def _random_bytes(rnd, size):
+    return rnd.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+
+def _uint32_bytes(values):
+    values = array('I', values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _fill_lane(records, stride, position, table):
+    """Пропускает байты одной позиции всех записей через таблицу подстановки"""
+    records[position::stride] = records[position::stride].translate(table)
+
+
+def _write_ids(records, stride, offset, size, record_count):
+    """Записывает в поле последовательные ID начиная с 1"""
+    ids = _uint32_bytes(range(1, record_count + 1))
+    for byte in range(min(size, 4)):
+        records[offset + byte::stride] = ids[byte::4]
+    for byte in range(4, size):
+        records[offset + byte::stride] = bytes(record_count)
+
+
+def write_wdc5(path, record_count, fields=DEFAULT_FIELDS, seed=0, pallet_size=16, common_size=16,
+               sections=1, id_list=False, copy_count=0):
+    """Записывает файл WDC5
+
+    fields - последовательность (вид, размер в байтах), виды перечислены в FIELD_KINDS.
+    Поля палитры и общих данных ссылаются на блоки из pallet_size и common_size значений
+    (не более 256), битово упакованные поля занимают свои байты записи не целиком.
+    Записи делятся поровну между sections секциями; за записями каждой секции
+    может следовать список ID (id_list) и таблица из copy_count копий записей.
+    """
+    if not 0 < pallet_size <= 256 or not 0 < common_size <= 256:
+        raise ValueError("Размер палитры и общих данных должен быть от 1 до 256")
+    if sections < 1:
+        raise ValueError("Нужна хотя бы одна секция")
+    rnd = random.Random(seed)
+    field_count = len(fields)
+
+    offset = 0
+    layout = []
+    for kind, size in fields:
+        if kind not in FIELD_KINDS:
+            raise ValueError(f"Неизвестный вид поля: {kind}")
+        if kind == 'immediate':
+            layout.append(None)
+            continue
+        layout.append(offset)
+        offset += size
+    stride = offset
+
+    records = bytearray(_random_bytes(rnd, record_count * stride))
+    field_info = []
+    pallet_blocks = []
+    common_blocks = []
+    for field_idx, ((kind, size), field_offset) in enumerate(zip(fields, layout)):
+        compression_type = FIELD_KINDS[kind]
+        additional_data_size = 0
+        packed_offset = 0
+        cell_size = 0
+        if field_idx == 0 and field_offset is not None:
+            _write_ids(records, stride, field_offset, size, record_count)
+        elif kind == 'immediate':
+            packed_offset = rnd.getrandbits(32)
+        elif kind in ('pallet', 'bits_indexed'):
+            pallet_blocks.append(_uint32_bytes(rnd.getrandbits(32) for _ in range(pallet_size)))
+            additional_data_size = pallet_size * 4
+        elif kind == 'common':
+            # Часть ключей записей намеренно отсутствует в общих данных
+            keys = sorted(rnd.sample(range(256), common_size))
+            pairs = []
+            for key in keys:
+                pairs.extend((key, rnd.getrandbits(32)))
+            common_blocks.append(_uint32_bytes(pairs))
+            additional_data_size = common_size * 8
+
+        if kind in ('bits', 'bits_signed', 'bits_indexed'):
+            # Значение занимает младшие биты байтов поля (bitpacked_data_offset = 0)
+            packed_offset = field_offset * 8
+            cell_size = max(1, (pallet_size - 1).bit_length()) if kind == 'bits_indexed' else size * 8 - 3
+
+        # Индексы палитры и ключи общих данных хранятся в младшем байте поля
+        if kind in ('pallet', 'bits_indexed', 'common') and size:
+            limit = pallet_size if kind != 'common' else 256
+            _fill_lane(records, stride, field_offset, bytes(value % limit for value in range(256)))
+            for byte in range(1, size):
+                records[field_offset + byte::stride] = bytes(record_count)
+        elif kind in ('bits', 'bits_signed') and size:
+            top_bits = cell_size - 8 * (size - 1)
+            _fill_lane(records, stride, field_offset + size - 1,
+                       bytes(value & ((1 << top_bits) - 1) for value in range(256)))
+
+        field_info.append(struct.pack('<HHIIIII', field_offset * 8 if field_offset is not None else 0, size,
+                                      additional_data_size, compression_type, packed_offset, cell_size, 0))
+
+    pallet_data = b''.join(pallet_blocks)
+    common_data = b''.join(common_blocks)
+    header_size = 204 + 40 * sections + field_count * 24
+
+    # Секции: записи, затем список ID и таблица копий (пары новый ID - ID источника)
+    section_headers = []
+    section_chunks = []
+    position = header_size + len(pallet_data) + len(common_data)
+    first_row = 0
+    for number in range(sections):
+        count = record_count // sections + (1 if number < record_count % sections else 0)
+        ids = _uint32_bytes(range(first_row + 1, first_row + count + 1)) if id_list else b''
+        copies = []
+        for copy in range(copy_count if count else 0):
+            copies.extend((record_count + number * copy_count + copy + 1, first_row + rnd.randrange(count) + 1))
+        copy_table = _uint32_bytes(copies)
+        # Палитры и общие данные начинаются со смещения первой секции
+        file_offset = header_size if number == 0 else position
+        records_end = position + count * stride
+        section_headers.append(struct.pack('<QIIIIIIII', 0, file_offset, count, 0, records_end,
+                                           len(ids), 0, 0, len(copies) // 2))
+        section_chunks.extend((records[first_row * stride:(first_row + count) * stride], ids, copy_table))
+        position = records_end + len(ids) + len(copy_table)
+        first_row += count
+
+    header = b'WDC5' + struct.pack('<I', 5) + b'Synthetic'.ljust(128, b'\0')
+    header += struct.pack('<IIIIIIIII', record_count, field_count, stride, 0,
+                          rnd.getrandbits(32), rnd.getrandbits(32), 1, record_count, 0)
+    header += struct.pack('<HH', 0, 0)
+    header += struct.pack('<IIIIIII', field_count, 0, 0, field_count * 24,
+                          len(common_data), len(pallet_data), sections)
+
+    with open(path, 'wb') as f:
+        for chunk in [header] + section_headers + [b''.join(field_info), pallet_data, common_data] + section_chunks:
+            f.write(chunk)
+    return path
+
+
+def write_dbc(path, record_count, field_count=16, string_fields=DEFAULT_STRING_FIELDS, string_count=1000, seed=0):
+    """Записывает файл DBC; поля string_fields ссылаются на строки строкового блока"""
+    rnd = random.Random(seed)
+    strings = [b''] + [f"Строка {i} {rnd.getrandbits(32):08x}".encode('utf-8') for i in range(1, string_count)]
+    string_block = b'\0'.join(strings) + b'\0'
+    offsets = []
+    position = 0
+    for value in strings:
+        offsets.append(position)
+        position += len(value) + 1
+
+    values = array('I', _random_bytes(rnd, record_count * field_count * 4))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    values[0::field_count] = array('I', range(1, record_count + 1))
+    for field_idx in string_fields:
+        if 0 < field_idx < field_count:
+            values[field_idx::field_count] = array('I', (offsets[rnd.randrange(string_count)]
+                                                         for _ in range(record_count)))
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    with open(path, 'wb') as f:
+        f.write(b'WDBC' + struct.pack('<IIII', record_count, field_count, field_count * 4, len(string_block)))
+        f.write(values.tobytes())
+        f.write(string_block)
+    return path
+
+
+def write_file(path, record_count, seed=0, **options):
+    """Выбирает формат по расширению файла (.dbc или .db2)"""
+    if os.path.splitext(path)[1].lower() == '.dbc':
+        return write_dbc(path, record_count, seed=seed, **options)
+    return write_wdc5(path, record_count, seed=seed, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор синтетических файлов DBC/DB2")
+    parser.add_argument('path', help="имя файла (.dbc или .db2)")
+    parser.add_argument('--records', type=int, default=10000, help="количество записей")
+    parser.add_argument('--seed', type=int, default=0, help="начальное число генератора")
+    parser.add_argument('--strings', type=int, default=1000, help="количество строк (только DBC)")
+    parser.add_argument('--sections', type=int, default=1, help="количество секций (только DB2)")
+    args = parser.parse_args(argv)
+    if args.path.lower().endswith('.dbc'):
+        options = {'string_count': args.strings}
+    else:
+        options = {'sections': args.sections}
+    write_file(args.path, args.records, seed=args.seed, **options)
+    print(f"Записан файл: {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+"""Столбцовое хранилище записей DBC/DB2"""
+
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import groupby
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy столбцы хранятся в array
+    np = None
+
+# Типы array для беззнаковых и знаковых значений по возрастанию ширины
+_TYPECODES = [('B', 0xFF), ('H', 0xFFFF), ('I', 0xFFFFFFFF), ('Q', 0xFFFFFFFFFFFFFFFF)]
+_SIGNED_TYPECODES = [('b', 0x7F), ('h', 0x7FFF), ('i', 0x7FFFFFFF), ('q', 0x7FFFFFFFFFFFFFFF)]
+
+# Записей в блоке постраничной таблицы и бюджет памяти декодированных блоков по умолчанию
+DEFAULT_CHUNK_ROWS = 65536
+DEFAULT_PAGE_BUDGET = 256 * 1024 * 1024
+
+
+def _is_numpy(column):
+    return np is not None and isinstance(column, np.ndarray)
+
+
+def make_column(values):
+    """Упаковывает значения столбца в самый компактный контейнер
+
+    Целые значения до 64 бит хранятся в array (или в массиве NumPy,
+    если столбец уже пришёл из NumPy), всё остальное - в обычном списке.
+    """
+    if _is_numpy(values):
+        if values.dtype.kind == 'O':
+            return values.tolist()
+        if len(values) == 0:
+            return values.astype(np.uint8)
+        if values.dtype.kind in 'ui':
+            minimum = int(values.min())
+            maximum = int(values.max())
+            dtypes = ((np.uint8, np.uint16, np.uint32, np.uint64) if minimum >= 0
+                      else (np.int8, np.int16, np.int32, np.int64))
+            for dtype in dtypes:
+                if np.iinfo(dtype).min <= minimum and maximum <= np.iinfo(dtype).max:
+                    if values.dtype == dtype and values.flags.owndata:
+                        # Уже упакованный собственный массив (например, из пула процессов)
+                        return values
+                    # Иначе копируем, чтобы не держать ссылку на буфер файла
+                    return values.astype(dtype)
+        return values.copy()
+
+    if isinstance(values, array):
+        return values
+    values = list(values)
+    if not values:
+        return array('B')
+    if all(isinstance(value, int) for value in values):
+        minimum = min(values)
+        maximum = max(values)
+        if minimum >= 0:
+            for typecode, limit in _TYPECODES:
+                if maximum <= limit:
+                    return array(typecode, values)
+        else:
+            for typecode, limit in _SIGNED_TYPECODES:
+                if -limit - 1 <= minimum and maximum <= limit:
+                    return array(typecode, values)
+    return values
+
+
+def read_uint32_array(view, pos, count):
+    """Читает count беззнаковых 32-битных чисел (little-endian) одним копированием
+
+    Байты за концом буфера считаются нулями.
+    """
+    data = bytearray(count * 4)
+    available = max(0, min(len(view) - pos, len(data)))
+    data[:available] = view[pos:pos + available]
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def uint32_array_bytes(values):
+    """Байты массива array('I') в порядке little-endian"""
+    if sys.byteorder == 'big':
+        values = array('I', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class CommonData:
+    """Общие данные поля: отсортированные ключи и значения с поиском делением пополам
+
+    pairs хранит пары ключ/значение в исходном порядке (вместе с повторами) для записи в файл.
+    """
+
+    def __init__(self, keys=None, values=None, pairs=None):
+        self.keys = keys if keys is not None else array('I')
+        self.values = values if values is not None else array('I')
+        if pairs is None:
+            pairs = array('I', bytes(len(self.keys) * 8))
+            pairs[0::2] = self.keys
+            pairs[1::2] = self.values
+        self.pairs = pairs
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Создаёт таблицу из массива чередующихся ключей и значений
+
+        При повторе ключа действует последнее значение, как при заполнении словаря.
+        """
+        keys = pairs[0::2]
+        values = pairs[1::2]
+        # Устойчивая сортировка, затем из одинаковых ключей оставляем последний
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sorted_keys = array('I')
+        sorted_values = array('I')
+        for i in order:
+            if sorted_keys and sorted_keys[-1] == keys[i]:
+                sorted_values[-1] = values[i]
+            else:
+                sorted_keys.append(keys[i])
+                sorted_values.append(values[i])
+        return cls(sorted_keys, sorted_values, pairs)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __bool__(self):
+        return len(self.keys) > 0
+
+    def __contains__(self, key):
+        position = bisect_left(self.keys, key)
+        return position < len(self.keys) and self.keys[position] == key
+
+    def get(self, key, default=0):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.values[position]
+        return default
+
+    def items(self):
+        return zip(self.keys, self.values)
+
+
+def take_column(column, rows):
+    """Выбирает из столбца значения с заданными номерами записей"""
+    if _is_numpy(column):
+        return column[np.asarray(rows, dtype=np.int64)]
+    return [column[row] for row in rows]
+
+
+def concat_columns(columns):
+    """Объединяет столбцы одного поля из нескольких блоков записей"""
+    if len(columns) == 1:
+        return columns[0]
+    if all(_is_numpy(column) and column.dtype == columns[0].dtype for column in columns):
+        return np.concatenate(columns)
+    if all(isinstance(column, array) and column.typecode == columns[0].typecode for column in columns):
+        values = array(columns[0].typecode)
+        for column in columns:
+            values.extend(column)
+        return values
+    values = []
+    for column in columns:
+        values.extend(column.tolist() if _is_numpy(column) else column)
+    return values
+
+
+class RecordRow:
+    """Представление одной записи таблицы без копирования значений"""
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __len__(self):
+        return self._table.field_count
+
+    def __getitem__(self, field_index):
+        if isinstance(field_index, slice):
+            return [self._table.get(self._index, i) for i in range(self._table.field_count)[field_index]]
+        if field_index < 0:
+            field_index += self._table.field_count
+        if not 0 <= field_index < self._table.field_count:
+            raise IndexError("Неверный индекс поля")
+        return self._table.get(self._index, field_index)
+
+    def __setitem__(self, field_index, value):
+        if not self._table.update_record(self._index, field_index, value):
+            raise IndexError("Неверный индекс поля")
+
+    def __iter__(self):
+        for field_index in range(self._table.field_count):
+            yield self._table.get(self._index, field_index)
+
+    def __eq__(self, other):
+        if isinstance(other, (RecordRow, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    @property
+    def index(self):
+        return self._index
+
+    def to_list(self):
+        return list(self)
+
+
+class RecordTable:
+    """Таблица записей, в которой каждое поле хранится отдельным столбцом"""
+
+    def __init__(self, columns=None, row_count=None):
+        self.columns = [make_column(column) for column in (columns or [])]
+        if row_count is None:
+            row_count = len(self.columns[0]) if self.columns else 0
+        self.row_count = row_count
+
+    @classmethod
+    def from_rows(cls, rows, field_count=None):
+        """Создаёт таблицу из списка записей (списков значений)"""
+        rows = list(rows)
+        if field_count is None:
+            field_count = len(rows[0]) if rows else 0
+        columns = [[row[i] for row in rows] for i in range(field_count)]
+        return cls(columns, len(rows))
+
+    @classmethod
+    def from_columns(cls, columns, row_count):
+        """Создаёт таблицу из уже упакованных столбцов без копирования (например, отображённых из кеша)"""
+        table = cls()
+        table.columns = list(columns)
+        table.row_count = row_count
+        return table
+
+    @property
+    def field_count(self):
+        return len(self.columns)
+
+    def __len__(self):
+        return self.row_count
+
+    def __bool__(self):
+        return self.row_count > 0
+
+    def __iter__(self):
+        for index in range(self.row_count):
+            yield RecordRow(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.row_count)
+            return RecordTable([column[start:stop:step] for column in self.columns],
+                               len(range(start, stop, step)))
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("Неверный индекс записи")
+        return RecordRow(self, index)
+
+    def take(self, rows):
+        """Новая таблица из записей с заданными номерами"""
+        rows = list(rows)
+        return RecordTable([take_column(column, rows) for column in self.columns], len(rows))
+
+    def get(self, record_index, field_index):
+        """Возвращает значение поля как обычное целое Python"""
+        value = self.columns[field_index][record_index]
+        return int(value) if _is_numpy(self.columns[field_index]) else value
+
+    def column(self, field_index):
+        """Столбец поля целиком"""
+        return self.columns[field_index]
+
+    def iter_chunks(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Блоки записей: пары (номер первой записи, таблица блока)"""
+        for start in range(0, self.row_count, chunk_rows):
+            stop = min(start + chunk_rows, self.row_count)
+            # Срезы без перепаковки: у всех блоков те же типы столбцов, что и у таблицы
+            yield start, RecordTable.from_columns([column[start:stop] for column in self.columns], stop - start)
+
+    def iter_rows(self):
+        """Итерирует записи как кортежи значений"""
+        if not self.columns:
+            return iter([() for _ in range(self.row_count)])
+        columns = [column.tolist() if _is_numpy(column) else column for column in self.columns]
+        return zip(*columns)
+
+    def to_rows(self):
+        """Возвращает копию таблицы в виде списка списков"""
+        return [list(row) for row in self.iter_rows()]
+
+    def update_record(self, record_index, field_index, new_value):
+        if not (0 <= record_index < self.row_count and 0 <= field_index < self.field_count):
+            return False
+        column = self.columns[field_index]
+        try:
+            column[record_index] = new_value
+            if _is_numpy(column) and int(column[record_index]) != new_value:
+                raise OverflowError(new_value)
+        except (OverflowError, TypeError, ValueError):
+            # Значение не помещается в тип столбца - переводим столбец в список
+            column = column.tolist() if _is_numpy(column) else list(column)
+            column[record_index] = new_value
+            self.columns[field_index] = column
+        return True
+
+    def copy(self):
+        return RecordTable([column.copy() if _is_numpy(column) else column[:] for column in self.columns],
+                           self.row_count)
+
+    def memory_usage(self):
+        """Отчёт об используемой памяти в байтах по столбцам и в сумме"""
+        columns = []
+        for column in self.columns:
+            if _is_numpy(column):
+                size = column.nbytes
+            elif isinstance(column, array):
+                size = column.itemsize * len(column)
+            else:
+                size = sys.getsizeof(column) + sum(sys.getsizeof(value) for value in column)
+            columns.append(size)
+        return {
+            'rows': self.row_count,
+            'fields': self.field_count,
+            'columns': columns,
+            'total': sum(columns)
+        }
+
+
+class PagedRecordTable:
+    """Таблица записей, которая декодируется блоками по требованию
+
+    decode(start, stop, fields) возвращает столбцы записей [start, stop) для полей fields
+    (None - все поля). Декодированные блоки хранятся в LRU-кеше размером не больше max_bytes
+    (последний использованный блок остаётся всегда). Изменённые значения хранятся отдельно
+    и накладываются на блок при каждом декодировании, поэтому вытеснение их не теряет.
+    """
+
+    def __init__(self, decode, row_count, field_count, chunk_rows=DEFAULT_CHUNK_ROWS, max_bytes=DEFAULT_PAGE_BUDGET):
+        self._decode = decode
+        self.row_count = row_count
+        self._field_count = field_count
+        self.chunk_rows = max(1, chunk_rows)
+        self.max_bytes = max_bytes
+        self._chunks = OrderedDict()
+        self._chunk_bytes = {}
+        self._bytes = 0
+        # Изменённые значения по блокам: номер блока -> {(запись, поле): значение}
+        self._edits = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def field_count(self):
+        return self._field_count
+
+    def __len__(self):
+        return self.row_count
+
+    def __bool__(self):
+        return self.row_count > 0
+
+    def __iter__(self):
+        for index in range(self.row_count):
+            yield RecordRow(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(self.row_count)))
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("Неверный индекс записи")
+        return RecordRow(self, index)
+
+    def _apply_edits(self, number, table):
+        start = number * self.chunk_rows
+        for (record_index, field_index), value in self._edits.get(number, {}).items():
+            table.update_record(record_index - start, field_index, value)
+
+    def chunk(self, number):
+        """Таблица блока с данным номером; блок декодируется, если его нет в кеше"""
+        table = self._chunks.get(number)
+        if table is not None:
+            self._chunks.move_to_end(number)
+            self.hits += 1
+            return table
+        self.misses += 1
+        start = number * self.chunk_rows
+        stop = min(start + self.chunk_rows, self.row_count)
+        columns = self._decode(start, stop, None)
+        # Столбцы упаковываются так же, как при чтении таблицы целиком
+        table = RecordTable([columns[field_index] for field_index in range(self._field_count)], stop - start)
+        self._apply_edits(number, table)
+        size = table.memory_usage()['total']
+        self._chunks[number] = table
+        self._chunk_bytes[number] = size
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._chunks) > 1:
+            evicted, _ = self._chunks.popitem(last=False)
+            self._bytes -= self._chunk_bytes.pop(evicted)
+        return table
+
+    def get(self, record_index, field_index):
+        number, local = divmod(record_index, self.chunk_rows)
+        return self.chunk(number).get(local, field_index)
+
+    def update_record(self, record_index, field_index, new_value):
+        if not (0 <= record_index < self.row_count and 0 <= field_index < self._field_count):
+            return False
+        number, local = divmod(record_index, self.chunk_rows)
+        self.chunk(number).update_record(local, field_index, new_value)
+        self._edits.setdefault(number, {})[(record_index, field_index)] = new_value
+        return True
+
+    def column(self, field_index):
+        """Столбец одного поля целиком: декодируется только это поле, кеш блоков не заполняется"""
+        parts = []
+        for number, start in enumerate(range(0, self.row_count, self.chunk_rows)):
+            stop = min(start + self.chunk_rows, self.row_count)
+            part = self._decode(start, stop, [field_index])[field_index]
+            edits = [(record_index - start, value) for (record_index, edited_field), value
+                     in self._edits.get(number, {}).items() if edited_field == field_index]
+            if edits:
+                part = part.tolist() if _is_numpy(part) else list(part)
+                for local, value in edits:
+                    part[local] = value
+                part = make_column(part)
+            parts.append(part)
+        return make_column(concat_columns(parts)) if parts else make_column([])
+
+    def rows_table(self, start, stop):
+        """Записи [start, stop) отдельной таблицей с учётом правок, в обход кеша блоков"""
+        columns = self._decode(start, stop, None)
+        # Столбцы упаковываются так же, как при чтении таблицы целиком
+        table = RecordTable([columns[field_index] for field_index in range(self._field_count)], stop - start)
+        for number in range(start // self.chunk_rows, (stop - 1) // self.chunk_rows + 1):
+            for (record_index, field_index), value in self._edits.get(number, {}).items():
+                if start <= record_index < stop:
+                    table.update_record(record_index - start, field_index, value)
+        return table
+
+    def iter_chunks(self, chunk_rows=None):
+        """Блоки записей по порядку: пары (номер первой записи, таблица блока)
+
+        Без chunk_rows блоки берутся через кеш; с chunk_rows декодируются заново
+        и в кеш не попадают (для однократного просмотра всей таблицы).
+        """
+        if chunk_rows is None:
+            for number, start in enumerate(range(0, self.row_count, self.chunk_rows)):
+                yield start, self.chunk(number)
+            return
+        for start in range(0, self.row_count, chunk_rows):
+            yield start, self.rows_table(start, min(start + chunk_rows, self.row_count))
+
+    def iter_rows(self):
+        for start, table in self.iter_chunks():
+            yield from table.iter_rows()
+
+    def to_rows(self):
+        return [list(row) for row in self.iter_rows()]
+
+    def take(self, rows):
+        """Новая таблица (RecordTable) из записей с заданными номерами"""
+        parts = []
+        for number, group in groupby(rows, key=lambda row: row // self.chunk_rows):
+            start = number * self.chunk_rows
+            parts.append(self.chunk(number).take([row - start for row in group]))
+        if not parts:
+            return RecordTable([[] for _ in range(self._field_count)], 0)
+        return RecordTable.from_columns([concat_columns([part.columns[field_index] for part in parts])
+                                         for field_index in range(self._field_count)],
+                                        sum(len(part) for part in parts))
+
+    @property
+    def columns(self):
+        """Все столбцы целиком: декодирует всю таблицу, нужно только для полной перезаписи и сравнения"""
+        return self.copy().columns
+
+    def copy(self):
+        """Вся таблица в памяти (RecordTable)"""
+        tables = [table for start, table in self.iter_chunks()]
+        if not tables:
+            return RecordTable([[] for _ in range(self._field_count)], 0)
+        return RecordTable.from_columns([concat_columns([table.columns[field_index] for table in tables])
+                                         for field_index in range(self._field_count)], self.row_count)
+
+    def commit(self):
+        """Забывает изменения после сохранения: значения теперь в файле"""
+        self._edits = {}
+
+    def clear_cache(self):
+        """Освобождает декодированные блоки (изменения сохраняются)"""
+        self._chunks.clear()
+        self._chunk_bytes.clear()
+        self._bytes = 0
+
+    def memory_usage(self):
+        """Память декодированных блоков в кеше; отчёт в том же виде, что и у RecordTable"""
+        columns = [0] * self._field_count
+        for table in self._chunks.values():
+            for field_index, size in enumerate(table.memory_usage()['columns']):
+                columns[field_index] += size
+        return {
+            'rows': self.row_count,
+            'fields': self._field_count,
+            'columns': columns,
+            'total': self._bytes,
+            'chunks': len(self._chunks),
+        }
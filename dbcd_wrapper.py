@@ -1,8 +1,77 @@
 import subprocess
 import json
+import logging
 import os
 import struct
 import shutil
+import mmap
+import threading
+import traceback
+from array import array
+from queue import Queue, Full
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import dbcd_numpy
+import dbcd_decoder
+import dbcd_parallel
+from dbcd_table import (RecordTable, PagedRecordTable, CommonData, read_uint32_array, uint32_array_bytes,
+                        take_column, concat_columns, DEFAULT_CHUNK_ROWS)
+from dbcd_query import Query, QueryError
+from dbcd_search import IdIndex
+from dbcd_diff import iter_diff, DEFAULT_CHUNK_SIZE
+from dbcd_journal import EditJournal
+from dbcd_strings import StringTable
+from dbcd_stats import LoadStats
+
+log = logging.getLogger('dbcd')
+
+
+class LoadCancelled(Exception):
+    """Загрузка файла отменена пользователем"""
+
+
+def _prefetched(items, depth):
+    """Перебирает items в фоновом потоке на depth элементов вперёд
+
+    Пока вызывающий обрабатывает очередной элемент, следующий уже готовится.
+    Ошибка фонового потока передаётся вызывающему; закрытие генератора останавливает поток.
+    """
+    queue = Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
 
 class DBCDWrapper:
     # Типы сжатия
@@ -21,19 +90,83 @@ class DBCDWrapper:
     COMPRESSION_BITPACKED_INDEXED = 34
     COMPRESSION_BITPACKED_INDEXED_ARRAY = 35
 
-    def __init__(self, file_path):
+    # Заголовок секции (40 байт) и имена его полей по порядку
+    SECTION_HEADER = struct.Struct('<QIIIIIIII')
+    SECTION_FIELDS = ('tact_key_lookup', 'file_offset', 'num_records', 'string_table_size', 'offset_records_end',
+                      'index_data_size', 'parent_lookup_size', 'offset_map_id_count', 'copy_table_count')
+
+    # Битово упакованные типы: значение извлекается из битов записи
+    BITPACKED_TYPES = (COMPRESSION_BITPACKED, COMPRESSION_BITPACKED_SIGNED,
+                       COMPRESSION_BITPACKED_INDEXED, COMPRESSION_BITPACKED_INDEXED_ARRAY)
+
+    def __init__(self, file_path, engine='auto', cache=None, memory_budget=None, processes=None):
         self.file_path = file_path
+        # Движок декодирования: 'python', 'numpy' или 'auto' (NumPy, если установлен)
+        self.engine = engine
+        # Кеш декодированных записей на диске (dbcd_cache.ParseCache) или None
+        self.cache = cache
+        # Бюджет памяти (байт) постраничного режима: записи декодируются блоками по требованию
+        # из отображения файла (PagedRecordTable); None - вся таблица декодируется при чтении
+        self.memory_budget = memory_budget
+        # Число процессов декодирования одной таблицы движком NumPy (dbcd_parallel):
+        # None - по числу ядер для таблиц от dbcd_parallel.MIN_PARALLEL_ROWS записей, 1 - без пула
+        self.processes = processes
+        # Отображение файла, из которого читает постраничная таблица
+        self._page_map = None
+        # Записи последнего чтения взяты из кеша
+        self.from_cache = False
         self._validate_file()
         self.file_type = os.path.splitext(file_path)[1].lower()
         self.header = None
-        self.records = []
-        self.string_block = []
+        self.records = RecordTable()
+        self.string_block = StringTable()
         self.field_count = 0  # Добавляем поле для хранения количества полей
         self.pallet_data = {}
         self.common_data = {}
         self.sparse_data = {}
         self.bitpacked_data = {}
+        # Данные секций DB2 после записей: строковая таблица, список ID, таблица копий
+        self.section_data = []
+        # ID записей из списков ID секций (None, если их нет) и пары (новый ID, ID источника) таблиц копий
+        self.record_ids = None
+        self.copy_table = array('I')
+        # Индекс записей по ID (dbcd_search.IdIndex), строится после чтения и после правки ID
+        self.id_index = None
+        # Обратный вызов прогресса: progress(phase, done, total)
+        self.progress_callback = None
+        self._cancel_requested = False
+        # Номера записей файла, загруженных с фильтром (None - загружены все записи)
+        self.loaded_rows = None
+        # Изменённые ячейки (запись, поле) с момента чтения или последнего сохранения
+        self.dirty = set()
+        # Журнал правок для отмены и повтора: хранит только изменённые значения
+        self.journal = EditJournal()
+        # Расположение записей в файле: (начало записей, шаг записи, план декодирования)
+        self._record_layout = None
+        # Блоки записей по секциям: (номера первых записей, смещения в файле, числа записей)
+        self._segments = None
+        # Начало данных палитры, общих данных и записей DB2 в файле
+        self._data_offset = None
+        # Время, объём данных и память по этапам последнего чтения и сохранения
+        self.stats = LoadStats()
+        # Размер и время изменения файла при чтении: по ним видно, что файл не менялся
+        self._file_stat = None
     
+    def cancel(self):
+        """Запрашивает отмену текущей загрузки (можно вызывать из другого потока)"""
+        self._cancel_requested = True
+
+    @staticmethod
+    def _no_progress(phase, done, total):
+        """Ход вне загрузки (сохранение, постраничное чтение) не сообщается и не отменяется"""
+
+    def _report_progress(self, phase, done, total):
+        """Сообщает о ходе загрузки и прерывает её, если запрошена отмена"""
+        if self._cancel_requested:
+            raise LoadCancelled("Загрузка файла отменена")
+        if self.progress_callback is not None:
+            self.progress_callback(phase, done, total)
+
     def _validate_file(self):
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"Файл {self.file_path} не найден")
@@ -91,62 +224,48 @@ class DBCDWrapper:
         pallet_data_size = struct.unpack('<I', file.read(4))[0]
         sections_count = struct.unpack('<I', file.read(4))[0]
 
-        # Если есть секции, читаем первую секцию
-        section_header = None
-        if sections_count > 0:
-            tact_key_lookup = struct.unpack('<Q', file.read(8))[0]
-            file_offset = struct.unpack('<I', file.read(4))[0]
-            num_records = struct.unpack('<I', file.read(4))[0]
-            string_table_size = struct.unpack('<I', file.read(4))[0]
-            offset_records_end = struct.unpack('<I', file.read(4))[0]
-            index_data_size = struct.unpack('<I', file.read(4))[0]
-            parent_lookup_size = struct.unpack('<I', file.read(4))[0]
-            offset_map_id_count = struct.unpack('<I', file.read(4))[0]
-            copy_table_count = struct.unpack('<I', file.read(4))[0]
-            section_header = {
-                'tact_key_lookup': tact_key_lookup,
-                'file_offset': file_offset,
-                'num_records': num_records,
-                'string_table_size': string_table_size,
-                'offset_records_end': offset_records_end,
-                'index_data_size': index_data_size,
-                'parent_lookup_size': parent_lookup_size,
-                'offset_map_id_count': offset_map_id_count,
-                'copy_table_count': copy_table_count
-            }
+        # Заголовки всех секций идут подряд сразу за заголовком файла
+        sections = []
+        for _ in range(sections_count):
+            data = file.read(self.SECTION_HEADER.size)
+            if len(data) < self.SECTION_HEADER.size:
+                raise ValueError(f"Файл обрезан: прочитано заголовков секций {len(sections)} из {sections_count}")
+            sections.append(dict(zip(self.SECTION_FIELDS, self.SECTION_HEADER.unpack(data))))
+        section_header = sections[0] if sections else None
         
-        print(f"Сигнатура файла: {signature}")
-        print(f"Версия: {version}")
-        print(f"Схема: {schema_string}")
-        print(f"Количество записей: {record_count}")
-        print(f"Количество полей: {field_count}")
-        print(f"Размер записи: {record_size} байт")
-        print(f"Размер строковой таблицы: {string_table_size} байт")
-        print(f"Хеш таблицы: 0x{table_hash:08x}")
-        print(f"Хеш макета: 0x{layout_hash:08x}")
-        print(f"Диапазон ID: {min_id} - {max_id}")
-        print(f"Локаль: {locale}")
-        print(f"Флаги: 0x{flags:04x}")
-        print(f"Индекс ID: {id_index}")
-        print(f"Всего полей: {total_field_count}")
-        print(f"Смещение упакованных данных: {bitpacked_data_offset}")
-        print(f"Количество полей для поиска: {lookup_column_count}")
-        print(f"Размер информации о хранении полей: {field_storage_info_size}")
-        print(f"Размер общих данных: {common_data_size}")
-        print(f"Размер данных палитры: {pallet_data_size}")
-        print(f"Количество секций: {sections_count}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Сигнатура файла: {signature}")
+            log.debug(f"Версия: {version}")
+            log.debug(f"Схема: {schema_string}")
+            log.debug(f"Количество записей: {record_count}")
+            log.debug(f"Количество полей: {field_count}")
+            log.debug(f"Размер записи: {record_size} байт")
+            log.debug(f"Размер строковой таблицы: {string_table_size} байт")
+            log.debug(f"Хеш таблицы: 0x{table_hash:08x}")
+            log.debug(f"Хеш макета: 0x{layout_hash:08x}")
+            log.debug(f"Диапазон ID: {min_id} - {max_id}")
+            log.debug(f"Локаль: {locale}")
+            log.debug(f"Флаги: 0x{flags:04x}")
+            log.debug(f"Индекс ID: {id_index}")
+            log.debug(f"Всего полей: {total_field_count}")
+            log.debug(f"Смещение упакованных данных: {bitpacked_data_offset}")
+            log.debug(f"Количество полей для поиска: {lookup_column_count}")
+            log.debug(f"Размер информации о хранении полей: {field_storage_info_size}")
+            log.debug(f"Размер общих данных: {common_data_size}")
+            log.debug(f"Размер данных палитры: {pallet_data_size}")
+            log.debug(f"Количество секций: {sections_count}")
         
-        if section_header:
-            print(f"\nИнформация о секции:")
-            print(f"TACT ключ: 0x{section_header['tact_key_lookup']:016x}")
-            print(f"Смещение файла: {section_header['file_offset']}")
-            print(f"Количество записей: {section_header['num_records']}")
-            print(f"Размер строковой таблицы: {section_header['string_table_size']}")
-            print(f"Смещение конца записей: {section_header['offset_records_end']}")
-            print(f"Размер индексных данных: {section_header['index_data_size']}")
-            print(f"Размер родительского поиска: {section_header['parent_lookup_size']}")
-            print(f"Количество ID в карте смещений: {section_header['offset_map_id_count']}")
-            print(f"Количество копируемых таблиц: {section_header['copy_table_count']}")
+            for number, section in enumerate(sections):
+                log.debug(f"Информация о секции {number}:")
+                log.debug(f"TACT ключ: 0x{section['tact_key_lookup']:016x}")
+                log.debug(f"Смещение файла: {section['file_offset']}")
+                log.debug(f"Количество записей: {section['num_records']}")
+                log.debug(f"Размер строковой таблицы: {section['string_table_size']}")
+                log.debug(f"Смещение конца записей: {section['offset_records_end']}")
+                log.debug(f"Размер индексных данных: {section['index_data_size']}")
+                log.debug(f"Размер родительского поиска: {section['parent_lookup_size']}")
+                log.debug(f"Количество ID в карте смещений: {section['offset_map_id_count']}")
+                log.debug(f"Количество копируемых таблиц: {section['copy_table_count']}")
         
         return {
             'signature': signature,
@@ -170,7 +289,8 @@ class DBCDWrapper:
             'common_data_size': common_data_size,
             'pallet_data_size': pallet_data_size,
             'sections_count': sections_count,
-            'section_header': section_header
+            'section_header': section_header,
+            'sections': sections
         }
     
     def _read_field_info(self, file):
@@ -205,16 +325,17 @@ class DBCDWrapper:
                 field['cell_size'] = 0
 
             field_info.append(field)
-            print(f"Поле {i}:")
-            print(f"  Смещение: {field['offset']} (исходное)")
-            print(f"  Размер: {field['size']} байт")
-            print(f"  Тип сжатия: {field['compression_type']}")
-            if field['compression_type'] in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY]:
-                print(f"  Размер палитры: {field['additional_data_size'] // 4}")
-            elif field['compression_type'] in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
-                print(f"  Размер общих данных: {field['additional_data_size'] // 8}")
-            elif field['compression_type'] in [self.COMPRESSION_IMMEDIATE, self.COMPRESSION_SIGNED_IMMEDIATE]:
-                print(f"  Значение: {field['packed_offset']}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"Поле {i}:")
+                log.debug(f"  Смещение: {field['offset']} (исходное)")
+                log.debug(f"  Размер: {field['size']} байт")
+                log.debug(f"  Тип сжатия: {field['compression_type']}")
+                if field['compression_type'] in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY]:
+                    log.debug(f"  Размер палитры: {field['additional_data_size'] // 4}")
+                elif field['compression_type'] in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
+                    log.debug(f"  Размер общих данных: {field['additional_data_size'] // 8}")
+                elif field['compression_type'] in [self.COMPRESSION_IMMEDIATE, self.COMPRESSION_SIGNED_IMMEDIATE]:
+                    log.debug(f"  Значение: {field['packed_offset']}")
             
         return field_info
 
@@ -242,19 +363,450 @@ class DBCDWrapper:
                 })
             return field_info
 
-    def _read_records(self, f):
-        """Читает записи из файла"""
-        print("\nНачинаю чтение записей...")
-        print(f"Ожидаемое количество записей: {self.header['record_count']}")
-        print(f"Количество полей: {self.header['field_count']}")
+    # Распаковщики для полей стандартной ширины
+    _UNPACKERS = {
+        1: struct.Struct('<B').unpack_from,
+        2: struct.Struct('<H').unpack_from,
+        4: struct.Struct('<I').unpack_from,
+        8: struct.Struct('<Q').unpack_from,
+    }
+
+    def _map_file(self):
+        """Отображает файл в память (только чтение)"""
+        with open(self.file_path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_uint(self, view, pos, size):
+        """Читает беззнаковое целое из буфера, за концом буфера байты считаются нулями"""
+        end = len(view)
+        if pos + size <= end:
+            unpack = self._UNPACKERS.get(size)
+            if unpack is not None:
+                return unpack(view, pos)[0]
+            return int.from_bytes(view[pos:pos + size], byteorder='little', signed=False)
+        if pos >= end:
+            return 0
+        return int.from_bytes(view[pos:end], byteorder='little', signed=False)
+
+    def _build_record_layout(self):
+        """Вычисляет смещения полей внутри записи и шаг записи в байтах"""
+        layout = []
+        offset = 0
+        for field_idx in range(self.header['field_count']):
+            field = self.field_info[field_idx]
+            compression_type = field['compression_type']
+            # Непосредственные значения не занимают места в записи
+            if compression_type in [self.COMPRESSION_IMMEDIATE, self.COMPRESSION_SIGNED_IMMEDIATE]:
+                layout.append((field_idx, compression_type, None, 0, None))
+                continue
+            layout.append((field_idx, compression_type, offset, field['size'], self._UNPACKERS.get(field['size'])))
+            offset += field['size']
+        return layout, offset
+
+    def _build_decode_plan(self, layout, pallet_data, common_data):
+        """Описывает каждое поле для векторизованного движка: (вид, смещение, размер, данные)"""
+        plan = []
+        for field_idx, compression_type, offset, size, unpack in layout:
+            field = self.field_info[field_idx]
+            if offset is None:
+                plan.append(('immediate', 0, 0, field['packed_offset']))
+            elif compression_type in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
+                plan.append(('common', offset, size, common_data[field_idx]))
+            elif compression_type in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY]:
+                plan.append(('pallet', offset, size, pallet_data[field_idx]))
+            elif compression_type in [self.COMPRESSION_BIT_PACKED, self.COMPRESSION_ARRAY_2]:
+                mask = (1 << field['cell_size']) - 1 if field['cell_size'] > 0 else 0
+                plan.append(('masked', offset, size, mask))
+            elif compression_type in self.BITPACKED_TYPES:
+                plan.append(('bits', offset, size, self._bit_field(field, pallet_data.get(field_idx))))
+            else:
+                plan.append(('raw', offset, size, None))
+        return plan
+
+    def _bit_field(self, field, pallet):
+        """Параметры битово упакованного поля
+
+        Значение занимает cell_size бит, начиная с бита
+        bitpacked_data_offset * 8 + packed_offset от начала записи.
+        """
+        compression_type = field['compression_type']
+        indexed = compression_type in [self.COMPRESSION_BITPACKED_INDEXED, self.COMPRESSION_BITPACKED_INDEXED_ARRAY]
+        return {
+            'bit_offset': self.header.get('bitpacked_data_offset', 0) * 8 + field['packed_offset'],
+            'width': field['cell_size'],
+            'signed': compression_type == self.COMPRESSION_BITPACKED_SIGNED,
+            'pallet': (pallet or []) if indexed else None,
+            'cardinality': max(1, field['cardinality']) if compression_type == self.COMPRESSION_BITPACKED_INDEXED_ARRAY else None
+        }
+
+    def _resolve_bits(self, values, bits):
+        """Применяет к извлечённым битам знаковое расширение и поиск в палитре"""
+        width = bits['width']
+        if bits['signed'] and width > 0:
+            sign = 1 << (width - 1)
+            full = 1 << width
+            return [value - full if value & sign else value for value in values]
+        pallet = bits['pallet']
+        if pallet is None:
+            return values
+        cardinality = bits['cardinality']
+        if cardinality is None:
+            pallet_size = len(pallet)
+            return [pallet[value] if value < pallet_size else 0 for value in values]
+        # Индексированный массив: индекс выбирает cardinality подряд идущих значений палитры
+        array_count = len(pallet) // cardinality
+        empty = (0,) * cardinality
+        return [tuple(pallet[value * cardinality:(value + 1) * cardinality]) if value < array_count else empty
+                for value in values]
+
+    def _use_numpy(self, plan):
+        """Решает, декодировать ли записи векторизованным движком"""
+        if self.engine == 'python':
+            return False
+        if self.engine == 'numpy' and not dbcd_numpy.HAS_NUMPY:
+            raise RuntimeError("Движок 'numpy' недоступен: библиотека NumPy не установлена")
+        return dbcd_numpy.supports(plan)
+
+    def _decode_column(self, view, pos, record_count, stride, kind, offset, size, payload, rows=None):
+        """Декодирует один столбец всех (или только выбранных) записей движком на чистом Python"""
+        if kind == 'immediate':
+            return [payload] * (record_count if rows is None else len(rows))
+
+        if kind == 'bits':
+            record_positions = (range(pos, pos + record_count * stride, stride) if rows is None
+                                else [pos + row * stride for row in rows])
+            values = [self._read_bits(view, p, stride, payload['bit_offset'], payload['width'])
+                      for p in record_positions]
+            return self._resolve_bits(values, payload)
+
+        start = pos + offset
+        unpack = self._UNPACKERS.get(size)
+        if rows is not None:
+            # Выборочное чтение: записи за концом буфера читаются с дополнением нулями
+            limit = len(view) - size
+            positions = [start + row * stride for row in rows]
+            if unpack is not None:
+                values = [unpack(view, p)[0] if p <= limit else self._read_uint(view, p, size) for p in positions]
+            else:
+                values = [self._read_uint(view, p, size) for p in positions]
+        else:
+            # Количество записей, у которых поле целиком лежит в буфере
+            available = len(view) - start - size
+            full_rows = min(record_count, available // stride + 1) if available >= 0 else 0
+            stop = start + full_rows * stride
+
+            if unpack is not None:
+                values = [unpack(view, p)[0] for p in range(start, stop, stride)]
+            else:
+                values = [int.from_bytes(view[p:p + size], byteorder='little', signed=False)
+                          for p in range(start, stop, stride)]
+            # Хвост обрезанного файла: недостающие байты считаются нулями
+            values.extend(self._read_uint(view, p, size)
+                          for p in range(stop, start + record_count * stride, stride))
+
+        if kind == 'common':
+            get = payload.get
+            values = [get(value, 0) for value in values]
+        elif kind == 'pallet':
+            pallet_size = len(payload)
+            values = [payload[value] if value < pallet_size else 0 for value in values]
+        elif kind == 'masked' and payload:
+            values = [value & payload for value in values]
+        return values
+
+    def _decode_columns(self, view, pos, record_count, stride, plan, use_numpy, fields=None, rows=None,
+                        progress=None):
+        """Декодирует столбцы выбранных полей (по умолчанию всех) и возвращает словарь поле -> столбец"""
+        if fields is None:
+            fields = range(len(plan))
+        if progress is None:
+            progress = self._report_progress
+        # Декодер структуры компилируется один раз на процесс (dbcd_decoder)
+        decoder = dbcd_decoder.compile_decoder(self.header.get('layout_hash', 0) if self.header else 0,
+                                               stride, plan)
+        if use_numpy:
+            return dbcd_numpy.decode_columns(view, pos, record_count, stride, plan, progress=progress,
+                                             rows=rows, fields=fields, dtype=decoder.record_dtype)
+        # Поля в байтах записи распаковываются одним struct за проход, остальные - по одному
+        columns = decoder.decode(view, pos, record_count, plan, fields, progress) if rows is None else {}
+        for done, field_idx in enumerate(fields):
+            if field_idx in columns:
+                continue
+            progress('records', done, len(fields))
+            columns[field_idx] = self._decode_column(view, pos, record_count, stride, *plan[field_idx], rows=rows)
+        return columns
+
+    def _decode_segment(self, view, pos, record_count, stride, plan, use_numpy, where=None, progress=None):
+        """Декодирует один непрерывный блок записей: (столбцы по порядку полей, номера отобранных записей)
+
+        С фильтром остальные поля читаются только для подходящих записей; без фильтра номера - None.
+        """
+        selected = None
+        filter_columns = {}
+        if where is not None:
+            filter_columns = self._decode_columns(view, pos, record_count, stride, plan, use_numpy,
+                                                  fields=where.fields, progress=progress)
+            selected = where.matching_rows(filter_columns, record_count)
+
+        remaining = [field_idx for field_idx in range(len(plan)) if field_idx not in filter_columns]
+        columns = self._decode_columns(view, pos, record_count, stride, plan, use_numpy,
+                                       fields=remaining, rows=selected, progress=progress)
+        for field_idx, column in filter_columns.items():
+            columns[field_idx] = take_column(column, selected)
+        return [columns[field_idx] for field_idx in range(len(plan))], selected
+
+    def _decode_segments(self, view, segments, stride, plan, use_numpy, where=None, progress=None):
+        """Декодирует блоки записей секций (списки (смещение, число записей)) и объединяет их
+
+        Секции NumPy декодируются параллельно в пуле потоков над общим отображением файла:
+        NumPy отпускает GIL на копировании и преобразовании массивов.
+        progress по умолчанию - ход загрузки с проверкой её отмены.
+        Возвращает (столбцы, номера отобранных записей во всей таблице или None).
+        """
+        loading = progress is None
+        if loading:
+            progress = self._report_progress
+        processes = self._decode_processes(segments, use_numpy, where)
+        if processes > 1:
+            try:
+                return self._decode_parallel(view, segments, stride, plan, processes, progress), None
+            except (dbcd_parallel.BrokenProcessPool, OSError) as e:
+                # Процесс пула завершился аварийно или не удалось выделить общую память
+                log.warning("Пул процессов недоступен (%s), записи декодируются в этом процессе", e)
+                # Кадры трассировки держат ссылки на отображение файла, пока живут задания пула
+                traceback.clear_frames(e.__traceback__)
+        if len(segments) == 1:
+            return self._decode_segment(view, *segments[0], stride, plan, use_numpy, where, progress)
+
+        parts = [None] * len(segments)
+        abort = threading.Event()
+
+        def check_cancelled(phase, done, total):
+            # Потоки секций о ходе загрузки не сообщают, только проверяют отмену
+            if abort.is_set() or (loading and self._cancel_requested):
+                raise LoadCancelled("Загрузка файла отменена")
+
+        workers = min(len(segments), os.cpu_count() or 1) if use_numpy else 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._decode_segment, view, pos, count, stride, plan, use_numpy, where,
+                                       check_cancelled): number
+                       for number, (pos, count) in enumerate(segments)}
+            try:
+                for done, future in enumerate(as_completed(futures)):
+                    parts[futures[future]] = future.result()
+                    progress('records', done + 1, len(segments))
+            except BaseException:
+                # Остальные секции прерываются при первой ошибке или отмене
+                abort.set()
+                raise
+
+        columns = [concat_columns([part[0][field_idx] for part in parts]) for field_idx in range(len(plan))]
+        if where is None:
+            return columns, None
+        selected = []
+        first_row = 0
+        for (pos, count), (part_columns, part_selected) in zip(segments, parts):
+            selected.extend(first_row + row for row in part_selected)
+            first_row += count
+        return columns, selected
+
+    def _decode_processes(self, segments, use_numpy, where):
+        """Число процессов для декодирования записей; 1 - в текущем процессе"""
+        if not use_numpy or where is not None:
+            return 1
+        if self.processes is not None:
+            return max(1, self.processes)
+        return dbcd_parallel.default_processes(sum(count for pos, count in segments))
+
+    def _decode_parallel(self, view, segments, stride, plan, processes, progress):
+        """Декодирует все записи в пуле процессов над общей памятью; возвращает столбцы по порядку полей
+
+        Поля-массивы битовых палитр (значения - кортежи) в общую память не помещаются
+        и декодируются в текущем процессе.
+        """
+        shared = [field_idx for field_idx, entry in enumerate(plan) if dbcd_parallel.shareable(entry)]
+        log.info("Записи декодируются в %d процессах", processes)
+        columns = dbcd_parallel.decode_segments(self.file_path, segments, stride, plan,
+                                                self.header.get('layout_hash', 0), shared, processes,
+                                                progress=progress)
+        rest = [field_idx for field_idx in range(len(plan)) if field_idx not in columns]
+        if rest:
+            parts = [self._decode_columns(view, pos, count, stride, plan, True, fields=rest, progress=progress)
+                     for pos, count in segments]
+            for field_idx in rest:
+                columns[field_idx] = concat_columns([part[field_idx] for part in parts])
+        return [columns[field_idx] for field_idx in range(len(plan))]
+
+    def _decode_table(self, view, segments, stride, plan, use_numpy, where=None):
+        """Декодирует записи в таблицу; segments - блоки записей секций: (смещение, число записей)
+
+        Если задан кеш, записи берутся из него, а после декодирования полной таблицы сохраняются в него.
+        """
+        if where is not None:
+            where.check_fields(len(plan))
+        record_count = sum(count for pos, count in segments)
+        self._record_layout = (segments[0][0], stride, plan)
+        self._set_segments(segments)
+
+        if self.memory_budget is not None and where is None:
+            # Постраничный режим: записи декодируются при первом обращении к их блоку
+            self.from_cache = False
+            self.loaded_rows = None
+            self._open_pages()
+            self._report_progress('records', len(plan), len(plan))
+            return PagedRecordTable(self._decode_rows, record_count, len(plan), max_bytes=self.memory_budget)
+
+        cache_key = self._cache_key(view)
+        cached = self._load_cached(cache_key, len(plan), record_count, use_numpy)
+        self.from_cache = cached is not None
+        if cached is not None and where is None:
+            records = RecordTable.from_columns(cached, record_count)
+            selected = None
+        elif cached is not None:
+            selected = where.matching_rows(dict(enumerate(cached)), record_count)
+            records = RecordTable([take_column(column, selected) for column in cached], len(selected))
+        else:
+            columns, selected = self._decode_segments(view, segments, stride, plan, use_numpy, where)
+            records = RecordTable(columns, record_count if selected is None else len(selected))
+            if selected is None:
+                self._store_cached(cache_key, records)
+
+        if selected is not None:
+            log.info("Фильтру соответствует записей: %d", len(selected))
+        self.loaded_rows = selected
+        self._report_progress('records', len(plan), len(plan))
+        return records
+
+    def _open_pages(self):
+        if self._page_map is None:
+            self._page_map = self._map_file()
+
+    def close(self):
+        """Закрывает отображение файла постраничной таблицы (блоки в кеше остаются доступны)"""
+        if isinstance(self.records, PagedRecordTable):
+            self.records.clear_cache()
+        if self._page_map is not None:
+            self._page_map.close()
+            self._page_map = None
+
+    def _decode_rows(self, start, stop, fields=None):
+        """Столбцы записей [start, stop) для постраничной таблицы: словарь поле -> столбец
+
+        Записи могут захватывать несколько секций. Столбцы NumPy ссылаются на отображение
+        файла: таблица упаковывает их в копии (make_column).
+        """
+        self._open_pages()
+        pos, stride, plan = self._record_layout
+        first_rows, positions, counts = self._segments
+        use_numpy = self._use_numpy(plan)
+        fields = range(len(plan)) if fields is None else fields
+        parts = []
+        view = memoryview(self._page_map)
+        try:
+            number = bisect_right(first_rows, start) - 1
+            row = start
+            while row < stop and number < len(counts):
+                count = min(stop, first_rows[number] + counts[number]) - row
+                if count > 0:
+                    parts.append(self._decode_columns(view, positions[number] + (row - first_rows[number]) * stride,
+                                                      count, stride, plan, use_numpy, fields=fields,
+                                                      progress=self._no_progress))
+                    row += count
+                number += 1
+        finally:
+            view.release()
+        return {field_idx: concat_columns([part[field_idx] for part in parts]) if parts else []
+                for field_idx in fields}
+
+    def _cache_key(self, view):
+        if self.cache is None:
+            return None
+        return self.cache.key(self.file_path, view, self.header.get('layout_hash', 0))
+
+    def _load_cached(self, cache_key, field_count, record_count, use_numpy):
+        """Столбцы записей из кеша или None"""
+        if cache_key is None:
+            return None
+        cached = self.cache.load(cache_key, use_numpy=use_numpy)
+        if cached is None:
+            return None
+        columns, row_count = cached
+        if len(columns) != field_count or row_count != record_count:
+            return None
+        log.info("Записи загружены из кеша")
+        return columns
+
+    def _store_cached(self, cache_key, records):
+        if cache_key is None:
+            return
+        try:
+            self.cache.store(cache_key, records.columns, len(records))
+        except OSError as e:
+            # Кеш только ускоряет повторное открытие: ошибка записи не мешает чтению файла
+            log.warning("Не удалось сохранить записи в кеш: %s", e)
+
+    def _set_segments(self, segments):
+        """Запоминает расположение блоков записей: номер первой записи каждого блока и его смещение"""
+        first_rows = array('Q')
+        positions = array('Q')
+        first_row = 0
+        for pos, count in segments:
+            first_rows.append(first_row)
+            positions.append(pos)
+            first_row += count
+        self._segments = (first_rows, positions, [count for pos, count in segments])
+
+    def _row_position(self, row, stride):
+        """Смещение записи в файле с учётом секций"""
+        first_rows, positions, counts = self._segments
+        number = bisect_right(first_rows, row) - 1
+        return positions[number] + (row - first_rows[number]) * stride
+
+    def _read_dbc_records(self, buf, where=None):
+        """Читает записи DBC: поля по 4 байта подряд, записи с фиксированным шагом сразу за заголовком"""
+        record_count = self.header['record_count']
+        record_size = self.header['record_size']
+        field_count = self.header['field_count']
+        if field_count * 4 != record_size:
+            log.warning("Размер записи %d байт не равен %d полям по 4 байта", record_size, field_count)
+
+        # Поля, не помещающиеся в запись, считаются нулевыми
+        plan = [('raw', i * 4, 4, None) if (i + 1) * 4 <= record_size else ('immediate', 0, 0, 0)
+                for i in range(field_count)]
+        use_numpy = self._use_numpy(plan)
+        if use_numpy:
+            log.info("Используется движок NumPy")
+
+        view = memoryview(buf)
+        try:
+            with self.stats.phase('records') as phase:
+                records = self._decode_table(view, [(20, record_count)], record_size, plan, use_numpy, where)
+                phase.bytes = max(0, min(len(view) - 20, record_count * record_size))
+                phase.rows = len(records)
+            log.info("Всего прочитано записей: %d", len(records))
+            return records
+        except BaseException as e:
+            # Кадры трассировки держат столбцы, ссылающиеся на отображение файла
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            view.release()
+
+    def _read_records(self, buf, pos, where=None):
+        """Читает записи из буфера (mmap) начиная с позиции pos
+
+        Если задан фильтр where (Query), сначала декодируются только поля фильтра,
+        а остальные поля - лишь для подходящих записей.
+        """
+        log.info("Начинаю чтение записей: ожидается %d записей, %d полей",
+                 self.header['record_count'], self.header['field_count'])
+        self._data_offset = pos
         
         # Инициализация структур данных для различных типов сжатия
         pallet_data = {}
         common_data = {}
-        sparse_data = {}
-        bitpacked_data = {}
-        records = []
 
+        view = memoryview(buf)
         try:
             # Проверка и корректировка информации о полях
             for i in range(self.header['field_count']):
@@ -270,108 +822,126 @@ class DBCDWrapper:
                     field['compression_type'] = self.COMPRESSION_NONE
 
             # Чтение данных палитры
-            print("\nЧтение данных палитры...")
-            for i in range(self.header['field_count']):
-                if self.field_info[i]['compression_type'] in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY]:
-                    pallet_size = max(0, min(self.field_info[i]['additional_data_size'] // 4, 1000000))
-                    print(f"Поле {i}: Тип сжатия PALLET, размер палитры: {pallet_size}")
-                    pallet_data[i] = []
-                    for _ in range(pallet_size):
-                        try:
-                            value = int.from_bytes(f.read(4), byteorder='little', signed=False)
-                            pallet_data[i].append(value)
-                        except Exception as e:
-                            print(f"Ошибка чтения палитры для поля {i}: {str(e)}")
-                            break
+            with self.stats.phase('pallet') as phase:
+                for i in range(self.header['field_count']):
+                    self._report_progress('pallet', i, self.header['field_count'])
+                    if self.field_info[i]['compression_type'] in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY,
+                                                                  self.COMPRESSION_BITPACKED_INDEXED,
+                                                                  self.COMPRESSION_BITPACKED_INDEXED_ARRAY]:
+                        pallet_size = max(0, min(self.field_info[i]['additional_data_size'] // 4, 1000000))
+                        log.debug("Поле %d: тип сжатия PALLET, размер палитры: %d", i, pallet_size)
+                        pallet_data[i] = read_uint32_array(view, pos, pallet_size)
+                        pos += pallet_size * 4
+                        phase.bytes += pallet_size * 4
+                        phase.rows += pallet_size
 
             # Чтение общих данных
-            print("\nЧтение общих данных...")
-            for i in range(self.header['field_count']):
-                if self.field_info[i]['compression_type'] in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
-                    common_size = max(0, min(self.field_info[i]['additional_data_size'] // 8, 1000000))
-                    print(f"Поле {i}: Тип сжатия COMMON, размер общих данных: {common_size}")
-                    common_data[i] = {}
-                    for _ in range(common_size):
-                        try:
-                            key = int.from_bytes(f.read(4), byteorder='little', signed=False)
-                            value = int.from_bytes(f.read(4), byteorder='little', signed=False)
-                            common_data[i][key] = value
-                        except Exception as e:
-                            print(f"Ошибка чтения общих данных для поля {i}: {str(e)}")
-                            break
+            with self.stats.phase('common') as phase:
+                for i in range(self.header['field_count']):
+                    self._report_progress('common', i, self.header['field_count'])
+                    if self.field_info[i]['compression_type'] in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
+                        common_size = max(0, min(self.field_info[i]['additional_data_size'] // 8, 1000000))
+                        log.debug("Поле %d: тип сжатия COMMON, размер общих данных: %d", i, common_size)
+                        common_data[i] = CommonData.from_pairs(read_uint32_array(view, pos, common_size * 2))
+                        pos += common_size * 8
+                        phase.bytes += common_size * 8
+                        phase.rows += common_size
+
+            self.pallet_data = pallet_data
+            self.common_data = common_data
 
             # Чтение записей
-            print("\nЧтение записей...")
-            current_position = f.tell()
-            print(f"Текущая позиция в файле: {current_position}")
-            
-            for record_idx in range(self.header['record_count']):
-                record = []
-                for field_idx in range(self.header['field_count']):
-                    field = self.field_info[field_idx]
-                    compression_type = field['compression_type']
-                    
-                    try:
-                        if compression_type == self.COMPRESSION_NONE:
-                            value = int.from_bytes(f.read(field['size']), byteorder='little', signed=False)
-                        
-                        elif compression_type in [self.COMPRESSION_IMMEDIATE, self.COMPRESSION_SIGNED_IMMEDIATE]:
-                            value = field['packed_offset']
-                        
-                        elif compression_type in [self.COMPRESSION_COMMON, self.COMPRESSION_COMMON_2]:
-                            key = int.from_bytes(f.read(field['size']), byteorder='little', signed=False)
-                            value = common_data[field_idx].get(key, 0)
-                        
-                        elif compression_type in [self.COMPRESSION_PALLET, self.COMPRESSION_PALLET_ARRAY]:
-                            index = int.from_bytes(f.read(field['size']), byteorder='little', signed=False)
-                            value = pallet_data[field_idx][index] if field_idx in pallet_data and index < len(pallet_data[field_idx]) else 0
-                        
-                        elif compression_type in [self.COMPRESSION_BIT_PACKED, self.COMPRESSION_ARRAY_2]:
-                            value = int.from_bytes(f.read(field['size']), byteorder='little', signed=False)
-                            if field['cell_size'] > 0:
-                                value &= (1 << field['cell_size']) - 1
-                        
-                        else:
-                            value = int.from_bytes(f.read(field['size']), byteorder='little', signed=False)
-                            
-                        record.append(value)
-                        
-                    except Exception as e:
-                        print(f"\nОшибка при чтении записи {record_idx}, поле {field_idx}:")
-                        print(f"Тип сжатия: {compression_type}")
-                        print(f"Размер поля: {field['size']}")
-                        print(f"Ошибка: {str(e)}")
-                        value = 0
-                        record.append(value)
-                
-                records.append(record)
-                if (record_idx + 1) % 50000 == 0:
-                    print(f"Прочитано записей: {record_idx + 1}")
-                    current_position = f.tell()
-                    print(f"Текущая позиция в файле: {current_position}")
+            log.debug("Начало записей в файле: %d", pos)
+            layout, stride = self._build_record_layout()
+            plan = self._build_decode_plan(layout, pallet_data, common_data)
+            segments = self._record_segments(pos)
+            use_numpy = self._use_numpy(plan)
+            if use_numpy:
+                log.info("Используется движок NumPy")
+
+            with self.stats.phase('records') as phase:
+                records = self._decode_table(view, segments, stride, plan, use_numpy, where)
+                phase.bytes = sum(max(0, min(len(view) - start, count * stride)) for start, count in segments)
+                phase.rows = len(records)
+
+            with self.stats.phase('sections') as phase:
+                phase.bytes = self._read_section_data(view, segments, stride)
+                phase.rows = len(segments)
             
-            print(f"\nВсего прочитано записей: {len(records)}")
-            print(f"Размер первой записи: {len(records[0]) if records else 0} полей")
-            print(f"Конечная позиция в файле: {f.tell()}")
+            log.info("Всего прочитано записей: %d, полей: %d, секций: %d",
+                     len(records), records.field_count, len(segments))
             return records
         
+        except (LoadCancelled, QueryError) as e:
+            # Кадры трассировки держат столбцы, ссылающиеся на отображение файла
+            traceback.clear_frames(e.__traceback__)
+            raise
         except Exception as e:
-            print(f"\nКритическая ошибка при чтении записей: {str(e)}")
-            return []
+            log.error("Критическая ошибка при чтении записей: %s", e)
+            traceback.clear_frames(e.__traceback__)
+            return RecordTable()
+        finally:
+            view.release()
+
+    def _record_segments(self, pos):
+        """Блоки записей по секциям: список (смещение, число записей)
 
-    def _read_bits(self, f, bit_width):
-        """Чтение указанного количества бит из файла"""
+        Палитры и общие данные начинаются со смещения первой секции, и её записи идут сразу за ними;
+        записи остальных секций начинаются с их собственного смещения.
+        """
+        sections = self.header.get('sections') or []
+        if len(sections) <= 1:
+            return [(pos, self.header['record_count'])]
+        segments = [(pos, sections[0]['num_records'])]
+        for section in sections[1:]:
+            segments.append((section['file_offset'], section['num_records']))
+        return segments
+
+    def _read_section_data(self, view, segments, stride):
+        """Читает данные секций после записей: строковую таблицу, список ID и таблицу копий
+
+        Возвращает число прочитанных байтов.
+        """
+        self.section_data = []
+        self.record_ids = None
+        self.copy_table = array('I')
+        sections = self.header.get('sections') or []
+        if not sections:
+            return 0
+        ids = array('I')
+        total = 0
+        for section, (pos, count) in zip(sections, segments):
+            start = pos + count * stride
+            strings_end = start + section['string_table_size']
+            id_count = section['index_data_size'] // 4
+            copy_start = strings_end + section['index_data_size']
+            data = {
+                'strings': StringTable(bytes(view[start:min(strings_end, len(view))])),
+                'ids': read_uint32_array(view, strings_end, id_count),
+                'copy_table': read_uint32_array(view, copy_start, section['copy_table_count'] * 2),
+            }
+            self.section_data.append(data)
+            ids.extend(data['ids'])
+            self.copy_table.extend(data['copy_table'])
+            total += section['string_table_size'] + section['index_data_size'] + section['copy_table_count'] * 8
+        # Список ID используется, только если он есть у всех записей
+        if ids and len(ids) == sum(count for pos, count in segments):
+            self.record_ids = ids
+        return total
+
+    def _read_bits(self, view, record_pos, record_size, bit_offset, bit_width):
+        """Чтение bit_width бит записи, начиная с бита bit_offset; биты за концом записи считаются нулями"""
         if bit_width == 0:
             return 0
-            
-        # Чтение минимального необходимого количества байт
-        bytes_needed = (bit_width + 7) // 8
-        data = f.read(bytes_needed)
-        if not data:
+        
+        byte_start = bit_offset // 8
+        if byte_start >= record_size:
             return 0
+        shift = bit_offset % 8
             
-        # Преобразование байтов в целое число
-        value = int.from_bytes(data, byteorder='little')
+        # Чтение минимального необходимого количества байт
+        bytes_needed = min((shift + bit_width + 7) // 8, record_size - byte_start)
+        value = self._read_uint(view, record_pos + byte_start, bytes_needed) >> shift
         
         # Маскирование лишних бит
         mask = (1 << bit_width) - 1
@@ -379,12 +949,12 @@ class DBCDWrapper:
 
     def _read_string_block(self):
         if self.file_type == '.dbc':
-            with open(self.file_path, 'rb') as f:
+            with self.stats.phase('strings') as phase, open(self.file_path, 'rb') as f:
                 # Пропускаем заголовок и записи
                 f.seek(20 + self.header['record_count'] * self.header['record_size'])
-                # Читаем строковый блок
-                string_data = f.read(self.header['string_size'])
-                self.string_block = string_data.decode('utf-8').split('\0')
+                # Читаем строковый блок одним куском, строки декодируются по обращению
+                self.string_block = StringTable(f.read(self.header['string_size']))
+                phase.bytes = len(self.string_block.data)
     
     def _validate_header(self, header):
         # Проверяем сигнатуру
@@ -392,71 +962,107 @@ class DBCDWrapper:
         if header['signature'] not in VALID_DBC_SIGNATURES:
             raise ValueError(f"Неверная сигнатура файла: {header['signature']}")
             
-        print(f"Сигнатура файла: {header['signature']}")
-        if 'schema_string' in header:
-            print(f"Схема: {header['schema_string']}")
-        print(f"Количество записей: {header['record_count']}")
-        print(f"Размер записи: {header['record_size']} байт")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Сигнатура файла: {header['signature']}")
+            if 'schema_string' in header:
+                log.debug(f"Схема: {header['schema_string']}")
+            log.debug(f"Количество записей: {header['record_count']}")
+            log.debug(f"Размер записи: {header['record_size']} байт")
         
-        if header['signature'] == 'WDC5':
-            print(f"Хеш таблицы: 0x{header['table_hash']:08X}")
-            print(f"Хеш макета: 0x{header['layout_hash']:08X}")
-            print(f"Диапазон ID: {header['min_id']} - {header['max_id']}")
-            print(f"Локаль: {header['locale']}")
-            print(f"Флаги: 0x{header['flags']:04X}")
-            print(f"Индекс ID: {header['id_index']}")
-            print(f"Всего полей: {header['total_field_count']}")
-            print(f"Смещение упакованных данных: {header['bitpacked_data_offset']}")
-            print(f"Количество полей для поиска: {header['lookup_column_count']}")
-            print(f"Размер информации о хранении полей: {header['field_storage_info_size']}")
-            print(f"Размер общих данных: {header['common_data_size']}")
-            print(f"Размер данных палитры: {header['pallet_data_size']}")
-            print(f"Количество секций: {header['sections_count']}")
+            if header['signature'] == 'WDC5':
+                log.debug(f"Хеш таблицы: 0x{header['table_hash']:08X}")
+                log.debug(f"Хеш макета: 0x{header['layout_hash']:08X}")
+                log.debug(f"Диапазон ID: {header['min_id']} - {header['max_id']}")
+                log.debug(f"Локаль: {header['locale']}")
+                log.debug(f"Флаги: 0x{header['flags']:04X}")
+                log.debug(f"Индекс ID: {header['id_index']}")
+                log.debug(f"Всего полей: {header['total_field_count']}")
+                log.debug(f"Смещение упакованных данных: {header['bitpacked_data_offset']}")
+                log.debug(f"Количество полей для поиска: {header['lookup_column_count']}")
+                log.debug(f"Размер информации о хранении полей: {header['field_storage_info_size']}")
+                log.debug(f"Размер общих данных: {header['common_data_size']}")
+                log.debug(f"Размер данных палитры: {header['pallet_data_size']}")
+                log.debug(f"Количество секций: {header['sections_count']}")
             
-            if header['section_header']:
-                print(f"\nИнформация о секции:")
-                print(f"TACT ключ: 0x{header['section_header']['tact_key_lookup']:016X}")
-                print(f"Смещение файла: {header['section_header']['file_offset']}")
-                print(f"Количество записей: {header['section_header']['num_records']}")
-                print(f"Размер строковой таблицы: {header['section_header']['string_table_size']}")
-                print(f"Смещение конца записей: {header['section_header']['offset_records_end']}")
-                print(f"Размер индексных данных: {header['section_header']['index_data_size']}")
-                print(f"Размер родительского поиска: {header['section_header']['parent_lookup_size']}")
-                print(f"Количество ID в карте смещений: {header['section_header']['offset_map_id_count']}")
-                print(f"Количество копируемых таблиц: {header['section_header']['copy_table_count']}")
+                if header['section_header']:
+                    log.debug(f"Информация о секции:")
+                    log.debug(f"TACT ключ: 0x{header['section_header']['tact_key_lookup']:016X}")
+                    log.debug(f"Смещение файла: {header['section_header']['file_offset']}")
+                    log.debug(f"Количество записей: {header['section_header']['num_records']}")
+                    log.debug(f"Размер строковой таблицы: {header['section_header']['string_table_size']}")
+                    log.debug(f"Смещение конца записей: {header['section_header']['offset_records_end']}")
+                    log.debug(f"Размер индексных данных: {header['section_header']['index_data_size']}")
+                    log.debug(f"Размер родительского поиска: {header['section_header']['parent_lookup_size']}")
+                    log.debug(f"Количество ID в карте смещений: {header['section_header']['offset_map_id_count']}")
+                    log.debug(f"Количество копируемых таблиц: {header['section_header']['copy_table_count']}")
             
         return True  # Заголовок валиден
 
-    def read_file(self):
+    def read_file(self, progress=None, where=None):
+        self.progress_callback = progress
+        # Отмена относится к одной загрузке: запрос, оставшийся от прошлой, не прерывает новую
+        self._cancel_requested = False
+        self.close()
+        self.stats.reset()
         try:
-            print(f"\nНачинаю чтение файла: {self.file_path}")
-            print(f"Определен тип файла: {self.file_type.upper()[1:]}")
+            log.info("Начинаю чтение файла: %s (%s)", self.file_path, self.file_type.upper()[1:])
             
             if self.file_type == '.dbc':
-                self.header = self._read_dbc_header()
+                self._report_progress('header', 0, 1)
+                with self.stats.phase('header') as phase:
+                    self.header = self._read_dbc_header()
+                    phase.bytes = 20
+                self._report_progress('header', 1, 1)
+                self._read_string_block()
+                
+                if isinstance(where, str):
+                    where = Query(where, self._id_field())
+                
+                with self._map_file() as buf:
+                    self.records = self._read_dbc_records(buf, where)
                 file_type = "DBC"
             else:  # .db2
                 with open(self.file_path, 'rb') as f:
-                    print("\nЧтение заголовка файла...")
-                    self.header = self._read_db2_header(f)
-                    
-                    if not self._validate_header(self.header):
-                        raise ValueError("Ошибка при валидации заголовка")
-                    print("Заголовок прошел валидацию")
+                    self._report_progress('header', 0, 1)
+                    with self.stats.phase('header') as phase:
+                        self.header = self._read_db2_header(f)
+                        if not self._validate_header(self.header):
+                            raise ValueError("Ошибка при валидации заголовка")
+                        phase.bytes = f.tell()
+                    log.debug("Заголовок прошел валидацию")
+                    self._report_progress('header', 1, 1)
                     
-                    print("\nЧтение информации о полях...")
-                    self.field_info = self._read_field_info(f)
+                    self._report_progress('field_info', 0, 1)
+                    with self.stats.phase('field_info') as phase:
+                        self.field_info = self._read_field_info(f)
+                        phase.bytes = len(self.field_info) * 24
+                        phase.rows = len(self.field_info)
+                    self._report_progress('field_info', 1, 1)
                     
+                    data_offset = f.tell()
                     if self.header['section_header']:
-                        print(f"\nПереход к началу секции данных: {self.header['section_header']['file_offset']}")
-                        f.seek(self.header['section_header']['file_offset'])
+                        log.debug("Переход к началу секции данных: %d", self.header['section_header']['file_offset'])
+                        data_offset = self.header['section_header']['file_offset']
+                    
+                    if isinstance(where, str):
+                        where = Query(where, self._id_field())
                     
-                    print("\nЧтение записей...")
-                    self.records = self._read_records(f)
-                    print(f"Прочитано записей: {len(self.records)}")
+                    with self._map_file() as buf:
+                        self.records = self._read_records(buf, data_offset, where)
                     
                 file_type = "DB2"
             
+            # Постраничной таблице индекс ID строится при первом поиске по ID
+            if not isinstance(self.records, PagedRecordTable):
+                with self.stats.phase('id_index') as phase:
+                    self.build_id_index()
+                    phase.rows = len(self.records)
+            
+            self._file_stat = self._stat_file()
+            self.dirty.clear()
+            self.journal.clear()
+            # Отмена, запрошенная после последней проверки, к прочитанному файлу не относится
+            self._cancel_requested = False
             return {
                 "status": "success",
                 "message": f"{file_type} файл успешно прочитан",
@@ -466,49 +1072,628 @@ class DBCDWrapper:
                 "records": self.records,
                 "string_block": self.string_block if self.file_type == '.dbc' else None
             }
+        except LoadCancelled as e:
+            log.info("Чтение файла отменено: %s", self.file_path)
+            self._cancel_requested = False
+            return {
+                "status": "cancelled",
+                "message": str(e)
+            }
         except Exception as e:
-            print(f"Ошибка при чтении файла: {str(e)}")
+            log.error("Ошибка при чтении файла: %s", e)
             return {
                 "status": "error",
                 "message": str(e)
             }
     
-    def save_file(self, new_file_path=None):
+    def _stat_file(self):
+        stat = os.stat(self.file_path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def _collect_patches(self):
+        """Изменения, которые можно записать поверх исходного файла: список (смещение, байты)
+
+        Возвращает None, если изменения требуют полной перезаписи файла: поле сжато,
+        значение не помещается в поле, длина строки изменилась или файл изменён на диске.
+        """
+        if self._record_layout is None or self._file_stat != self._stat_file():
+            return None
+        pos, stride, plan = self._record_layout
+        patches = []
+        with self._map_file() as buf:
+            for record_index, field_index in sorted(self.dirty):
+                kind, offset, size, payload = plan[field_index]
+                value = self.records.get(record_index, field_index)
+                if kind not in ('raw', 'masked') or not isinstance(value, int):
+                    return None
+                row = self.loaded_rows[record_index] if self.loaded_rows is not None else record_index
+                file_pos = self._row_position(row, stride) + offset
+                if file_pos + size > len(buf):
+                    return None
+                limit = 1 << (8 * size)
+                if kind == 'masked' and payload:
+                    # Биты вне маски поля сохраняются как в файле
+                    if not 0 <= value <= payload:
+                        return None
+                    stored = int.from_bytes(buf[file_pos:file_pos + size], byteorder='little')
+                    value = (stored & ~payload) | value
+                elif value < 0:
+                    value += limit
+                if not 0 <= value < limit:
+                    return None
+                patches.append((file_pos, value.to_bytes(size, byteorder='little')))
+
+            if self.file_type == '.dbc' and self.string_block.modified:
+                start = 20 + self.header['record_count'] * self.header['record_size']
+                for index, value in self.string_block.edited_items():
+                    data = value.encode(self.string_block.encoding)
+                    if len(data) != self.string_block.byte_length(index):
+                        return None
+                    patches.append((start + self.string_block.offset_of(index), data))
+        return patches
+
+    def _write_patches(self, path, patches):
+        """Записывает изменения в файл через отображение в память"""
+        if not patches:
+            return
+        with open(path, 'r+b') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as buf:
+                for file_pos, data in patches:
+                    buf[file_pos:file_pos + len(data)] = data
+                buf.flush()
+
+    def _dump_delta_backup(self, delta_path, delta):
+        temp_path = delta_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(delta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, delta_path)
+
+    def _load_delta_backup(self, delta_path):
+        """Копия .bak.delta, к которой можно добавить следующее сохранение, или None
+
+        Подходит копия этого файла, если после сохранения с ней файл не менялся
+        или это сохранение было прервано (stat - None).
+        """
+        try:
+            with open(delta_path, 'r', encoding='utf-8') as f:
+                delta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if delta.get('file') != os.path.basename(self.file_path) or delta.get('size') != self._file_stat[0]:
+            return None
+        if 'stat' not in delta or (delta['stat'] is not None and tuple(delta['stat']) != self._file_stat):
+            return None
+        return delta
+
+    def _write_delta_backup(self, patches):
+        """Сохраняет исходные байты изменяемых мест в файл .bak.delta (компактная резервная копия)
+
+        Копия одна на цепочку сохранений: если файл после прошлого сохранения с копией
+        не менялся, к ней добавляются только новые места, и восстановление возвращает файл
+        к состоянию до первого сохранения цепочки.
+        """
+        delta_path = self.file_path + '.bak.delta'
+        original = {}
+        delta = self._load_delta_backup(delta_path)
+        if delta is not None:
+            for file_pos, data in delta['patches']:
+                for i, byte in enumerate(bytes.fromhex(data)):
+                    original[file_pos + i] = byte
+        with self._map_file() as buf:
+            for file_pos, data in patches:
+                for i in range(file_pos, file_pos + len(data)):
+                    original.setdefault(i, buf[i])
+        # Соседние байты собираются в непрерывные места
+        runs = []
+        for file_pos in sorted(original):
+            if runs and runs[-1][0] + len(runs[-1][1]) == file_pos:
+                runs[-1][1].append(original[file_pos])
+            else:
+                runs.append([file_pos, bytearray([original[file_pos]])])
+        # stat заполняется после записи изменений: до тех пор сохранение считается прерванным
+        self._dump_delta_backup(delta_path, {'file': os.path.basename(self.file_path), 'size': self._file_stat[0],
+                                             'stat': None,
+                                             'patches': [[file_pos, data.hex()] for file_pos, data in runs]})
+        return delta_path
+
+    def _seal_delta_backup(self, delta_path):
+        """Отмечает в копии .bak.delta, что изменения записаны в файл полностью"""
+        with open(delta_path, 'r', encoding='utf-8') as f:
+            delta = json.load(f)
+        delta['stat'] = list(self._stat_file())
+        self._dump_delta_backup(delta_path, delta)
+
+    def _drop_delta_backup(self):
+        """Удаляет копию .bak.delta: после перезаписи файла целиком она к нему не относится"""
+        try:
+            os.remove(self.file_path + '.bak.delta')
+        except FileNotFoundError:
+            pass
+
+    def restore_delta_backup(self, delta_path=None):
+        """Возвращает исходные байты файла из резервной копии .bak.delta"""
+        if delta_path is None:
+            delta_path = self.file_path + '.bak.delta'
+        with open(delta_path, 'r', encoding='utf-8') as f:
+            delta = json.load(f)
+        if os.path.getsize(self.file_path) != delta['size']:
+            raise ValueError("Размер файла не совпадает с резервной копией")
+        self._write_patches(self.file_path, [(file_pos, bytes.fromhex(data)) for file_pos, data in delta['patches']])
+
+    def _save_patches(self, new_file_path, patches, backup):
+        """Записывает только изменённые байты поверх исходного файла (или его копии)"""
+        same_file = os.path.abspath(new_file_path) == os.path.abspath(self.file_path)
+        if not same_file or backup is None:
+            # Другой файл или сохранение без резервной копии: копия исходного файла
+            # с наложенными изменениями заменяет целевой файл переименованием
+            temp_path = new_file_path + '.tmp'
+            shutil.copyfile(self.file_path, temp_path)
+            self._write_patches(temp_path, patches)
+            if same_file:
+                self.close()
+            os.replace(temp_path, new_file_path)
+            if same_file:
+                self._drop_delta_backup()
+            return
+        # Сначала сохраняем исходные байты, чтобы прерванную запись можно было откатить
+        if backup in ('auto', 'delta'):
+            delta_path = self._write_delta_backup(patches)
+            self._write_patches(self.file_path, patches)
+            self._seal_delta_backup(delta_path)
+            return
+        shutil.copy2(self.file_path, self.file_path + '.bak')
+        self._drop_delta_backup()
+        self._write_patches(self.file_path, patches)
+
+    def _changed_rows(self, current, original):
+        """Номера записей, в которых значение столбца отличается от значения в файле"""
+        if isinstance(current, array) and isinstance(original, array) and current == original:
+            return []
+        rows = dbcd_numpy.changed_rows(current, original)
+        if rows is not None:
+            return rows
+        return [row for row, (a, b) in enumerate(zip(current, original)) if a != b]
+
+    def _fit_value(self, value, bits, field_idx, row):
+        """Беззнаковое представление значения в bits битах (отрицательные - в дополнительном коде)"""
+        if not isinstance(value, int) or not -(1 << (bits - 1)) <= value < (1 << bits):
+            raise ValueError(f"Запись {row}, поле {field_idx}: значение {value} не помещается в {bits} бит")
+        return value & ((1 << bits) - 1)
+
+    def _pallet_index(self, blocks, field_idx, value, row, cardinality=None):
+        """Номер значения (или массива значений) в палитре поля; новые значения дописываются в палитру"""
+        pallet = blocks['pallet'][field_idx]
+        reverse = blocks['reverse'].get(field_idx)
+        if reverse is None:
+            if cardinality is None:
+                reverse = {item: i for i, item in reversed(list(enumerate(pallet)))}
+            else:
+                reverse = {tuple(pallet[i * cardinality:(i + 1) * cardinality]): i
+                           for i in reversed(range(len(pallet) // cardinality))}
+            blocks['reverse'][field_idx] = reverse
+        if value not in reverse:
+            items = value if cardinality is not None else (value,)
+            if cardinality is not None and (not isinstance(value, tuple) or len(value) != cardinality):
+                raise ValueError(f"Запись {row}, поле {field_idx}: ожидался массив из {cardinality} значений")
+            if cardinality is not None:
+                # Неполный последний массив палитры не используется при чтении
+                del pallet[len(pallet) // cardinality * cardinality:]
+            reverse[value] = len(pallet) // (cardinality or 1)
+            pallet.extend(self._fit_value(item, 32, field_idx, row) for item in items)
+        return reverse[value]
+
+    def _stored_keys(self, records, stride, offset, size):
+        """Ключи общих данных, записанные в поле всех записей (в том числе ключи без значения)"""
+        column = self._decode_columns(memoryview(records), 0, len(records) // stride if stride else 0, stride,
+                                      [('raw', offset, size, None)], self._use_numpy([('raw', offset, size, None)]),
+                                      progress=self._no_progress)[0]
+        return set(column.tolist() if hasattr(column, 'tolist') else column)
+
+    def _common_key(self, blocks, field_idx, value, row, stored):
+        """Ключ общих данных поля для значения; новые значения получают новый ключ
+
+        stored - ключи, уже записанные в записях: записи с ключом без значения читаются как 0,
+        поэтому такой ключ новому значению не выдаётся.
+        """
+        keys, values, pairs = blocks['common'][field_idx]
+        reverse = blocks['reverse'].get(field_idx)
+        if reverse is None:
+            reverse = {item: key for key, item in reversed(list(zip(keys, values)))}
+            blocks['reverse'][field_idx] = reverse
+        if value not in reverse:
+            key = keys[-1] + 1 if keys else 0
+            while key in stored:
+                key += 1
+            # Новый ключ больше всех прежних, поэтому ключи остаются отсортированными
+            keys.append(key)
+            values.append(self._fit_value(value, 32, field_idx, row))
+            pairs.extend((key, values[-1]))
+            reverse[value] = key
+        return reverse[value]
+
+    def _write_bits(self, records, record_pos, stride, bit_offset, width, value, field_idx, row):
+        """Записывает width бит значения в запись; биты за концом записи должны быть нулевыми"""
+        byte_start, shift = divmod(bit_offset, 8)
+        available = max(0, min((shift + width + 7) // 8, stride - byte_start))
+        shifted = value << shift
+        if shifted >> (8 * available):
+            raise ValueError(f"Запись {row}, поле {field_idx}: значение выходит за пределы записи")
+        if available == 0:
+            return
+        pos = record_pos + byte_start
+        mask = (((1 << width) - 1) << shift) & ((1 << (8 * available)) - 1)
+        stored = int.from_bytes(records[pos:pos + available], byteorder='little')
+        records[pos:pos + available] = ((stored & ~mask) | shifted).to_bytes(available, byteorder='little')
+
+    def _encode_field(self, records, stride, field_idx, entry, column, rows, blocks):
+        """Кодирует изменившиеся значения поля поверх исходных байтов записей"""
+        kind, offset, size, payload = entry
+        if kind == 'immediate':
+            # Значение хранится в описании поля, поэтому должно быть одинаковым у всех записей
+            values = set(column.tolist() if hasattr(column, 'tolist') else column)
+            if len(values) != 1 or self.file_type == '.dbc':
+                raise ValueError(f"Поле {field_idx} не хранится в записях: у всех записей должно быть одно значение")
+            blocks['immediate'][field_idx] = self._fit_value(values.pop(), 32, field_idx, 0)
+            return
+        if kind == 'raw' and dbcd_numpy.store_column(records, stride, offset, size, rows, column):
+            return
+
+        for row in rows:
+            value = column[row]
+            value = int(value) if not isinstance(value, (int, tuple)) else value
+            record_pos = row * stride
+            if kind == 'bits':
+                width = payload['width']
+                if payload['cardinality'] is not None:
+                    value = self._pallet_index(blocks, field_idx, value, row, payload['cardinality'])
+                elif payload['pallet'] is not None:
+                    value = self._pallet_index(blocks, field_idx, value, row)
+                low, high = (-(1 << width >> 1), 1 << width >> 1) if payload['signed'] else (0, 1 << width)
+                if not isinstance(value, int) or not low <= value < max(high, 1):
+                    raise ValueError(f"Запись {row}, поле {field_idx}: значение {column[row]} не помещается в {width} бит")
+                self._write_bits(records, record_pos, stride, payload['bit_offset'], width,
+                                 value & ((1 << width) - 1), field_idx, row)
+                continue
+            if kind == 'common':
+                stored = blocks['stored'].get(field_idx)
+                if stored is None:
+                    stored = blocks['stored'][field_idx] = self._stored_keys(records, stride, offset, size)
+                value = self._common_key(blocks, field_idx, value, row, stored)
+            elif kind == 'pallet':
+                value = self._pallet_index(blocks, field_idx, value, row)
+            elif kind == 'masked' and payload:
+                # Биты вне маски поля сохраняются как в файле
+                if not isinstance(value, int) or not 0 <= value <= payload:
+                    raise ValueError(f"Запись {row}, поле {field_idx}: значение {value} не помещается в маску поля")
+                stored = int.from_bytes(records[record_pos + offset:record_pos + offset + size], byteorder='little')
+                value = (stored & ~payload) | value
+            value = self._fit_value(value, 8 * size, field_idx, row)
+            records[record_pos + offset:record_pos + offset + size] = value.to_bytes(size, byteorder='little')
+
+    def _with_pallet(self, entry, pallet):
+        """Элемент плана декодирования поля с другой палитрой"""
+        kind, offset, size, payload = entry
+        if kind == 'bits':
+            return (kind, offset, size, dict(payload, pallet=pallet))
+        return (kind, offset, size, pallet)
+
+    def _fields_overlap(self, plan):
+        """Проверяет, занимают ли разные поля одни и те же биты записи"""
+        spans = []
+        for kind, offset, size, payload in plan:
+            if kind == 'bits':
+                spans.append((payload['bit_offset'], payload['bit_offset'] + payload['width']))
+            elif kind != 'immediate':
+                spans.append((offset * 8, (offset + size) * 8))
+        spans.sort()
+        return any(start < end for (_, end), (start, _) in zip(spans, spans[1:]))
+
+    def _check_encoded(self, records, record_count, stride, plan, blocks, columns):
+        """Сверяет закодированные записи с таблицей, если поля пересекаются и могли затереть друг друга
+
+        Возвращает новые значения (запись, поле, значение) неизменённых полей, биты которых
+        изменились вместе с отредактированными полями.
+        """
+        plan = [self._with_pallet(entry, blocks['pallet'][field_idx]) if field_idx in blocks['pallet'] else entry
+                for field_idx, entry in enumerate(plan)]
+        plan = [(kind, offset, size, CommonData(*blocks['common'][field_idx])) if kind == 'common' else
+                (kind, offset, size, payload) for field_idx, (kind, offset, size, payload) in enumerate(plan)]
+        decoded = self._decode_columns(memoryview(records), 0, record_count, stride, plan, self._use_numpy(plan),
+                                       progress=self._no_progress)
+        derived = []
+        for field_idx in range(len(plan)):
+            if plan[field_idx][0] == 'immediate':
+                continue
+            column = columns[field_idx]
+            rows = self._changed_rows(column, decoded[field_idx])
+            if plan[field_idx][0] == 'raw':
+                # Отрицательные значения хранятся в дополнительном коде и читаются как беззнаковые
+                mask = (1 << (8 * plan[field_idx][2])) - 1
+                rows = [row for row in rows if int(column[row]) & mask != decoded[field_idx][row]]
+            edited = blocks['edited'].get(field_idx, ())
+            for row in rows:
+                if row in edited:
+                    raise ValueError(f"Запись {row}, поле {field_idx}: значение не удаётся сохранить, "
+                                     f"поле занимает те же биты записи, что и другие поля")
+            # Неизменённые поля, биты которых изменились вместе с другими полями, получат новые значения
+            derived.extend((row, field_idx, decoded[field_idx][row]) for row in rows)
+        return derived
+
+    def _remap_strings(self, records, stride, plan, columns):
+        """Перестраивает строковый блок DBC и переписывает в записях смещения сдвинувшихся строк
+
+        Типы полей в DBC не хранятся: полем строк считается поле, все значения которого -
+        начала строк блока. Поле, большая часть значений которого - начала строк, а остальные нет,
+        не сохраняется: неясно, какие значения - ссылки на строки.
+        Возвращает (байты блока, новые значения (запись, поле, смещение)).
+        """
+        table = self.string_block
+        strings = table.to_bytes()
+        if not table.modified:
+            return strings, []
+        old_offsets = table.offsets
+        moved = {}
+        position = 0
+        for index, value in enumerate(table):
+            if '\0' in value:
+                raise ValueError(f"Строка {index} содержит нулевой символ")
+            if old_offsets[index] != position:
+                moved[old_offsets[index]] = position
+            position += len(value.encode(table.encoding)) + 1
+        if not moved:
+            return strings, []
+
+        starts = set(old_offsets)
+        saved = StringTable(strings)
+        remapped = []
+        for field_idx, (kind, offset, size, payload) in enumerate(plan):
+            if kind != 'raw':
+                continue
+            column = columns[field_idx]
+            values = column.tolist() if hasattr(column, 'tolist') else column
+            references = sum(1 for value in values if value in starts)
+            if references < len(values):
+                if references * 2 > len(values) and any(value in moved for value in values):
+                    raise ValueError(f"Поле {field_idx}: не все значения указывают на начала строк, "
+                                     f"смещения строк после изменения длины строки не пересчитать")
+                continue
+            # Проверка: каждая ссылка поля после сохранения указывает на ту же строку
+            for value in set(values):
+                if saved.at(moved.get(value, value)) != table.at(value):
+                    raise ValueError(f"Поле {field_idx}: ссылка на строку со смещением {value} "
+                                     f"не сохраняется при перестройке строкового блока")
+            for row, value in enumerate(values):
+                if value in moved:
+                    struct.pack_into('<I', records, row * stride + offset, moved[value])
+                    remapped.append((row, field_idx, moved[value]))
+        return strings, remapped
+
+    def _serialize_file(self):
+        """Собирает файл целиком: возвращает (части файла для записи, новое состояние после сохранения)
+
+        Блок записей копируется из исходного файла одним куском, и поверх него кодируются
+        только значения, отличающиеся от файла. Палитры и общие данные дополняются новыми значениями.
+        """
+        if self.loaded_rows is not None:
+            raise ValueError("Файл загружен с фильтром: сохранение неполной таблицы невозможно")
+        if self._record_layout is None:
+            raise ValueError("Записи файла не прочитаны")
+        if self._file_stat != self._stat_file():
+            raise ValueError("Файл изменён на диске после чтения: откройте его заново")
+        pos, stride, plan = self._record_layout
+        first_rows, positions, counts = self._segments
+        segments = list(zip(positions, counts))
+        record_count = sum(counts)
+        ends = [start + count * stride for start, count in segments]
+        if any(ends[number] > positions[number + 1] for number in range(len(segments) - 1)):
+            raise ValueError("Секции файла перекрываются или идут не по порядку: полная перезапись невозможна")
+        blocks = {
+            'pallet': {i: array('I', pallet) for i, pallet in self.pallet_data.items()},
+            'common': {i: (array('I', common.keys), array('I', common.values), array('I', common.pairs))
+                       for i, common in self.common_data.items()},
+            'immediate': {},
+            'reverse': {},
+            'stored': {},
+            'edited': {}
+        }
+
+        with self._map_file() as buf:
+            view = memoryview(buf)
+            try:
+                original = self._decode_segments(view, segments, stride, plan, self._use_numpy(plan),
+                                                 progress=self._no_progress)[0]
+                # Постраничная таблица декодируется целиком один раз
+                columns = self.records.columns
+                # Записи всех секций кодируются в одном непрерывном блоке
+                records = bytearray(record_count * stride)
+                for first_row, (start, count) in zip(first_rows, segments):
+                    available = max(0, min(len(view) - start, count * stride))
+                    records[first_row * stride:first_row * stride + available] = view[start:start + available]
+                for field_idx, entry in enumerate(plan):
+                    column = columns[field_idx]
+                    rows = self._changed_rows(column, original[field_idx])
+                    while rows:
+                        blocks['edited'].setdefault(field_idx, set()).update(rows)
+                        pallet_size = len(blocks['pallet'].get(field_idx, ()))
+                        self._encode_field(records, stride, field_idx, entry, column, rows, blocks)
+                        if len(blocks['pallet'].get(field_idx, ())) <= pallet_size:
+                            break
+                        # Индексы за концом прежней палитры теперь указывают на новые значения:
+                        # такие записи кодируются заново
+                        entry = self._with_pallet(entry, blocks['pallet'][field_idx])
+                        decoded = self._decode_columns(memoryview(records), 0, record_count, stride, [entry],
+                                                       self._use_numpy([entry]), progress=self._no_progress)[0]
+                        rows = self._changed_rows(column, decoded)
+                derived = []
+                if self._fields_overlap(plan):
+                    derived = self._check_encoded(records, record_count, stride, plan, blocks, columns)
+                if self.file_type == '.dbc':
+                    strings, remapped = self._remap_strings(records, stride, plan, columns)
+                prefix = bytearray(view[:20 if self.file_type == '.dbc' else self._data_offset])
+                # Данные секций после записей (строки, ID, копии) и промежутки до следующей секции
+                tails = [bytes(view[end:next_start]) for end, next_start in zip(ends, positions[1:])]
+                tails.append(bytes(view[ends[-1]:]))
+            except BaseException as e:
+                # Кадры трассировки держат столбцы, ссылающиеся на отображение файла
+                traceback.clear_frames(e.__traceback__)
+                raise
+            finally:
+                # Декодированные столбцы могут ссылаться на отображение файла
+                original = None
+                view.release()
+
+        state = {'records_offset': pos, 'segments': segments, 'derived': derived}
+        if self.file_type == '.dbc':
+            struct.pack_into('<I', prefix, 16, len(strings))
+            state['string_size'] = len(strings)
+            state['strings'] = remapped
+            return [prefix, records, strings], state
+
+        # Описания полей: новые размеры палитр и общих данных, значения непосредственных полей
+        field_info_start = 204 + self.SECTION_HEADER.size * self.header['sections_count']
+        chunks = [prefix]
+        pallet_delta = common_delta = 0
+        for i in sorted(blocks['pallet']):
+            pallet = blocks['pallet'][i]
+            chunks.append(uint32_array_bytes(pallet))
+            pallet_delta += (len(pallet) - len(self.pallet_data[i])) * 4
+            if len(pallet) != len(self.pallet_data[i]):
+                struct.pack_into('<I', prefix, field_info_start + i * 24 + 4, len(pallet) * 4)
+        for i in sorted(blocks['common']):
+            pairs = blocks['common'][i][2]
+            chunks.append(uint32_array_bytes(pairs))
+            common_delta += (len(pairs) - len(self.common_data[i].pairs)) * 4
+            if len(pairs) != len(self.common_data[i].pairs):
+                struct.pack_into('<I', prefix, field_info_start + i * 24 + 4, len(pairs) * 4)
+        for i, value in blocks['immediate'].items():
+            struct.pack_into('<I', prefix, field_info_start + i * 24 + 12, value)
+
+        # Заголовок: размеры блоков, а также смещения секций сдвигаются вместе с данными
+        delta = pallet_delta + common_delta
+        struct.pack_into('<I', prefix, 192, (self.header['common_data_size'] + common_delta) & 0xFFFFFFFF)
+        struct.pack_into('<I', prefix, 196, (self.header['pallet_data_size'] + pallet_delta) & 0xFFFFFFFF)
+        for number, section in enumerate(self.header['sections']):
+            section_start = 204 + number * self.SECTION_HEADER.size
+            if number > 0:
+                struct.pack_into('<I', prefix, section_start + 8, (section['file_offset'] + delta) & 0xFFFFFFFF)
+            if section['offset_records_end']:
+                struct.pack_into('<I', prefix, section_start + 20,
+                                 (section['offset_records_end'] + delta) & 0xFFFFFFFF)
+        for first_row, count, tail in zip(first_rows, counts, tails):
+            chunks.append(records[first_row * stride:(first_row + count) * stride])
+            chunks.append(tail)
+
+        state.update({
+            'records_offset': pos + delta,
+            'segments': [(start + delta, count) for start, count in segments],
+            'pallet_data': blocks['pallet'],
+            'common_data': {i: CommonData(*common) for i, common in blocks['common'].items()},
+            'immediate': blocks['immediate'],
+            'pallet_delta': pallet_delta,
+            'common_delta': common_delta
+        })
+        return chunks, state
+
+    def _apply_saved_state(self, state):
+        """Переводит разобранное состояние на только что записанный файл"""
+        pos, stride, plan = self._record_layout
+        if self.file_type == '.dbc':
+            self.header['string_size'] = state['string_size']
+            # Поля строк ссылаются на новые смещения сохранённого блока
+            for record_index, field_index, value in state['strings']:
+                self.records.update_record(record_index, field_index, value)
+            return
+        for i, pallet in state['pallet_data'].items():
+            self.field_info[i]['additional_data_size'] = len(pallet) * 4
+        for i, common in state['common_data'].items():
+            self.field_info[i]['additional_data_size'] = len(common.pairs) * 4
+        for i, value in state['immediate'].items():
+            self.field_info[i]['packed_offset'] = value
+        self.header['pallet_data_size'] += state['pallet_delta']
+        self.header['common_data_size'] += state['common_delta']
+        delta = state['pallet_delta'] + state['common_delta']
+        for number, section in enumerate(self.header['sections']):
+            if number > 0:
+                section['file_offset'] += delta
+            if section['offset_records_end']:
+                section['offset_records_end'] += delta
+        self.pallet_data = state['pallet_data']
+        self.common_data = state['common_data']
+        layout, stride = self._build_record_layout()
+        self._record_layout = (state['records_offset'], stride,
+                               self._build_decode_plan(layout, self.pallet_data, self.common_data))
+        self._set_segments(state['segments'])
+
+    def _save_full(self, new_file_path, backup):
+        """Полностью перезаписывает файл через временный файл и переименование"""
+        chunks, state = self._serialize_file()
+        # Создаем резервную копию
+        if backup in ('auto', 'full'):
+            shutil.copy2(self.file_path, self.file_path + '.bak')
+
+        temp_path = new_file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        # Отображение постраничной таблицы не даёт заменить файл (Windows); оно откроется заново
+        # при следующем обращении к записям, изменения таблицы при этом сохраняются
+        if os.path.abspath(new_file_path) == os.path.abspath(self.file_path):
+            self.close()
+            os.replace(temp_path, new_file_path)
+            self._drop_delta_backup()
+        else:
+            os.replace(temp_path, new_file_path)
+        for record_index, field_index, value in state['derived']:
+            self.records.update_record(record_index, field_index, int(value) if not isinstance(value, tuple) else value)
+        return state
+
+    def save_file(self, new_file_path=None, backup='auto'):
+        """Сохраняет изменения в файл
+
+        Если изменены только значения несжатых полей (и строки без изменения длины),
+        в файл записываются лишь изменённые байты. Иначе файл перезаписывается целиком.
+        backup: 'full' - копия файла .bak, 'delta' - исходные байты изменённых мест (.bak.delta),
+        None - без резервной копии, 'auto' - delta для частичной записи и full для полной.
+
+        Полная перезапись, сохранение в другой файл и сохранение без резервной копии пишут
+        временный файл и заменяют им целевой. Частичная запись с копией 'delta' или 'full'
+        идёт прямо в исходный файл и не атомарна: прерванную запись откатывает
+        restore_delta_backup (или копия .bak). Копия .bak.delta накапливает исходные байты
+        всех частичных сохранений подряд; полная перезапись файла её удаляет.
+        """
         try:
             if new_file_path is None:
                 new_file_path = self.file_path
             
-            # Создаем резервную копию
-            backup_path = self.file_path + '.bak'
-            shutil.copy2(self.file_path, backup_path)
-            
-            with open(new_file_path, 'wb') as f:
-                # Записываем заголовок
-                if self.file_type == '.dbc':
-                    f.write(self.header['signature'].encode('ascii'))
-                    f.write(struct.pack('<I', self.header['record_count']))
-                    f.write(struct.pack('<I', self.header['field_count']))
-                    f.write(struct.pack('<I', self.header['record_size']))
-                    f.write(struct.pack('<I', self.header['string_size']))
-                else:  # .db2
-                    f.write(self.header['signature'].encode('ascii'))
-                    f.write(struct.pack('<I', self.header['version']))
-                    f.write(struct.pack('<I', self.header['record_count']))
-                    f.write(struct.pack('<I', self.header['record_size']))
-                
-                # Записываем записи
-                for record in self.records:
-                    for value in record:
-                        f.write(struct.pack('<I', value))
-                
-                # Записываем строковый блок для DBC
-                if self.file_type == '.dbc' and self.string_block:
-                    string_data = '\0'.join(self.string_block)
-                    f.write(string_data.encode('utf-8'))
+            with self.stats.phase('save') as phase:
+                patches = self._collect_patches()
+                if patches is not None:
+                    self._save_patches(new_file_path, patches, backup)
+                    message = f"Файл успешно сохранен: {new_file_path} (изменено мест: {len(patches)})"
+                    phase.bytes = sum(len(data) for pos, data in patches)
+                    phase.rows = len({row for row, field_idx in self.dirty})
+                else:
+                    state = self._save_full(new_file_path, backup)
+                    message = f"Файл успешно сохранен: {new_file_path}"
+                    phase.bytes = os.path.getsize(new_file_path)
+                    phase.rows = len(self.records)
+            log.info("%s", message)
+
+            if os.path.abspath(new_file_path) == os.path.abspath(self.file_path):
+                # Изменения теперь в исходном файле: начинаем отслеживать заново
+                self.dirty.clear()
+                self.string_block.commit()
+                self._file_stat = self._stat_file()
+                if patches is None:
+                    self._apply_saved_state(state)
+                if isinstance(self.records, PagedRecordTable):
+                    self.records.commit()
             
             return {
                 "status": "success",
-                "message": f"Файл успешно сохранен: {new_file_path}"
+                "message": message
             }
         except Exception as e:
             return {
@@ -516,18 +1701,160 @@ class DBCDWrapper:
                 "message": str(e)
             }
     
-    def update_record(self, record_index, field_index, new_value):
-        if 0 <= record_index < len(self.records) and 0 <= field_index < len(self.records[0]):
-            self.records[record_index][field_index] = new_value
+    def _id_field(self):
+        """Номер поля-идентификатора записи"""
+        if self.header and 'id_index' in self.header:
+            return self.header['id_index']
+        return 0
+
+    def loaded_ids(self):
+        """ID загруженных записей: список ID секций или поле-идентификатор"""
+        if self.record_ids is not None:
+            if self.loaded_rows is not None:
+                return take_column(self.record_ids, self.loaded_rows)
+            return self.record_ids
+        field_idx = self._id_field()
+        if field_idx < self.records.field_count:
+            return self.records.column(field_idx)
+        return array('I')
+
+    def build_id_index(self):
+        """Строит индекс записей по ID вместе с таблицей копий"""
+        self.id_index = IdIndex(self.loaded_ids(), self.copy_table)
+        return self.id_index
+
+    def find_row(self, record_id):
+        """(номер загруженной записи, ID источника) для ID или None
+
+        Для записи из таблицы копий возвращается номер записи-источника и её ID.
+        """
+        if self.id_index is None:
+            self.build_id_index()
+        return self.id_index.resolve(record_id)
+
+    def get_record_by_id(self, record_id):
+        """Значения полей записи с данным ID списком или None, если такой записи нет
+
+        Копия записи собирается из записи-источника с подстановкой своего ID.
+        """
+        found = self.find_row(record_id)
+        if found is None:
+            return None
+        row, source_id = found
+        values = self.records[row].to_list()
+        field_idx = self._id_field()
+        if source_id is not None and self.record_ids is None and field_idx < len(values):
+            values[field_idx] = record_id
+        return values
+
+    def iter_records(self, batch_size=DEFAULT_CHUNK_ROWS, prefetch=1):
+        """Блоки записей (RecordTable) по batch_size записей по порядку, с учётом правок
+
+        Если файл ещё не прочитан, он открывается постранично (memory_budget=0), и в памяти
+        держатся только передаваемые блоки. prefetch следующих блоков декодируются в фоновом
+        потоке, пока вызывающий обрабатывает текущий (0 - без фонового потока).
+        """
+        if self.header is None:
+            if self.memory_budget is None:
+                self.memory_budget = 0
+            result = self.read_file()
+            if result['status'] != 'success':
+                raise ValueError(result['message'])
+        batches = (batch for start, batch in self.records.iter_chunks(batch_size))
+        return _prefetched(batches, prefetch) if prefetch > 0 else batches
+
+    def diff(self, other, chunk_size=None):
+        """Различия с другой версией той же таблицы (прочитанным DBCDWrapper) по ID записей
+
+        Возвращает генератор dbcd_diff.RowDiff: добавленные, удалённые и изменённые записи,
+        для изменённых - поля со старым и новым значением.
+        """
+        return iter_diff(self, other, chunk_size or DEFAULT_CHUNK_SIZE)
+
+    def query_rows(self, expression):
+        """Номера загруженных записей, удовлетворяющих фильтру"""
+        query = expression if isinstance(expression, Query) else Query(expression, self._id_field())
+        query.check_fields(self.records.field_count)
+        if isinstance(self.records, PagedRecordTable):
+            rows = []
+            for start, chunk in self.records.iter_chunks():
+                rows.extend(start + row for row in query.matching_rows(chunk.columns, len(chunk)))
+            return rows
+        return query.matching_rows(self.records.columns, len(self.records))
+
+    def query(self, expression):
+        """Возвращает записи, удовлетворяющие фильтру, например: field3 == 42 and id between 1 and 100
+
+        Если файл ещё не прочитан, фильтр применяется прямо при декодировании,
+        и неподходящие записи не собираются целиком.
+        """
+        if self.header is None:
+            result = self.read_file(where=expression)
+            if result['status'] != 'success':
+                raise QueryError(result['message'])
+            return self.records
+        return self.records.take(self.query_rows(expression))
+
+    def _set_value(self, record_index, field_index, value):
+        """Записывает значение поля или строки DBC (field_index None) без журнала"""
+        if field_index is None:
+            self.string_block[record_index] = value
             return True
-        return False
+        if not self.records.update_record(record_index, field_index, value):
+            return False
+        if field_index == self._id_field() and self.record_ids is None:
+            # Изменился ID записи - индекс перестроится при следующем поиске
+            self.id_index = None
+        self.dirty.add((record_index, field_index))
+        return True
+
+    def update_record(self, record_index, field_index, new_value):
+        if not (0 <= record_index < len(self.records) and 0 <= field_index < self.records.field_count):
+            return False
+        old_value = self.records.get(record_index, field_index)
+        if not self._set_value(record_index, field_index, new_value):
+            return False
+        if old_value != new_value:
+            self.journal.record(record_index, field_index, old_value, new_value)
+        return True
     
     def update_string(self, string_index, new_value):
         if self.file_type == '.dbc' and 0 <= string_index < len(self.string_block):
-            self.string_block[string_index] = new_value
+            old_value = self.string_block[string_index]
+            self._set_value(string_index, None, new_value)
+            if old_value != new_value:
+                self.journal.record(string_index, None, old_value, new_value)
             return True
         return False
 
+    def edit_group(self):
+        """Блок with, правки внутри которого отменяются одним действием"""
+        return self.journal.group()
+
+    def _apply_journal(self, changes, undo):
+        if changes is None:
+            return []
+        for record_index, field_index, old_value, new_value in changes:
+            self._set_value(record_index, field_index, old_value if undo else new_value)
+        return [(record_index, field_index) for record_index, field_index, old_value, new_value in changes]
+
+    def undo(self):
+        """Отменяет последнее действие; возвращает изменённые ячейки (запись, поле)
+
+        Для строк DBC поле - None. Отменённые значения снова попадают в изменения для сохранения.
+        """
+        return self._apply_journal(self.journal.undo(), undo=True)
+
+    def redo(self):
+        """Повторяет последнее отменённое действие; возвращает изменённые ячейки"""
+        return self._apply_journal(self.journal.redo(), undo=False)
+
+    def string_at(self, offset):
+        """Строка DBC, на которую ссылается значение поля, или None"""
+        if self.file_type != '.dbc' or not self.string_block.is_string_offset(offset):
+            return None
+        return self.string_block.at(offset)
+
     def read_db2_file(self):
         """Читает DB2 файл и возвращает его содержимое"""
         try:
@@ -538,13 +1865,19 @@ class DBCDWrapper:
                 # Читаем информацию о полях
                 self.field_info = self._read_field_info(f)
                 
-                # Если есть секции, переходим к началу записей
+                # Если есть секции, записи начинаются со смещения секции
+                data_offset = f.tell()
                 if self.header['section_header']:
-                    f.seek(self.header['section_header']['file_offset'])
+                    data_offset = self.header['section_header']['file_offset']
                 
                 # Читаем записи
-                self.records = self._read_records(f)
+                with self._map_file() as buf:
+                    self.records = self._read_records(buf, data_offset)
+                self.id_index = None
                 
+                self._file_stat = self._stat_file()
+                self.dirty.clear()
+                self.journal.clear()
                 return {
                     'status': 'success',
                     'type': 'DB2',
@@ -562,5 +1895,5 @@ class DBCDWrapper:
                 'file': self.file_path,
                 'header': None,
                 'records': [],
-                'string_block': []
+                'string_block': StringTable()
             } 
\ No newline at end of file
@@ -1,17 +1,362 @@
 import sys
+import os
+import logging
+import multiprocessing
 sys.set_int_max_str_digits(100000)  # Увеличиваем лимит до 100000 цифр
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QPushButton, QFileDialog, QLabel, QTextEdit, QTableWidget,
                              QTableWidgetItem, QHeaderView, QHBoxLayout, QMessageBox,
-                             QSpinBox, QLineEdit, QSplitter, QTabWidget, QProgressDialog)
-from PySide6.QtCore import Qt, QTimer
-from dbcd_wrapper import DBCDWrapper
+                             QSpinBox, QLineEdit, QSplitter, QTabWidget, QProgressDialog,
+                             QTableView)
+from PySide6.QtCore import Qt, QTimer, QAbstractTableModel, QModelIndex, Signal, QThread
+from PySide6.QtGui import QKeySequence, QShortcut
+from dbcd_wrapper import DBCDWrapper, LoadCancelled
+from dbcd_cache import ParseCache
+from dbcd_search import SearchIndex
+from dbcd_query import QueryError, looks_like_query
+from dbcd_diff import ADDED, REMOVED, MODIFIED, iter_batches
+
+log = logging.getLogger('dbcd')
+
+
+def format_value(value):
+    """Форматирует значение ячейки: большие числа показываются в шестнадцатеричном виде"""
+    if isinstance(value, int) and (value > 1000000000 or value < -1000000000):
+        return f"0x{value:X}"
+    return str(value)
+
+
+def parse_value(text):
+    """Разбирает введённое значение (десятичное или шестнадцатеричное с префиксом 0x)
+
+    Значения полей-массивов вводятся в скобках через запятую: (1, 2, 3)
+    """
+    text = text.strip()
+    if text.startswith("(") and text.endswith(")"):
+        return tuple(parse_value(part) for part in text[1:-1].split(",") if part.strip())
+    if text.startswith("0x"):
+        return int(text[2:], 16)
+    return int(text)
+
+
+class RecordTableModel(QAbstractTableModel):
+    """Модель записей: значения форматируются только для видимых ячеек"""
+
+    record_changed = Signal(int, int, str)
+    edit_rejected = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.dbcd = None
+        self.records = None
+        # Индексы записей, прошедших фильтр (None - показываются все записи)
+        self.row_filter = None
+
+    def set_records(self, dbcd, records):
+        self.beginResetModel()
+        self.dbcd = dbcd
+        self.records = records
+        self.row_filter = None
+        self.endResetModel()
+
+    def set_row_filter(self, rows):
+        self.beginResetModel()
+        self.row_filter = rows
+        self.endResetModel()
+
+    def refresh(self):
+        """Перерисовывает значения после изменения записей в обход модели (отмена, повтор)"""
+        if self.rowCount() and self.columnCount():
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1))
+
+    def record_index(self, row):
+        """Переводит номер строки представления в индекс записи таблицы"""
+        return self.row_filter[row] if self.row_filter is not None else row
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.records is None:
+            return 0
+        return len(self.row_filter) if self.row_filter is not None else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.records is None:
+            return 0
+        return self.records.field_count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            # Для DBC значение поля может быть смещением строки в строковом блоке
+            if self.dbcd is None:
+                return None
+            value = self.records.get(self.record_index(index.row()), index.column())
+            return self.dbcd.string_at(value) if value else None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        try:
+            return format_value(self.records.get(self.record_index(index.row()), index.column()))
+        except Exception as e:
+            log.debug("Ошибка при получении значения [%d, %d]: %s", index.row(), index.column(), e)
+            return "ERROR"
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole or self.dbcd is None:
+            return False
+        row = self.record_index(index.row())
+        col = index.column()
+        try:
+            new_value = parse_value(str(value))
+        except ValueError:
+            self.edit_rejected.emit("Введите корректное число (десятичное или шестнадцатеричное с префиксом 0x)")
+            return False
+        if not self.dbcd.update_record(row, col, new_value):
+            self.edit_rejected.emit("Неверный индекс записи или поля")
+            return False
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
+        self.record_changed.emit(row, col, str(value))
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return f"Поле {section}"
+        return str(self.record_index(section) + 1)
+
+
+class StringTableModel(QAbstractTableModel):
+    """Модель строкового блока DBC: строки декодируются только для видимых ячеек"""
+
+    string_changed = Signal(int, str)
+    edit_rejected = Signal(str)
+
+    HEADERS = ["Индекс", "Смещение", "Строка"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.dbcd = None
+        self.strings = None
+
+    def set_strings(self, dbcd, strings):
+        self.beginResetModel()
+        self.dbcd = dbcd
+        self.strings = strings
+        self.endResetModel()
+
+    def refresh(self):
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, 2), self.index(self.rowCount() - 1, 2))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.strings is None:
+            return 0
+        return len(self.strings)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        row = index.row()
+        if index.column() == 0:
+            return str(row)
+        if index.column() == 1:
+            return str(self.strings.offset_of(row))
+        return self.strings[row]
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole or index.column() != 2 or self.dbcd is None:
+            return False
+        row = index.row()
+        if not self.dbcd.update_string(row, str(value)):
+            self.edit_rejected.emit("Неверный индекс строки")
+            return False
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole])
+        self.string_changed.emit(row, str(value))
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == 2:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+
+class DiffTableModel(QAbstractTableModel):
+    """Различия открытого файла с другой версией таблицы; строки добавляются порциями"""
+
+    HEADERS = ["Изменение", "ID", "Запись (открытый файл)", "Запись (другой файл)", "Поля"]
+    KIND_NAMES = {ADDED: "добавлена", REMOVED: "удалена", MODIFIED: "изменена"}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.diffs = []
+
+    def clear(self):
+        self.beginResetModel()
+        self.diffs = []
+        self.endResetModel()
+
+    def append(self, diffs):
+        if not diffs:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.diffs), len(self.diffs) + len(diffs) - 1)
+        self.diffs.extend(diffs)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.diffs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        diff = self.diffs[index.row()]
+        column = index.column()
+        if column == 0:
+            return self.KIND_NAMES[diff.kind]
+        if column == 1:
+            return str(diff.record_id)
+        if column in (2, 3):
+            row = diff.old_row if column == 2 else diff.new_row
+            return str(row + 1) if row is not None else ""
+        if not diff.changes:
+            return ""
+        return "; ".join(f"поле {field_idx}: {format_value(old)} -> {format_value(new)}"
+                         for field_idx, old, new in diff.changes)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+
+class DiffLoader(QThread):
+    """Читает другую версию таблицы и сравнивает её с открытым файлом в фоновом потоке"""
+
+    batch = Signal(object)
+    finished_diff = Signal(object)
+
+    def __init__(self, dbcd, other, parent=None):
+        super().__init__(parent)
+        self.dbcd = dbcd
+        self.other = other
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+        self.other.cancel()
+
+    def run(self):
+        result = self.other.read_file()
+        if result['status'] != 'success':
+            self.finished_diff.emit(result)
+            return
+        counts = {ADDED: 0, REMOVED: 0, MODIFIED: 0}
+        try:
+            for batch in iter_batches(self.dbcd.diff(self.other)):
+                if self._cancel_requested:
+                    self.finished_diff.emit({"status": "cancelled", "message": "Сравнение отменено"})
+                    return
+                for diff in batch:
+                    counts[diff.kind] += 1
+                self.batch.emit(batch)
+        except ValueError as e:
+            self.finished_diff.emit({"status": "error", "message": str(e)})
+            return
+        self.finished_diff.emit({"status": "success", "file": self.other.file_path, "counts": counts})
+
+
+class FileLoader(QThread):
+    """Читает файл в фоновом потоке и сообщает о ходе загрузки"""
+
+    progress = Signal(str, int, int)
+    loaded = Signal(object, object, object)
+
+    def __init__(self, dbcd, parent=None):
+        super().__init__(parent)
+        self.dbcd = dbcd
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+        self.dbcd.cancel()
+
+    def report_index(self, phase, done, total):
+        # Файл уже прочитан и запрос отмены в обёртке сброшен: индекс проверяет свой
+        if self._cancel_requested:
+            raise LoadCancelled("Загрузка файла отменена")
+        self.progress.emit(phase, done, total)
+
+    def run(self):
+        result = self.dbcd.read_file(progress=self.progress.emit)
+        search_index = None
+        if result['status'] == 'success':
+            # Индекс поиска строится здесь же, чтобы не задерживать интерфейс
+            try:
+                with self.dbcd.stats.phase('index') as phase:
+                    search_index = SearchIndex(result['records']).build(progress=self.report_index)
+                    phase.rows = len(result['records'])
+            except LoadCancelled as e:
+                result = {"status": "cancelled", "message": str(e)}
+                search_index = None
+        self.loaded.emit(self.dbcd, result, search_index)
+
 
 class DBCDViewer(QMainWindow):
+    # Доли шкалы прогресса (в процентах) для этапов загрузки
+    LOAD_PHASES = {
+        'header': (0, 5),
+        'field_info': (5, 10),
+        'pallet': (10, 15),
+        'common': (15, 20),
+        'records': (20, 90),
+        'index': (90, 100),
+    }
+    LOAD_PHASE_NAMES = {
+        'header': "заголовок",
+        'field_info': "информация о полях",
+        'pallet': "данные палитры",
+        'common': "общие данные",
+        'records': "записи",
+        'strings': "строковый блок",
+        'sections': "данные секций",
+        'index': "индекс поиска",
+        'id_index': "индекс ID",
+        'save': "сохранение",
+    }
+    # Файлы больше этого размера открываются постранично: записи декодируются блоками
+    # по мере прокрутки, в памяти держится не больше PAGE_BUDGET декодированных данных
+    PAGED_FILE_SIZE = 512 * 1024 * 1024
+    PAGE_BUDGET = 256 * 1024 * 1024
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("DBCD Viewer Задрот_софт_ЭДИЩЕН")
         self.setGeometry(100, 100, 1200, 800)
+        # Кеш декодированных записей: повторное открытие файла не декодирует его заново.
+        # DBCD_CACHE=0 отключает кеш
+        self.parse_cache = ParseCache() if os.environ.get('DBCD_CACHE', '1') != '0' else None
         
         # Создаем центральный виджет и layout
         central_widget = QWidget()
@@ -36,13 +381,48 @@ class DBCDViewer(QMainWindow):
         self.save_as_button.setEnabled(False)
         button_layout.addWidget(self.save_as_button)
 
+        self.undo_button = QPushButton("Отменить")
+        self.undo_button.clicked.connect(self.undo_edit)
+        self.undo_button.setEnabled(False)
+        button_layout.addWidget(self.undo_button)
+
+        self.redo_button = QPushButton("Повторить")
+        self.redo_button.clicked.connect(self.redo_edit)
+        self.redo_button.setEnabled(False)
+        button_layout.addWidget(self.redo_button)
+
+        # Поле ввода в фокусе обрабатывает эти сочетания само
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo_edit)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.redo_edit)
+
+        self.compare_button = QPushButton("Сравнить с...")
+        self.compare_button.clicked.connect(self.compare_file)
+        self.compare_button.setEnabled(False)
+        button_layout.addWidget(self.compare_button)
+
         # Добавляем поле поиска
         self.search_layout = QHBoxLayout()
         self.search_label = QLabel("Поиск:")
         self.search_input = QLineEdit()
-        self.search_input.textChanged.connect(self.search_records)
+        self.search_input.setPlaceholderText("Текст или фильтр, например: field3 == 42 and id between 1000 and 2000")
+        # Поиск запускается после паузы в наборе, а не на каждое нажатие клавиши
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.search_records)
+        self.search_input.textChanged.connect(self.search_timer.start)
         self.search_layout.addWidget(self.search_label)
         self.search_layout.addWidget(self.search_input)
+
+        # Переход к записи по ID через индекс ID
+        self.id_input = QLineEdit()
+        self.id_input.setPlaceholderText("ID записи")
+        self.id_input.setMaximumWidth(150)
+        self.id_input.returnPressed.connect(self.go_to_id)
+        self.go_to_id_button = QPushButton("Перейти к ID")
+        self.go_to_id_button.clicked.connect(self.go_to_id)
+        self.search_layout.addWidget(self.id_input)
+        self.search_layout.addWidget(self.go_to_id_button)
         
         layout.addLayout(button_layout)
         layout.addLayout(self.search_layout)
@@ -67,6 +447,14 @@ class DBCDViewer(QMainWindow):
         self.header_table.setHorizontalHeaderLabels(["Параметр", "Значение"])
         self.header_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         file_info_layout.addWidget(self.header_table)
+
+        # Таблица замеров по этапам чтения и сохранения
+        self.stats_table = QTableWidget()
+        self.stats_table.setColumnCount(5)
+        self.stats_table.setHorizontalHeaderLabels(["Этап", "Время (мс)", "Байт", "Записей", "Пик памяти (МБ)"])
+        self.stats_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.stats_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        file_info_layout.addWidget(self.stats_table)
         
         self.tab_widget.addTab(file_info_widget, "Информация о файле")
         
@@ -75,10 +463,14 @@ class DBCDViewer(QMainWindow):
         records_layout = QVBoxLayout(records_widget)
         
         # Добавляем таблицу для отображения записей
-        self.records_table = QTableWidget()
-        self.records_table.setColumnCount(0)
-        self.records_table.setRowCount(0)
-        self.records_table.itemChanged.connect(self.on_record_changed)
+        self.records_model = RecordTableModel(self)
+        self.records_model.record_changed.connect(self.on_record_changed)
+        self.records_model.edit_rejected.connect(self.on_record_rejected)
+        self.records_table = QTableView()
+        self.records_table.setModel(self.records_model)
+        # Фиксированная высота строк: представлению не нужно измерять каждую строку
+        self.records_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.records_table.verticalHeader().setDefaultSectionSize(22)
         records_layout.addWidget(self.records_table)
         
         self.tab_widget.addTab(records_widget, "Записи")
@@ -87,14 +479,33 @@ class DBCDViewer(QMainWindow):
         strings_widget = QWidget()
         strings_layout = QVBoxLayout(strings_widget)
         
-        self.strings_table = QTableWidget()
-        self.strings_table.setColumnCount(2)
-        self.strings_table.setHorizontalHeaderLabels(["Индекс", "Строка"])
-        self.strings_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        self.strings_table.itemChanged.connect(self.on_string_changed)
+        self.strings_model = StringTableModel(self)
+        self.strings_model.string_changed.connect(self.on_string_changed)
+        self.strings_model.edit_rejected.connect(self.on_string_rejected)
+        self.strings_table = QTableView()
+        self.strings_table.setModel(self.strings_model)
+        self.strings_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.strings_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.strings_table.verticalHeader().setDefaultSectionSize(22)
         strings_layout.addWidget(self.strings_table)
         
         self.tab_widget.addTab(strings_widget, "Строки")
+
+        # Вкладка сравнения с другой версией таблицы
+        diff_widget = QWidget()
+        diff_layout = QVBoxLayout(diff_widget)
+        self.diff_label = QLabel("Сравнение не выполнялось")
+        diff_layout.addWidget(self.diff_label)
+        self.diff_model = DiffTableModel(self)
+        self.diff_table = QTableView()
+        self.diff_table.setModel(self.diff_model)
+        self.diff_table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
+        self.diff_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.diff_table.verticalHeader().setDefaultSectionSize(22)
+        self.diff_table.doubleClicked.connect(self.on_diff_activated)
+        diff_layout.addWidget(self.diff_table)
+
+        self.tab_widget.addTab(diff_widget, "Сравнение")
         
         splitter.addWidget(self.tab_widget)
         
@@ -108,12 +519,12 @@ class DBCDViewer(QMainWindow):
         
         self.dbcd = None
         self.current_file = None
-        self.original_records = None
+        self.search_index = None
+        self.loader = None
+        self.progress = None
+        self.diff_loader = None
 
     def open_file(self):
-        # Сбрасываем интерфейс перед загрузкой нового файла
-        self.reset_interface()
-        
         file_name, _ = QFileDialog.getOpenFileName(
             self,
             "Выберите файл",
@@ -123,58 +534,129 @@ class DBCDViewer(QMainWindow):
         
         if file_name:
             try:
-                # Создаем и показываем прогресс-диалог
-                progress = QProgressDialog("Загрузка файла...", None, 0, 0, self)
-                progress.setWindowModality(Qt.WindowModal)
-                progress.setWindowTitle("Пожалуйста, подождите")
-                progress.setCancelButton(None)  # Убираем кнопку отмены
-                progress.setMinimumDuration(0)  # Показывать сразу
-                progress.show()
-                
-                # Обновляем интерфейс
-                QApplication.processEvents()
-                
-                self.dbcd = DBCDWrapper(file_name)
-                result = self.dbcd.read_file()
-                
-                # Закрываем прогресс-диалог
-                progress.close()
-                
-                if result['status'] == 'success':
-                    self.current_file = file_name
-                    self.save_button.setEnabled(True)
-                    self.save_as_button.setEnabled(True)
-                    
-                    # Сохраняем оригинальные записи для поиска
-                    self.original_records = result['records'].copy()
-                    
-                    # Обновляем информацию о типе файла
-                    self.file_type_label.setText(f"Тип файла: {result['type']}")
-                    
-                    # Обновляем таблицу заголовка
-                    self.update_header_table(result['header'])
-                    
-                    # Обновляем таблицу записей
-                    self.update_records_table(result['records'])
-                    
-                    # Обновляем таблицу строк для DBC
-                    if result['type'] == 'DBC' and result['string_block']:
-                        self.update_strings_table(result['string_block'])
-                        self.tab_widget.setTabEnabled(2, True)  # Включаем вкладку строк
-                    else:
-                        self.tab_widget.setTabEnabled(2, False)  # Отключаем вкладку строк
-                    
-                    # Обновляем текстовое поле
-                    self.text_area.setText(f"Статус: {result['status']}\nСообщение: {result['message']}\nФайл: {result['file']}")
-                
+                dbcd = DBCDWrapper(file_name, cache=self.parse_cache, memory_budget=self.memory_budget(file_name))
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка при загрузке файла: {str(e)}")
-                self.reset_interface()
+                return
+
+            # Прогресс-диалог не блокирует окно: пока файл грузится, можно работать с текущим
+            self.progress = QProgressDialog("Загрузка файла...", "Отмена", 0, 100, self)
+            self.progress.setWindowModality(Qt.WindowModality.NonModal)
+            self.progress.setWindowTitle("Пожалуйста, подождите")
+            self.progress.setMinimumDuration(0)  # Показывать сразу
+            self.progress.setAutoClose(False)
+            self.progress.setAutoReset(False)
+            self.progress.canceled.connect(self.cancel_loading)
+            self.progress.show()
+
+            self.open_button.setEnabled(False)
+            self.loader = FileLoader(dbcd, self)
+            self.loader.progress.connect(self.on_load_progress)
+            self.loader.loaded.connect(self.on_file_loaded)
+            self.loader.start()
+
+    def memory_budget(self, file_name):
+        """Бюджет памяти постраничного режима (байт) или None; DBCD_PAGE_BUDGET_MB задаёт его явно"""
+        budget = os.environ.get('DBCD_PAGE_BUDGET_MB')
+        if budget:
+            return int(budget) * 1024 * 1024
+        if os.path.getsize(file_name) > self.PAGED_FILE_SIZE:
+            return self.PAGE_BUDGET
+        return None
+
+    def cancel_loading(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.progress.setLabelText("Отмена загрузки...")
+
+    def on_load_progress(self, phase, done, total):
+        start, end = self.LOAD_PHASES.get(phase, (0, 100))
+        value = start + (end - start) * done // max(total, 1)
+        self.progress.setLabelText(f"Загрузка файла: {self.LOAD_PHASE_NAMES.get(phase, phase)}...")
+        self.progress.setValue(value)
+
+    def on_file_loaded(self, dbcd, result, search_index):
+        self.loader.wait()
+        self.loader = None
+        self.progress.close()
+        self.open_button.setEnabled(True)
+
+        if result['status'] == 'cancelled':
+            self.text_area.setText(f"Статус: {result['status']}\nСообщение: {result['message']}")
+            return
+        if result['status'] != 'success':
+            QMessageBox.critical(self, "Ошибка", f"Ошибка при загрузке файла: {result['message']}")
+            return
+
+        try:
+            # Сбрасываем интерфейс перед показом нового файла
+            self.reset_interface()
+            if self.dbcd is not None and self.dbcd is not dbcd:
+                # Освобождаем отображение файла постраничной таблицы прежнего файла
+                self.dbcd.close()
+            self.dbcd = dbcd
+            self.current_file = result['file']
+            self.save_button.setEnabled(True)
+            self.save_as_button.setEnabled(True)
+            self.compare_button.setEnabled(True)
+            self.search_index = search_index
+            self.update_undo_buttons()
+            
+            # Обновляем информацию о типе файла
+            self.file_type_label.setText(f"Тип файла: {result['type']}")
+            
+            # Обновляем таблицу заголовка
+            self.update_header_table(result['header'])
+            self.update_stats_table()
+            
+            # Обновляем таблицу записей
+            self.update_records_table(result['records'])
+            
+            # Обновляем таблицу строк для DBC
+            if result['type'] == 'DBC' and result['string_block']:
+                self.update_strings_table(result['string_block'])
+                self.tab_widget.setTabEnabled(2, True)  # Включаем вкладку строк
+            else:
+                self.tab_widget.setTabEnabled(2, False)  # Отключаем вкладку строк
+            
+            # Обновляем текстовое поле
+            memory = result['records'].memory_usage()['total'] / (1024 * 1024)
+            self.text_area.setText(f"Статус: {result['status']}\nСообщение: {result['message']}\nФайл: {result['file']}\n"
+                                   f"Память записей: {memory:.1f} МБ"
+                                   + ("\nЗаписи загружены из кеша" if dbcd.from_cache else "")
+                                   + (f"\nПостраничный режим: не больше {dbcd.memory_budget // (1024 * 1024)} МБ записей"
+                                      if dbcd.memory_budget is not None else ""))
+            
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка при загрузке файла: {str(e)}")
+            self.reset_interface()
+
+    def closeEvent(self, event):
+        # Прерываем незавершённую загрузку, чтобы поток не пережил окно
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader.wait()
+        if self.diff_loader is not None:
+            self.diff_loader.cancel()
+            self.diff_loader.wait()
+        super().closeEvent(event)
 
     def update_header_table(self, header):
         self.header_table.setRowCount(len(header))
         for i, (key, value) in enumerate(header.items()):
-            if isinstance(value, dict):
+            if key == 'sections' and len(value) > 1:
+                # Первая секция уже показана как section_header, остальные - с номером
+                for number, section in enumerate(value[1:], 1):
+                    for sub_key, sub_value in section.items():
+                        self.header_table.insertRow(self.header_table.rowCount())
+                        self.header_table.setItem(self.header_table.rowCount()-1, 0,
+                                                QTableWidgetItem(f"section {number} - {sub_key}"))
+                        self.header_table.setItem(self.header_table.rowCount()-1, 1,
+                                                QTableWidgetItem(str(sub_value)))
+            elif key == 'sections':
+                self.header_table.setItem(i, 0, QTableWidgetItem(key))
+                self.header_table.setItem(i, 1, QTableWidgetItem(str(len(value))))
+            elif isinstance(value, dict):
                 # Для вложенных словарей создаем отдельные строки
                 for sub_key, sub_value in value.items():
                     self.header_table.insertRow(self.header_table.rowCount())
@@ -186,60 +668,44 @@ class DBCDViewer(QMainWindow):
                 self.header_table.setItem(i, 0, QTableWidgetItem(key))
                 self.header_table.setItem(i, 1, QTableWidgetItem(str(value)))
 
-    def update_records_table(self, records):
-        if not records:
-            self.records_table.setRowCount(0)
-            self.records_table.setColumnCount(0)
-            return
+    def update_stats_table(self):
+        phases = list(self.dbcd.stats) if self.dbcd else []
+        self.stats_table.setRowCount(len(phases))
+        for i, stats in enumerate(phases):
+            values = [self.LOAD_PHASE_NAMES.get(stats.name, stats.name), f"{stats.seconds * 1000:.1f}",
+                      str(stats.bytes), str(stats.rows), f"{stats.peak_memory / (1024 * 1024):.1f}"]
+            for col, value in enumerate(values):
+                self.stats_table.setItem(i, col, QTableWidgetItem(value))
 
-        self.records_table.setRowCount(len(records))
-        self.records_table.setColumnCount(len(records[0]))
-        
-        # Устанавливаем заголовки столбцов
-        headers = [f"Поле {i}" for i in range(len(records[0]))]
-        self.records_table.setHorizontalHeaderLabels(headers)
-        
-        # Заполняем таблицу данными
-        for i, record in enumerate(records):
-            for j, value in enumerate(record):
-                try:
-                    # Для больших чисел используем шестнадцатеричный формат
-                    if isinstance(value, int) and (value > 1000000000 or value < -1000000000):
-                        display_value = f"0x{value:X}"
-                    else:
-                        display_value = str(value)
-                    
-                    item = QTableWidgetItem(display_value)
-                    item.setFlags(item.flags() | Qt.ItemFlag.ItemIsEditable)
-                    self.records_table.setItem(i, j, item)
-                except Exception as e:
-                    print(f"Ошибка при установке значения [{i}, {j}]: {str(e)}")
-                    item = QTableWidgetItem("ERROR")
-                    self.records_table.setItem(i, j, item)
+    def update_records_table(self, records):
+        self.records_model.set_records(self.dbcd, records)
 
     def update_strings_table(self, strings):
-        self.strings_table.setRowCount(len(strings))
-        for i, string in enumerate(strings):
-            self.strings_table.setItem(i, 0, QTableWidgetItem(str(i)))
-            item = QTableWidgetItem(string)
-            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsEditable)
-            self.strings_table.setItem(i, 1, item)
+        self.strings_model.set_strings(self.dbcd, strings)
 
     def reset_interface(self):
         self.header_table.setRowCount(0)
-        self.records_table.setRowCount(0)
-        self.strings_table.setRowCount(0)
+        self.stats_table.setRowCount(0)
+        self.records_model.set_records(None, None)
+        self.strings_model.set_strings(None, None)
         self.file_type_label.setText("Тип файла: Не выбран")
         self.save_button.setEnabled(False)
         self.save_as_button.setEnabled(False)
+        self.compare_button.setEnabled(False)
+        self.diff_model.clear()
+        self.diff_label.setText("Сравнение не выполнялось")
         self.text_area.clear()
         self.search_input.clear()  # Очищаем поле поиска
+        self.id_input.clear()
         self.current_file = None
-        self.original_records = None
+        self.search_index = None
+        self.undo_button.setEnabled(False)
+        self.redo_button.setEnabled(False)
 
     def save_file(self):
         if self.current_file and self.dbcd:
             result = self.dbcd.save_file()
+            self.update_stats_table()
             if result['status'] == 'success':
                 QMessageBox.information(self, "Успех", result['message'])
             else:
@@ -255,68 +721,173 @@ class DBCDViewer(QMainWindow):
             )
             if file_name:
                 result = self.dbcd.save_file(file_name)
+                self.update_stats_table()
                 if result['status'] == 'success':
                     QMessageBox.information(self, "Успех", result['message'])
                 else:
                     QMessageBox.critical(self, "Ошибка", result['message'])
 
-    def on_record_changed(self, item):
-        if self.dbcd:
-            row = item.row()
-            col = item.column()
-            try:
-                text = item.text()
-                # Проверяем, является ли значение шестнадцатеричным
-                if text.startswith("0x"):
-                    new_value = int(text[2:], 16)
-                else:
-                    new_value = int(text)
-                    
-                if self.dbcd.update_record(row, col, new_value):
-                    self.text_area.setText(f"Запись [{row}, {col}] обновлена: {text}")
-                else:
-                    QMessageBox.warning(self, "Предупреждение", "Неверный индекс записи или поля")
-            except ValueError:
-                QMessageBox.warning(self, "Ошибка", "Введите корректное число (десятичное или шестнадцатеричное с префиксом 0x)")
-                # Восстанавливаем оригинальное значение
-                original_value = self.dbcd.records[row][col]
-                if isinstance(original_value, int) and (original_value > 1000000000 or original_value < -1000000000):
-                    display_value = f"0x{original_value:X}"
-                else:
-                    display_value = str(original_value)
-                item.setText(display_value)
-
-    def on_string_changed(self, item):
-        if self.dbcd and self.dbcd.file_type == '.dbc':
-            row = item.row()
-            new_value = item.text()
-            if self.dbcd.update_string(row, new_value):
-                self.text_area.setText(f"Строка [{row}] обновлена: {new_value}")
-            else:
-                QMessageBox.warning(self, "Предупреждение", "Неверный индекс строки")
+    def on_record_changed(self, row, col, text):
+        if self.search_index is not None:
+            self.search_index.invalidate(col)
+        self.text_area.setText(f"Запись [{row}, {col}] обновлена: {text}")
+        self.update_undo_buttons()
+
+    def on_record_rejected(self, message):
+        QMessageBox.warning(self, "Ошибка", message)
+
+    def on_string_changed(self, row, new_value):
+        self.text_area.setText(f"Строка [{row}] обновлена: {new_value}")
+        self.update_undo_buttons()
+
+    def update_undo_buttons(self):
+        journal = self.dbcd.journal if self.dbcd is not None else None
+        self.undo_button.setEnabled(journal is not None and journal.can_undo)
+        self.redo_button.setEnabled(journal is not None and journal.can_redo)
+
+    def undo_edit(self):
+        if self.dbcd is not None and self.dbcd.journal.can_undo:
+            self.on_journal_applied(self.dbcd.undo(), "Отменено")
+
+    def redo_edit(self):
+        if self.dbcd is not None and self.dbcd.journal.can_redo:
+            self.on_journal_applied(self.dbcd.redo(), "Повторено")
+
+    def on_journal_applied(self, cells, action):
+        fields = {field_idx for row, field_idx in cells if field_idx is not None}
+        if self.search_index is not None:
+            for field_idx in fields:
+                self.search_index.invalidate(field_idx)
+        if fields:
+            self.records_model.refresh()
+        if any(field_idx is None for row, field_idx in cells):
+            self.strings_model.refresh()
+        self.text_area.setText(f"{action} изменений: {len(cells)}")
+        self.update_undo_buttons()
+
+    def on_string_rejected(self, message):
+        QMessageBox.warning(self, "Предупреждение", message)
 
     def search_records(self):
-        if not self.original_records:
+        if self.dbcd is None or not self.dbcd.records or self.search_index is None:
             return
 
         search_text = self.search_input.text().lower()
         if not search_text:
-            self.update_records_table(self.original_records)
+            self.records_model.set_row_filter(None)
+            return
+
+        # Строка вида "field3 == 42 and id between 1 and 100" - фильтр по полям
+        if looks_like_query(search_text):
+            try:
+                rows = self.dbcd.query_rows(search_text)
+            except QueryError as e:
+                self.text_area.setText(f"Ошибка фильтра: {str(e)}")
+                return
+            self.text_area.setText(f"Фильтру соответствует записей: {len(rows)}")
+            self.records_model.set_row_filter(rows)
+            return
+
+        self.records_model.set_row_filter(self.search_index.search(search_text))
+
+    def go_to_id(self):
+        if self.dbcd is None or not self.id_input.text().strip():
+            return
+        try:
+            record_id = parse_value(self.id_input.text())
+        except ValueError:
+            self.text_area.setText("Введите ID числом (десятичным или шестнадцатеричным с префиксом 0x)")
+            return
+        found = self.dbcd.find_row(record_id) if isinstance(record_id, int) else None
+        if found is None:
+            self.text_area.setText(f"Запись с ID {record_id} не найдена")
             return
+        row, source_id = found
+        self.show_record(row)
+        if source_id is not None:
+            self.text_area.setText(f"ID {record_id} - копия записи с ID {source_id} (запись {row + 1})")
+        else:
+            self.text_area.setText(f"ID {record_id}: запись {row + 1}")
 
-        filtered_records = []
-        for record in self.original_records:
-            record_str = ' '.join(str(x) for x in record).lower()
-            if search_text in record_str:
-                filtered_records.append(record)
+    def show_record(self, row):
+        """Показывает запись на вкладке записей, сбрасывая поиск, если он её скрывает"""
+        view_row = row
+        if self.records_model.row_filter is not None:
+            rows = list(self.records_model.row_filter)
+            if row in rows:
+                view_row = rows.index(row)
+            else:
+                # Запись скрыта поиском - сбрасываем фильтр
+                self.search_input.clear()
+                self.search_timer.stop()
+                self.records_model.set_row_filter(None)
+
+        self.tab_widget.setCurrentIndex(1)
+        index = self.records_model.index(view_row, 0)
+        self.records_table.scrollTo(index, QTableView.ScrollHint.PositionAtCenter)
+        self.records_table.selectRow(view_row)
+
+    def compare_file(self):
+        if self.dbcd is None or self.diff_loader is not None:
+            return
+        file_name, _ = QFileDialog.getOpenFileName(
+            self,
+            "Выберите другую версию файла",
+            os.path.dirname(self.current_file or ""),
+            "DBC/DB2 Files (*.dbc *.db2);;All Files (*)"
+        )
+        if not file_name:
+            return
+        try:
+            other = DBCDWrapper(file_name, cache=self.parse_cache)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка при загрузке файла: {str(e)}")
+            return
+
+        self.diff_model.clear()
+        self.diff_label.setText(f"Сравнение с {file_name}...")
+        self.tab_widget.setCurrentIndex(3)
+        self.compare_button.setEnabled(False)
+        self.diff_loader = DiffLoader(self.dbcd, other, self)
+        self.diff_loader.batch.connect(self.on_diff_batch)
+        self.diff_loader.finished_diff.connect(self.on_diff_finished)
+        self.diff_loader.start()
+
+    def on_diff_batch(self, batch):
+        # Результаты сравнения с ранее открытым файлом не показываем
+        if self.diff_loader is not None and self.diff_loader.dbcd is self.dbcd:
+            self.diff_model.append(batch)
+
+    def on_diff_finished(self, result):
+        loader = self.diff_loader
+        loader.wait()
+        self.diff_loader = None
+        if loader.dbcd is not self.dbcd:
+            return
+        self.compare_button.setEnabled(True)
+        if result['status'] != 'success':
+            self.diff_label.setText(f"Сравнение не выполнено: {result['message']}")
+            return
+        counts = result['counts']
+        self.diff_label.setText(f"Сравнение с {result['file']}: добавлено {counts[ADDED]}, "
+                                f"удалено {counts[REMOVED]}, изменено {counts[MODIFIED]}")
 
-        self.update_records_table(filtered_records)
+    def on_diff_activated(self, index):
+        # Удалённые и изменённые записи есть в открытом файле - переходим к ним
+        diff = self.diff_model.diffs[index.row()]
+        if diff.old_row is not None and self.dbcd is not None:
+            self.show_record(diff.old_row)
 
 def main():
+    # Подробность журнала задаётся переменной окружения, например DBCD_LOG_LEVEL=DEBUG
+    logging.basicConfig(level=os.environ.get('DBCD_LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
     app = QApplication(sys.argv)
     window = DBCDViewer()
     window.show()
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    # Процессы пула декодирования (spawn) запускают этот же исполняемый файл сборки
+    # PyInstaller: freeze_support передаёт им управление до создания окна
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file